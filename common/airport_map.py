@@ -10,7 +10,9 @@ Created on 25 Jan 2022
 import math
 from enum import Enum
 
-from grid_search.cell_grid import Cell, CellGrid
+import numpy as np
+
+from grid_search.cell_grid import MOVE_DIRECTION_INDICES, Cell, CellGrid
 from grid_search.search_grid import SearchGridCell
 
 
@@ -68,12 +70,22 @@ class MapCell(Cell):
         MapCellType.ROBOT_START_LOCATION: True,
         MapCellType.ROBOT_END_STATION: True
     }
+    
+    # The factor the cost of moving into a cell is scaled by when the
+    # type-dependent traversability costs are used. Other types have a factor of 1
+    _traversability_multiplier = {
+        MapCellType.SECRET_DOOR: 5,
+        MapCellType.CUSTOMS_AREA: 100
+    }
 
-    def __init__(self, coords, map_cell_type = MapCellType.OPEN_SPACE, params = None):
+    def __init__(self, coords, map_cell_type = MapCellType.OPEN_SPACE, params = None, airport_map = None):
         
         Cell.__init__(self, coords)
 
-        # The map cell type
+        # The map cell type. If the cell belongs to a map, the type is also
+        # stored in the map's arrays, and the masks there are used to look up
+        # the properties of the type.
+        self._airport_map = airport_map
         self._cell_type = map_cell_type
         # Any parameters
         self._params = params
@@ -89,13 +101,19 @@ class MapCell(Cell):
     # Set the cell type        
     def set_cell_type(self, map_cell_type):
         self._cell_type = map_cell_type
+        if self._airport_map is not None:
+            self._airport_map._store_cell_type(self._coords[0], self._coords[1], map_cell_type)
 
     # Returns True if the cell type is one where the terminal action gets fired.    
     def is_terminal(self):
+        if self._airport_map is not None:
+            return bool(self._airport_map._terminal_mask[self._coords])
         return MapCell._is_terminal_state.get(self._cell_type)
     
     # Returns true if the robot cannot pass through this cell
     def is_obstruction(self):
+        if self._airport_map is not None:
+            return bool(self._airport_map._obstruction_mask[self._coords])
         return MapCell._is_obstruction.get(self._cell_type)
 
     # Other parameters
@@ -104,6 +122,17 @@ class MapCell(Cell):
     
     def set_params(self, params):
         self._params = params
+        if self._airport_map is not None:
+            self._airport_map._cell_modified(self._coords[0], self._coords[1])
+
+# Lookup tables from the cell type values stored in the map arrays to the
+# cell types and their properties. The values start at -1 (UNKNOWN), so the
+# tables are indexed by the value plus one.
+_cell_types_by_index = sorted(MapCellType, key=lambda cell_type: cell_type.value)
+_is_obstruction_by_index = np.array([MapCell._is_obstruction[cell_type] for cell_type in _cell_types_by_index])
+_is_terminal_by_index = np.array([MapCell._is_terminal_state[cell_type] for cell_type in _cell_types_by_index])
+_traversability_multiplier_by_index = np.array([MapCell._traversability_multiplier.get(cell_type, 1) \
+                                                for cell_type in _cell_types_by_index], dtype=float)
 
 # The airport map. This is an annotated grid which has extra
 # parameters depending upon the type.
@@ -116,9 +145,22 @@ class AirportMap(CellGrid):
     '''
 
     def __init__(self, name, width, height):
-        CellGrid.__init__(self, name, width, height)
+        CellGrid.__init__(self, name, width, height, (MapCellType.OPEN_SPACE.value, None))
 
-        self._map = [[MapCell((x, y)) for y in range(self._height)] \
+        # The cell types and the properties which depend on them are stored
+        # in arrays, which are kept up to date whenever a cell type is set.
+        # This means whole masks can be read at once. The cell objects write
+        # through to these, and also hold the parameters.
+        self._cell_types = np.full((self._width, self._height), MapCellType.OPEN_SPACE.value, dtype=np.int8)
+        self._obstruction_mask = np.zeros((self._width, self._height), dtype=bool)
+        self._terminal_mask = np.zeros((self._width, self._height), dtype=bool)
+        self._traversability_multipliers = np.ones((self._width, self._height))
+
+        # The cached move costs (see move_costs). These are built on demand and
+        # thrown away whenever the traversability multipliers change.
+        self._move_costs = None
+
+        self._map = [[MapCell((x, y), airport_map = self) for y in range(self._height)] \
                      for x in range(self._width)]
                 
         # set lists used to simplify stuff
@@ -134,12 +176,62 @@ class AirportMap(CellGrid):
     def resolution(self):
         return 1
 
+    # The traversability cost setting changes the cost of every cell, so it
+    # is part of the content hash
+    def _content_settings(self):
+        return self._use_cell_type_traversability_costs
+
+    # Called whenever the type or parameters of a cell are changed. The
+    # cell objects call this, so the version is updated however the cell is
+    # edited.
+    def _cell_modified(self, x, y):
+        self._record_cell_change(x, y, (int(self._cell_types[x, y]), self._map[x][y].params()))
+
+    # Store the type of a cell in the arrays and update the masks
+    def _store_cell_type(self, x, y, cell_type):
+        index = cell_type.value + 1
+        self._cell_types[x, y] = cell_type.value
+        self._obstruction_mask[x, y] = _is_obstruction_by_index[index]
+        self._terminal_mask[x, y] = _is_terminal_by_index[index]
+        if (self._use_cell_type_traversability_costs is True) and \
+            (self._traversability_multipliers[x, y] != _traversability_multiplier_by_index[index]):
+            self._traversability_multipliers[x, y] = _traversability_multiplier_by_index[index]
+            self._move_costs = None
+        self._cell_modified(x, y)
+
+    # Return a read only view of an array
+    def _read_only(self, array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+    # Return an array of size (width, height) with the value of the type of
+    # each cell (see MapCellType)
+    def cell_types(self):
+        return self._read_only(self._cell_types)
+
+    # Return a boolean array of size (width, height) which is True for cells
+    # the robot cannot pass through
+    def obstruction_mask(self):
+        return self._read_only(self._obstruction_mask)
+
+    # Return a boolean array of size (width, height) which is True for
+    # terminal cells
+    def terminal_mask(self):
+        return self._read_only(self._terminal_mask)
+
+    # Return an array of size (width, height) with the factor the cost of
+    # moving into each cell is scaled by. All the factors are one unless the
+    # type-dependent traversability costs are used.
+    def traversability_multipliers(self):
+        return self._read_only(self._traversability_multipliers)
+
     # Get the cell object stored at a particular set of coordinates
     def cell(self, x, y):
         return self._map[x][y]
     
     def is_obstruction(self, x, y):
-        return self._map[x][y].is_obstruction()
+        return bool(self._obstruction_mask[x, y])
     
     def set_wall(self, x, y):
         self._map[x][y].set_cell_type(MapCellType.WALL)
@@ -203,29 +295,84 @@ class AirportMap(CellGrid):
         
     def set_use_cell_type_traversability_costs(self, use_cell_type_traversability_costs):
         self._use_cell_type_traversability_costs = use_cell_type_traversability_costs
+        if use_cell_type_traversability_costs is True:
+            self._traversability_multipliers[:] = _traversability_multiplier_by_index[self._cell_types + 1]
+        else:
+            self._traversability_multipliers[:] = 1
+        self._move_costs = None
+        self._all_cells_modified()
     
+    # Return the costs of moving from each cell to each of its neighbours
+    # (see CellGrid.move_costs). If the type-dependent traversability costs
+    # are used, the cost is scaled by the factor for the type of cell moved into.
+    def move_costs(self):
+        if self._move_costs is None:
+            self._move_costs = self._move_cost_lattice(self._traversability_multipliers)
+        return self._move_costs
+
     def compute_transition_cost(self, last_coords, current_coords):
         # Compute the basic Euclidean cost
         dX = current_coords[0] - last_coords[0]
         dY = current_coords[1] - last_coords[1]
-        L = math.sqrt(dX * dX + dY * dY)
         
         # Q1f:
         # Modify the transition costs depending upon the
         # semantic label of the map cell
         
-        if self._use_cell_type_traversability_costs is True:        
+        # Moves to neighbouring cells are looked up from the move costs
+        direction = MOVE_DIRECTION_INDICES.get((dX, dY))
+        if direction is not None:
+            return float(self.move_costs()[direction, last_coords[0], last_coords[1]])
+        
+        L = math.sqrt(dX * dX + dY * dY)
+        
+        if self._use_cell_type_traversability_costs is True:
             # Apply a scale factor depending upon type
-            cell_type = self._map[current_coords[0]][current_coords[1]].cell_type()        
-            if cell_type == MapCellType.SECRET_DOOR:
-                L *= 5
-            elif cell_type == MapCellType.CUSTOMS_AREA:
-                L *= 100
+            L *= float(self._traversability_multipliers[current_coords[0], current_coords[1]])
             
         return L
         
+    # Return a coarser copy of the map, in which each cell covers a block of
+    # factor x factor cells of this map. If any cell in the block is terminal,
+    # the coarse cell is a copy of it, so no terminals are lost. Otherwise, if
+    # any cell in the block is an obstruction, the coarse cell is too. Otherwise
+    # it takes the type of the first cell which is not open space, so that the
+    # traversability costs are kept.
+    def coarsened(self, factor = 2):
+        coarse_map = AirportMap(self._name + ' (coarsened)', math.ceil(self._width / factor), \
+                                math.ceil(self._height / factor))
+        coarse_map.set_use_cell_type_traversability_costs(self._use_cell_type_traversability_costs)
+        
+        # Only the blocks which are not all open space need to be looked at
+        non_open_space = np.zeros((coarse_map.width() * factor, coarse_map.height() * factor), dtype=bool)
+        non_open_space[:self._width, :self._height] = self._cell_types != MapCellType.OPEN_SPACE.value
+        non_open_blocks = non_open_space.reshape(coarse_map.width(), factor, coarse_map.height(), factor).any(axis=(1, 3))
+        
+        for x, y in zip(*np.nonzero(non_open_blocks)):
+            block = [self._map[fine_x][fine_y] \
+                     for fine_x in range(x * factor, min((x + 1) * factor, self._width)) \
+                     for fine_y in range(y * factor, min((y + 1) * factor, self._height))]
+            
+            terminals = [cell for cell in block if cell.is_terminal()]
+            obstructions = [cell for cell in block if cell.is_obstruction()]
+            others = [cell for cell in block if cell.cell_type() is not MapCellType.OPEN_SPACE]
+            
+            if len(terminals) > 0:
+                chosen_cell = terminals[0]
+            elif len(obstructions) > 0:
+                chosen_cell = obstructions[0]
+            else:
+                chosen_cell = others[0]
+            
+            coarse_cell = coarse_map._map[x][y]
+            coarse_cell.set_cell_type(chosen_cell.cell_type())
+            coarse_cell.set_params(chosen_cell.params())
+        
+        return coarse_map
+        
     def populate_search_grid(self, search_grid):
-        grid = [[SearchGridCell((x, y), self._map[x][y].is_obstruction()) for y in range(self._height)] \
+        obstructions = self._obstruction_mask.tolist()
+        grid = [[SearchGridCell((x, y), obstructions[x][y]) for y in range(self._height)] \
                      for x in range(self._width)]
         
         search_grid._set_search_grid(grid)
@@ -0,0 +1,174 @@
+# This class solves the same map for several configurations of the nominal
+# direction probability p and the discount factor gamma at once. The
+# environment must provide a transition model for each value of p through
+# transition_models, which lets it avoid compiling each one separately.
+#
+# All the configurations share the same map, so their states are numbered in
+# the same way. The models are placed in one block diagonal matrix, and the
+# value functions of the K configurations are stacked into one
+# (K, number of states) array. Each sweep of value iteration is then a single sparse matrix-vector
+# product which advances all of the configurations together. A configuration
+# stops being updated once it has converged, so each one carries out the same
+# sweeps it would if it were solved on its own.
+#
+# solve_policy solves a batch of one: the environment as it is configured,
+# with the discount factor of the solver, starting from the current value
+# function.
+
+import numpy as np
+from scipy import sparse
+
+from .dynamic_programming_base import DynamicProgrammingBase
+from .solver_snapshot import SolverStep
+
+
+class BatchedValueIterator(DynamicProgrammingBase):
+
+    def __init__(self, environment):
+        DynamicProgrammingBase.__init__(self, environment)
+
+        # The maximum number of sweeps
+        self._max_optimal_value_function_iterations = 2000
+
+    # Method to change the maximum number of iterations
+    def set_max_optimal_value_function_iterations(self, max_optimal_value_function_iterations):
+        self._max_optimal_value_function_iterations = max_optimal_value_function_iterations
+
+    # A repair after map edits does at most as many sweeps as value iteration
+    def _max_number_of_repair_sweeps(self):
+        return self._max_optimal_value_function_iterations
+
+    def _solution_cache_settings(self):
+        settings = DynamicProgrammingBase._solution_cache_settings(self)
+        settings['max_optimal_value_function_iterations'] = self._max_optimal_value_function_iterations
+        return settings
+
+    # Solve for each configuration in the list, where each is a tuple
+    # (nominal direction probability, gamma). Returns the value functions
+    # stacked into an array of size (K, width, height) and a list which has,
+    # for each configuration, the value function, policy and number of sweeps.
+    def solve_policies(self, configurations):
+
+        number_of_configurations = len(configurations)
+        probabilities = [p for p, _ in configurations]
+        gammas = np.array([gamma for _, gamma in configurations], dtype=float)
+
+        configuration_models = self._environment.transition_models(probabilities)
+
+        model = configuration_models[0]
+        n = model.number_of_non_terminal_states()
+
+        # The initial values are the same for all of the configurations
+        initial_v = self._environment.initial_value_function()
+
+        # This runs to the end like solve_policy, so it prints the sweeps if
+        # the solver is verbose
+        self._print_sweeps = self._verbose
+        try:
+            v, iterations, _ = self._solve_batch(configuration_models, gammas, model.state_values(initial_v))
+        finally:
+            self._print_sweeps = False
+
+        # Extract the value functions and policies
+        results = []
+        stacked_v = np.zeros((number_of_configurations, initial_v.width(), initial_v.height()))
+
+        for k in range(number_of_configurations):
+            configuration_model = configuration_models[k]
+
+            value_function = self._environment.initial_value_function()
+            configuration_model.set_non_terminal_state_values(value_function, v[k, :n])
+
+            q = configuration_model.q_values(v[k], gammas[k])
+            policy = self._environment.initial_policy()
+            if n > 0:
+                configuration_model.set_policy_action_indices(policy, np.argmax(q, axis=0))
+
+            stacked_v[k] = value_function.values()
+            results.append((value_function, policy, int(iterations[k])))
+
+        return stacked_v, results
+
+    # Solve the environment as it is configured as a batch of one. There are
+    # no sweeps to yield from, so a single snapshot is yielded at the end,
+    # with the change in the last sweep. If it is below theta, solve_policy
+    # resumes the solve to let it return even if its deadline has passed.
+    def _solve_policy_steps(self):
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+
+        v, iterations, deltas = self._solve_batch([model], np.array([self._gamma], dtype=float), \
+                                          model.state_values(self._v))
+
+        model.set_non_terminal_state_values(self._v, v[0, :n])
+
+        best_actions, _ = self._greedy_actions_vectorized()
+        model.set_policy_action_indices(self._pi, best_actions)
+
+        self._record_solved_map_version()
+
+        if self._policy_drawer is not None:
+            self._policy_drawer.update()
+
+        if self._value_drawer is not None:
+            self._value_drawer.update()
+
+        yield self._snapshot(SolverStep.VALUE_ITERATION_SWEEP, int(iterations[0]), float(deltas[0]), None)
+
+        return self._v, self._pi, int(iterations[0])
+
+    # The only snapshot is yielded once the solve has finished, so the
+    # result is the complete solution
+    def _interrupted_solve_result(self, snapshot):
+        return self._v, self._pi, snapshot.iteration()
+
+    # Run value iteration on a batch of configurations, given their transition
+    # models, their discount factors and the vector of initial values of all
+    # the states. Returns the values as an array of size (K, number of
+    # states), the number of sweeps of each configuration and the change in
+    # its last sweep.
+    def _solve_batch(self, configuration_models, gammas, initial_values):
+
+        number_of_configurations = len(configuration_models)
+
+        model = configuration_models[0]
+        n = model.number_of_non_terminal_states()
+        number_of_actions = len(model.actions())
+        rows_per_configuration = number_of_actions * n
+
+        v = np.tile(initial_values, (number_of_configurations, 1))
+
+        transitions = [m.state_transitions(np.arange(n)) for m in configuration_models]
+        stacked_p = sparse.block_diag([p for p, _ in transitions], format='csr')
+        stacked_r = np.concatenate([r for _, r in transitions])
+        row_gammas = np.repeat(gammas, rows_per_configuration)
+
+        active = np.ones(number_of_configurations, dtype=bool)
+        iterations = np.zeros(number_of_configurations, dtype=int)
+        last_deltas = np.zeros(number_of_configurations)
+
+        iteration = 0
+
+        while (np.any(active)) and (iteration < self._max_optimal_value_function_iterations):
+
+            q = (stacked_r + row_gammas * (stacked_p @ v.reshape(-1))).reshape(number_of_configurations, \
+                                                                            number_of_actions, n)
+            new_v = np.max(q, axis=1) if n > 0 else np.zeros((number_of_configurations, 0))
+            deltas = np.max(np.abs(new_v - v[:, :n]), axis=1) if n > 0 else np.zeros(number_of_configurations)
+
+            # Only the configurations which have not converged are updated
+            v[active, :n] = new_v[active]
+            iterations[active] += 1
+            last_deltas[active] = deltas[active]
+
+            iteration += 1
+
+            self._print_sweep(f'Finished batched value iteration step {iteration}')
+
+            # Terminate a configuration if its change was very small
+            active &= deltas >= self._theta
+
+        if np.any(active):
+            print('Maximum number of iterations exceeded')
+
+        return v, iterations, last_deltas
@@ -0,0 +1,150 @@
+# This solves problems whose actions all have a single, certain outcome (for
+# the low level environment, a nominal direction probability of 1) exactly,
+# without iterating. Such a problem is a shortest path problem, so the values
+# are found by one reverse Dijkstra search from all the terminals at once:
+# when a cell's value is final, every cell which can move into it is offered
+# -cost + gamma * value. The policy is then greedy with respect to those
+# values, with ties broken in favour of the first action as in the other
+# solvers, so it is the same as the one they converge to.
+#
+# If gamma < 1, never reaching a terminal can be better than reaching one;
+# for example, bumping into a wall forever costs less than driving through
+# the customs area. The robot can do that by staying in the same cell or by
+# going back and forth between two cells, so the values of those cycles are
+# also starting points of the search. The search is label correcting, so a
+# cell whose value improves after it was popped is simply queued again.
+#
+# Longer cycles are not searched for, so the values are checked with a sweep
+# of value iteration, and swept again until nothing changes by more than
+# theta. Normally the first sweep changes nothing.
+#
+# Cells which cannot reach a terminal have a value of -inf if gamma = 1.
+
+import heapq
+
+import numpy as np
+
+
+# Solve the problem. next_x, next_y and rewards are the arrays of size
+# (number of actions, width, height) from deterministic_transitions,
+# terminal_values is a (width, height) array which has the values of the
+# terminals, and solved_mask picks out the cells which are solved for (those
+# which are neither obstructions nor terminals). Returns the (width, height)
+# arrays of the values and of the indices of the greedy actions, the number
+# of sweeps and the largest change in the last sweep.
+def solve_deterministic(next_x, next_y, rewards, terminal_values, terminal_mask, solved_mask, gamma, theta, \
+                        max_number_of_sweeps = 10000):
+
+    number_of_actions, width, height = rewards.shape
+
+    values = np.full((width, height), -np.inf)
+    values[terminal_mask] = terminal_values[terminal_mask]
+
+    if gamma < 1:
+        values[solved_mask] = _cycle_values(next_x, next_y, rewards, solved_mask, gamma)[solved_mask]
+
+    _search(next_x, next_y, rewards, values, terminal_mask, solved_mask, gamma)
+
+    # If gamma < 1, cells which cannot reach a terminal or a cycle still
+    # have a finite value. The sweeps start them from a lower bound, the
+    # value of getting the worst reward forever.
+    if gamma < 1:
+        unreached = solved_mask & np.isneginf(values)
+        values[unreached] = np.min(rewards) / (1 - gamma)
+
+    # Check the values, and sweep until they have converged
+    number_of_sweeps = 0
+    delta = np.inf
+
+    while (delta > theta) and (number_of_sweeps < max_number_of_sweeps):
+        q = rewards + gamma * values[next_x, next_y]
+        new_values = np.max(q, axis=0)
+
+        changed = solved_mask & (new_values != values)
+        delta = float(np.max(np.abs(new_values[changed] - values[changed]), initial = 0.0))
+        values[solved_mask] = new_values[solved_mask]
+
+        number_of_sweeps += 1
+
+    # Cells which can only reach cells with a value of -inf have no greedy
+    # action; they take the first one, as argmax does
+    action_indices = np.argmax(rewards + gamma * values[next_x, next_y], axis=0)
+
+    return values, action_indices, number_of_sweeps, delta
+
+
+# Return the best value of staying in each cell forever, or of going back and
+# forth between it and a neighbour forever. Cells which can do neither have
+# a value of -inf.
+def _cycle_values(next_x, next_y, rewards, solved_mask, gamma):
+
+    number_of_actions, width, height = rewards.shape
+
+    x, y = np.meshgrid(np.arange(width), np.arange(height), indexing='ij')
+
+    cycle_values = np.full((width, height), -np.inf)
+
+    for a in range(number_of_actions):
+        stays = (next_x[a] == x) & (next_y[a] == y)
+        cycle_values[stays] = np.maximum(cycle_values[stays], rewards[a][stays] / (1 - gamma))
+
+        # Go to a neighbour, which must also be solved for, and come back
+        neighbour_x = next_x[a]
+        neighbour_y = next_y[a]
+        leaves = ~stays & solved_mask[neighbour_x, neighbour_y]
+
+        for b in range(number_of_actions):
+            returns = leaves & (next_x[b][neighbour_x, neighbour_y] == x) & (next_y[b][neighbour_x, neighbour_y] == y)
+            round_trip = (rewards[a] + gamma * rewards[b][neighbour_x, neighbour_y]) / (1 - gamma * gamma)
+            cycle_values[returns] = np.maximum(cycle_values[returns], round_trip[returns])
+
+    return cycle_values
+
+
+# Run the reverse search from the cells which already have values, filling
+# in values in place
+def _search(next_x, next_y, rewards, values, terminal_mask, solved_mask, gamma):
+
+    number_of_actions, width, height = rewards.shape
+
+    # Build the list of moves into each cell, ignoring moves which stay in
+    # the same cell and moves out of cells which are not solved for
+    from_x, from_y = np.meshgrid(np.arange(width), np.arange(height), indexing='ij')
+    from_cells = np.broadcast_to(from_x * height + from_y, rewards.shape)
+    to_cells = next_x * height + next_y
+
+    moves = np.broadcast_to(solved_mask, rewards.shape) & (from_cells != to_cells)
+    move_from = from_cells[moves]
+    move_to = to_cells[moves]
+    move_rewards = rewards[moves]
+
+    order = np.argsort(move_to, kind='stable')
+    move_starts = np.concatenate(([0], np.cumsum(np.bincount(move_to, minlength=width * height))))
+
+    # Plain lists are much faster than arrays for single element access
+    move_starts = move_starts.tolist()
+    move_from = move_from[order].tolist()
+    move_rewards = move_rewards[order].tolist()
+    cell_values = values.reshape(-1).tolist()
+
+    queue = [(-cell_values[cell], cell) for cell in np.flatnonzero(np.isfinite(values).reshape(-1)).tolist()]
+    heapq.heapify(queue)
+
+    while len(queue) > 0:
+        negative_value, cell = heapq.heappop(queue)
+        value = -negative_value
+
+        # Skip entries which were superseded when the value was raised
+        if value < cell_values[cell]:
+            continue
+
+        discounted_value = gamma * value
+
+        for i in range(move_starts[cell], move_starts[cell + 1]):
+            from_cell = move_from[i]
+            from_value = move_rewards[i] + discounted_value
+            if from_value > cell_values[from_cell]:
+                cell_values[from_cell] = from_value
+                heapq.heappush(queue, (-from_value, from_cell))
+
+    values[:] = np.array(cell_values).reshape(width, height)
@@ -6,16 +6,35 @@ Created on 31 Jan 2022
 
 # This is the base class for policy and value iteration
 
-from typing import Optional
+import time
+from typing import TYPE_CHECKING, Optional
 
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import breadth_first_order
+
+from .deterministic_solver import solve_deterministic
 from .environment_base import EnvironmentBase
+from . import jit_sweeps
+from .jit_sweeps import NUMBA_AVAILABLE
+from .prioritized_sweep import bellman_errors, prioritized_sweep
+from .solver_snapshot import SolverSnapshot, SolverStep, run_to_completion
 from .tabular_policy import TabularPolicy
 from .tabular_value_function import TabularValueFunction
-from .value_function_drawer import ValueFunctionDrawer
+from .transition_model import TransitionModel
+
+# The drawer needs a display, so it is only imported for type checking. This
+# lets the solvers be used (and tested) without one.
+if TYPE_CHECKING:
+    from .value_function_drawer import ValueFunctionDrawer
 
 
 class DynamicProgrammingBase(object):
 
+    # Whether the solver finds the optimal policy, and so can hand problems
+    # with deterministic transitions to the shortest path solver
+    _supports_deterministic_solver = False
+
     def __init__(self, environment: EnvironmentBase):
 
         # The environment the system works with        
@@ -41,6 +60,47 @@ class DynamicProgrammingBase(object):
         self._policy_drawer = None
         self._value_drawer = None
         
+        # If set, the sweeps are computed with the compiled transition model
+        # of the environment as whole-array operations, rather than looping
+        # over the cells one at a time
+        self._use_vectorized_sweeps = False
+        
+        # If set, and Numba is installed, the cell-by-cell sweeps are carried
+        # out by the compiled kernels in jit_sweeps
+        self._use_jit_sweeps = False
+        
+        # The version of the map the current solution was computed for
+        self._solved_map_version = None
+        
+        # If set, solutions are looked up in and stored to this cache
+        self._solution_cache = None
+        
+        # If set, problems with deterministic transitions are solved exactly in
+        # one pass by the shortest path solver (see deterministic_solver)
+        # rather than by iterating
+        self._use_deterministic_solver = True
+        
+        # If set, the heuristic (see heuristics) which the value function is
+        # initialized from, rather than the default of the environment
+        self._initial_value_heuristic = None
+        
+        # When a solution is repaired after the map has been edited, states
+        # are backed up one at a time until the number of backups reaches
+        # this fraction of the number of states. After that, sweeping the
+        # whole map with whole-array operations is cheaper.
+        self._repair_backup_fraction = 1.0
+        
+        # Whether solve_policy prints the progress of every sweep. Nothing is
+        # printed per sweep when the solver is stepped through iter_solve,
+        # since its caller gets a snapshot of every sweep instead.
+        self._verbose = True
+        self._print_sweeps = False
+        
+        # Whether the last solve ran to the end, rather than being stopped by
+        # its deadline or cancelled, and the last residual (see last_residual)
+        self._converged = None
+        self._last_residual = None
+        
     # Set the drawer which will show the policy.
     # If set, this will update interactively.
     def set_policy_drawer(self, policy_drawer):
@@ -48,9 +108,61 @@ class DynamicProgrammingBase(object):
                           
     # Set the drawer which will show the value function.
     # If set, this will update interactively.                                    
-    def set_value_function_drawer(self, value_drawer: ValueFunctionDrawer):
+    def set_value_function_drawer(self, value_drawer: 'ValueFunctionDrawer'):
         self._value_drawer = value_drawer
 
+    # Choose between the cell-by-cell sweeps and the vectorized sweeps. The
+    # vectorized sweeps update all the states at once (a Jacobi rather than
+    # Gauss-Seidel update), so the intermediate value functions differ but
+    # both converge to the same value function to within theta.
+    def set_use_vectorized_sweeps(self, use_vectorized_sweeps):
+        self._use_vectorized_sweeps = use_vectorized_sweeps
+
+    # Return whether the vectorized sweeps are used
+    def use_vectorized_sweeps(self):
+        return self._use_vectorized_sweeps
+
+    # Choose whether the cell-by-cell sweeps use the compiled kernels. These
+    # give the same results as the loops over the cells. If Numba is not
+    # installed, the loops are used instead. The vectorized sweeps take
+    # precedence if they are also set.
+    def set_use_jit_sweeps(self, use_jit_sweeps):
+        self._use_jit_sweeps = use_jit_sweeps
+        if (use_jit_sweeps is True) and (NUMBA_AVAILABLE is False):
+            print('Numba is not installed; the sweeps will not be compiled')
+
+    # Return whether the compiled kernels are used for the cell-by-cell sweeps
+    def use_jit_sweeps(self):
+        return (self._use_jit_sweeps is True) and (NUMBA_AVAILABLE is True)
+
+    # Set the cache (see SolutionCache) used to store solutions and to look
+    # them up again. Set to None to stop using a cache.
+    def set_solution_cache(self, solution_cache):
+        self._solution_cache = solution_cache
+
+    # Set whether problems with deterministic transitions are solved by the
+    # shortest path solver. It is used by default.
+    def set_use_deterministic_solver(self, use_deterministic_solver):
+        self._use_deterministic_solver = use_deterministic_solver
+
+    # Return whether the shortest path solver is used
+    def use_deterministic_solver(self):
+        return self._use_deterministic_solver
+
+    # Set the heuristic (see heuristics) which initialize uses to warm start
+    # the value function. If None, the default of the environment is used.
+    def set_initial_value_heuristic(self, initial_value_heuristic):
+        self._initial_value_heuristic = initial_value_heuristic
+
+    # Set the fraction of the number of states which resolve_after_map_edits
+    # backs up one at a time before it sweeps the whole map instead
+    def set_repair_backup_fraction(self, repair_backup_fraction):
+        self._repair_backup_fraction = repair_backup_fraction
+
+    # Set whether solve_policy prints the progress of every sweep
+    def set_verbose(self, verbose):
+        self._verbose = verbose
+
     # Set the discount factor        
     def set_gamma(self, gamma):
         self._gamma = gamma
@@ -83,13 +195,37 @@ class DynamicProgrammingBase(object):
         else:
             self._pi = initial_pi
             
+        if (initial_v is None) and (self._initial_value_heuristic is not None):
+            self._warm_start(initial_pi is None)
+            
+        self._solved_map_version = None
+            
         self._initialized = True
             
+    # Set the values of the non-terminal states from the initial value
+    # heuristic, using the current discount factor. Cells where the heuristic
+    # is not finite keep their default values. If set_policy is True, the
+    # policy is also made greedy with respect to the new values, which gives
+    # policy iteration a good first policy to evaluate.
+    def _warm_start(self, set_policy):
+        environment_map = self._environment.map()
+        
+        heuristic_values = self._initial_value_heuristic(self._environment, self._v, self._gamma)
+        
+        cells = ~(environment_map.obstruction_mask() | environment_map.terminal_mask()) & \
+            np.isfinite(heuristic_values)
+        self._v.values()[cells] = heuristic_values[cells]
+        
+        if set_policy is True:
+            best_actions, _ = self._greedy_actions_vectorized()
+            self._transition_model().set_policy_action_indices(self._pi, best_actions)
+
     # Reset the iterator
     def reset(self):
         # Reset
         self._v = None
         self._pi = None
+        self._solved_map_version = None
         
         self._initialized = False
 
@@ -103,6 +239,503 @@ class DynamicProgrammingBase(object):
     
     # Solve for the policy. Note that because v and pi are stored separately,
     # this method can be repeatedly called to update / continue computing the solution.
-    def solve_policy(self):
+    # If a solution cache is set, the solution is looked up there first,
+    # unless bypass_cache is True.
+    #
+    # The solve can be stopped early. deadline is a time.monotonic() value,
+    # and cancel_event is a threading.Event (or anything with is_set). Both
+    # are checked after every sweep. If either fires, the solve stops, the
+    # greedy policy of the current value function is extracted and returned,
+    # converged() becomes False and last_residual() gives the Bellman residual
+    # of the current values. If the step which was running when the deadline
+    # passed changed the values by less than theta, the solve may have just
+    # finished, so it is resumed once more to let it return.
+    def solve_policy(self, bypass_cache = False, deadline = None, cancel_event = None):
+        self._print_sweeps = self._verbose
+        try:
+            return self._run_solve(bypass_cache, deadline, cancel_event)
+        finally:
+            self._print_sweeps = False
+
+    # Run the solve for solve_policy, stopping it at the deadline or if it is
+    # cancelled
+    def _run_solve(self, bypass_cache, deadline, cancel_event):
+        steps = self.iter_solve(bypass_cache)
+        
+        self._converged = False
+        self._last_residual = None
+        
+        while True:
+            try:
+                snapshot = next(steps)
+            except StopIteration as stop:
+                self._converged = True
+                return stop.value
+            
+            if snapshot.delta() is not None:
+                self._last_residual = snapshot.delta()
+            
+            if ((deadline is not None) and (time.monotonic() >= deadline)) or \
+                ((cancel_event is not None) and (cancel_event.is_set() is True)):
+                
+                if (snapshot.delta() is None) or (snapshot.delta() >= self._theta):
+                    break
+                
+                try:
+                    snapshot = next(steps)
+                except StopIteration as stop:
+                    self._converged = True
+                    return stop.value
+                
+                if snapshot.delta() is not None:
+                    self._last_residual = snapshot.delta()
+                break
+        
+        # Bring the value function up to date and stop the solver. The
+        # solution is not complete, so it is not stored in the cache.
+        snapshot.values()
+        steps.close()
+        
+        print(f'Stopped the solve early after {snapshot.iteration()} iterations')
+        
+        return self._interrupted_solve_result(snapshot)
+
+    # Run the steps of a solve to the end without stopping it early, printing
+    # the progress of every sweep if the solver is verbose. Returns the
+    # result of the steps.
+    def _run_to_completion(self, steps):
+        self._print_sweeps = self._verbose
+        try:
+            return run_to_completion(steps)
+        finally:
+            self._print_sweeps = False
+
+    # Print the progress of a sweep, if solve_policy is running and the
+    # solver is verbose
+    def _print_sweep(self, message):
+        if self._print_sweeps is True:
+            print(message)
+
+    # Return whether the last call to solve_policy ran to the end. It is False
+    # if the solve was stopped by its deadline or cancelled.
+    def converged(self):
+        return self._converged
+
+    # Return the residual of the last call to solve_policy. If the solve ran
+    # to the end, this is the largest change in the value function in the
+    # last step. If it was stopped early, it is the Bellman residual
+    # max_s |max_a Q(s, a) - v(s)| of the value function it stopped with.
+    def last_residual(self):
+        return self._last_residual
+
+    # Build the result of a solve which was stopped early, after the step in
+    # snapshot. Subclasses which support stopping early override this.
+    def _interrupted_solve_result(self, snapshot):
+        raise NotImplementedError()
+
+    # Set the policy to the greedy policy of the current value function, and
+    # record the Bellman residual of the value function
+    def _extract_greedy_policy(self):
+        model = self._transition_model()
+        
+        best_actions, best_values = self._greedy_actions_vectorized()
+        model.set_policy_action_indices(self._pi, best_actions)
+        
+        v = model.state_values(self._v)[:len(best_values)]
+        self._last_residual = float(np.max(np.abs(best_values - v))) if len(v) > 0 else 0.0
+        
+        if self._policy_drawer is not None:
+            self._policy_drawer.update()
+            
+        if self._value_drawer is not None:
+            self._value_drawer.update()
+
+    # Solve for the policy one step at a time. This is a generator, which
+    # yields a SolverSnapshot after every sweep or policy improvement step, and
+    # returns the same result as solve_policy. The caller can stop iterating
+    # at any point, which leaves the value function and policy part way to
+    # the solution. If the solution is found in the cache, nothing is yielded.
+    # Note that the starting value function and policy are not part of the
+    # cache key, so a cached solution is returned however the solver was initialized.
+    def iter_solve(self, bypass_cache = False):
+        if (self._solution_cache is None) or (bypass_cache is True):
+            return (yield from self._solve_steps())
+        
+        key = self._solution_cache.key(self._environment, type(self), self._solution_cache_settings())
+        cached_solution = self._solution_cache.load(key)
+        
+        if cached_solution is not None:
+            values, actions, statistics = cached_solution
+            self._v.values()[:] = values
+            self._pi.actions()[:] = actions
+            self._record_solved_map_version()
+            print('Loaded the solution from the cache')
+            return (self._v, self._pi) + statistics
+        
+        # Only a complete solution is stored
+        result = yield from self._solve_steps()
+        self._solution_cache.store(key, self._v.values(), self._pi.actions(), result[2:])
+        
+        return result
+
+    # Carry out the solve. If the transitions of the environment are
+    # deterministic, and this solver can use it, the problem is handed to the
+    # shortest path solver. That is not broken into steps, so nothing is
+    # yielded. Otherwise, this runs _solve_policy_steps.
+    def _solve_steps(self):
+        transitions = None
+        
+        if (self._use_deterministic_solver is True) and (self._supports_deterministic_solver is True) and \
+            hasattr(self._environment, 'deterministic_transitions'):
+            transitions = self._environment.deterministic_transitions(TransitionModel.DEFAULT_ACTIONS)
+        
+        if transitions is None:
+            return (yield from self._solve_policy_steps())
+        
+        return self._solve_deterministic(transitions)
+
+    # The generator which carries out the solve. It must return the value
+    # function and policy followed by any statistics.
+    def _solve_policy_steps(self):
+        raise NotImplementedError()
+
+    # Solve a problem with deterministic transitions with the shortest path
+    # solver, and return the same result as solve_policy
+    def _solve_deterministic(self, transitions):
+        environment_map = self._environment.map()
+        
+        terminal_mask = environment_map.terminal_mask()
+        solved_mask = ~(environment_map.obstruction_mask() | terminal_mask)
+        
+        next_x, next_y, rewards = transitions
+        
+        values, action_indices, number_of_sweeps, residual = solve_deterministic(next_x, next_y, rewards, \
+            self._v.values(), terminal_mask, solved_mask, self._gamma, self._theta)
+        
+        actions = np.array(TransitionModel.DEFAULT_ACTIONS)[action_indices]
+        
+        self._v.values()[solved_mask] = values[solved_mask]
+        self._pi.actions()[solved_mask] = actions[solved_mask]
+        
+        self._last_residual = residual
+        
+        print(f'Solved the deterministic problem by shortest paths; checked with {number_of_sweeps} sweeps')
+        
+        self._record_solved_map_version()
+        
+        if self._policy_drawer is not None:
+            self._policy_drawer.update()
+            
+        if self._value_drawer is not None:
+            self._value_drawer.update()
+        
+        return (self._v, self._pi) + self._deterministic_solve_statistics(number_of_sweeps, residual)
+
+    # The statistics returned after the value function and policy when the
+    # shortest path solver was used, in the same form as those of
+    # _solve_policy_steps. Solvers which support it override this.
+    def _deterministic_solve_statistics(self, number_of_sweeps, residual):
         raise NotImplementedError()
-        
\ No newline at end of file
+
+    # Make a snapshot of the current value function and policy. If the
+    # solver is working on a separate vector of values, synchronize must
+    # write them back into the value function.
+    def _snapshot(self, step, iteration, delta, number_of_changed_actions, synchronize = None):
+        return SolverSnapshot(step, iteration, delta, number_of_changed_actions, self._v, self._pi, synchronize)
+
+    # The settings of the solver which affect the solution. These are part
+    # of the key used to look up solutions in the cache, so subclasses with
+    # more settings extend them.
+    def _solution_cache_settings(self):
+        initial_value_heuristic = self._initial_value_heuristic
+        if initial_value_heuristic is not None:
+            initial_value_heuristic = getattr(initial_value_heuristic, '__qualname__', repr(initial_value_heuristic))
+        return {'gamma': self._gamma,
+                'theta': self._theta,
+                'use_vectorized_sweeps': self._use_vectorized_sweeps,
+                'use_jit_sweeps': self._use_jit_sweeps,
+                'use_deterministic_solver': self._use_deterministic_solver,
+                'initial_value_heuristic': initial_value_heuristic}
+
+    # Record that the current solution is for the current version of the map
+    def _record_solved_map_version(self):
+        self._solved_map_version = self._environment.map().version()
+
+    # Repair the solution after cells of the map have been edited, rather
+    # than solving again from scratch. The edited cells are reset, and then
+    # the states around them are backed up by prioritized sweeping, starting
+    # from the current value function. The rest of the map is only backed up
+    # if the change in value spreads to it. If the whole map has changed (or
+    # there is no solution yet), every state is swept, but still starting
+    # from the current values. If the change spreads far enough that the
+    # number of backups passes the repair backup fraction of the number of
+    # states, the whole map is swept with whole-array operations from the
+    # current values instead. The policy is then made greedy again. Returns
+    # the value function, the policy and the number of backups.
+    def resolve_after_map_edits(self, max_number_of_backups = None):
+        
+        environment_map = self._environment.map()
+        
+        edited_cells = None
+        if self._solved_map_version is not None:
+            edited_cells = environment_map.edited_cells_since(self._solved_map_version)
+            
+        if edited_cells is None:
+            cells = [(x, y) for x in range(environment_map.width()) for y in range(environment_map.height())]
+        else:
+            cells = sorted(edited_cells)
+            
+        self._environment.reset_edited_cells(self._v, self._pi, cells)
+        
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+        number_of_actions = len(model.actions())
+        
+        if edited_cells is None:
+            states = np.arange(n)
+        else:
+            states = model.affected_states(edited_cells)
+        
+        v = model.state_values(self._v)
+        
+        # If gamma = 1, the values of the states which cannot reach a terminal
+        # fall without bound. They are set to -inf, which backing up does not
+        # change, so they are never backed up.
+        if self._gamma >= 1:
+            v[:n][~self._states_reaching_terminals(model)] = -np.inf
+        
+        # The states away from the edits still satisfy the Bellman equation to
+        # within theta, so only the states next to them need to be checked
+        priority = [0.0] * n
+        if len(states) > 0:
+            p_states, r_states = model.state_transitions(states)
+            q = (r_states + self._gamma * (p_states @ v)).reshape(number_of_actions, len(states))
+            errors = bellman_errors(np.max(q, axis=0), v[states])
+            for s, error in zip(states.tolist(), errors.tolist()):
+                priority[s] = error
+                
+        if max_number_of_backups is None:
+            max_number_of_backups = self._max_number_of_repair_sweeps() * n
+            
+        repair_backups = min(max_number_of_backups, int(self._repair_backup_fraction * n))
+        
+        backups, converged = prioritized_sweep(model, v, priority, self._gamma, self._theta, \
+                                               repair_backups)
+        
+        if (converged is False) and (backups < max_number_of_backups):
+            print(f'The repair spread after {backups} backups; sweeping the whole map')
+            sweep_backups, converged = self._sweep_values_vectorized(model, v, max_number_of_backups - backups)
+            backups += sweep_backups
+        
+        if converged is False:
+            print('Maximum number of backups exceeded')
+            
+        print(f'Repaired the solution after {backups} backups')
+        
+        model.set_non_terminal_state_values(self._v, v[:n])
+        
+        # Only write the actions which have changed
+        best_actions, _ = self._greedy_actions_vectorized()
+        current_actions = model.policy_action_indices(self._pi)
+        changed = np.flatnonzero(best_actions != current_actions)
+        model.set_policy_action_indices(self._pi, best_actions, only_changed = changed)
+        
+        self._record_solved_map_version()
+        
+        if self._policy_drawer is not None:
+            self._policy_drawer.update()
+            
+        if self._value_drawer is not None:
+            self._value_drawer.update()
+        
+        return self._v, self._pi, backups
+
+    # Sweep value iteration over every non-terminal state with whole-array
+    # operations, starting from the vector of values v, which is updated in
+    # place, until no value changes by more than theta. Returns the number of
+    # backups and whether the values converged.
+    def _sweep_values_vectorized(self, model, v, max_number_of_backups):
+        n = model.number_of_non_terminal_states()
+
+        if n == 0:
+            return 0, True
+
+        backups = 0
+
+        while backups + n <= max_number_of_backups:
+            new_v = np.max(model.q_values(v, self._gamma), axis=0)
+            delta = np.max(bellman_errors(new_v, v[:n]))
+            v[:n] = new_v
+            backups += n
+
+            if delta < self._theta:
+                return backups, True
+
+        return backups, False
+
+    # The maximum number of sweeps of the whole map a repair does (counted in
+    # backups), if resolve_after_map_edits is not given a maximum number of
+    # backups. This is the default maximum number of sweeps of value iteration.
+    def _max_number_of_repair_sweeps(self):
+        return 2000
+
+    # Return the compiled transition model of the environment. The environment
+    # caches this, so it is only rebuilt when the map or process model changes.
+    def _transition_model(self):
+        return self._environment.transition_model()
+
+    # Evaluate the current policy using the compiled transition model. Each
+    # sweep is a single sparse matrix-vector product. The evaluation stops when
+    # the change is below theta (by default, the solver's theta). This is a
+    # generator which yields a snapshot after every sweep, and returns the
+    # number of sweeps and whether the evaluation converged.
+    def _evaluate_policy_vectorized(self, max_iterations, theta = None):
+        
+        if theta is None:
+            theta = self._theta
+        
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+        
+        # The policy is fixed during evaluation, so build P_pi and r_pi once
+        p_pi, r_pi = model.policy_transitions(model.policy_action_indices(self._pi))
+        v = model.state_values(self._v)
+        
+        iteration = 0
+        converged = False
+        
+        while True:
+            
+            new_v = r_pi + self._gamma * (p_pi @ v)
+            
+            delta = np.max(np.abs(new_v - v[:n])) if n > 0 else 0
+            v[:n] = new_v
+            
+            # Increment the policy evaluation counter        
+            iteration += 1
+                       
+            self._print_sweep(f'Finished policy evaluation iteration {iteration}')
+            
+            yield self._snapshot(SolverStep.POLICY_EVALUATION_SWEEP, iteration, delta, 0, \
+                                 lambda: model.set_non_terminal_state_values(self._v, v[:n]))
+            
+            # Terminate the loop if the change was very small
+            if delta < theta:
+                converged = True
+                break
+                
+            # Terminate the loop if the maximum number of iterations is met. Generate
+            # a warning
+            if iteration >= max_iterations:
+                print('Maximum number of iterations exceeded')
+                break
+                
+        model.set_non_terminal_state_values(self._v, v[:n])
+        
+        return iteration, converged
+
+    # Evaluate the current policy with the compiled Gauss-Seidel kernel. This
+    # is the same as the loops over the cells. This is a generator, like
+    # _evaluate_policy_vectorized.
+    def _evaluate_policy_jit(self, max_iterations):
+        
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+        successors, probabilities, rewards = model.padded_outcomes()
+        
+        action_indices = model.policy_action_indices(self._pi)
+        v = model.state_values(self._v)
+        
+        iteration = 0
+        converged = False
+        
+        while True:
+            
+            delta = jit_sweeps.policy_evaluation_sweep(v, successors, probabilities, rewards, \
+                                                       action_indices, self._gamma)
+            
+            # Increment the policy evaluation counter        
+            iteration += 1
+                       
+            self._print_sweep(f'Finished policy evaluation iteration {iteration}')
+            
+            yield self._snapshot(SolverStep.POLICY_EVALUATION_SWEEP, iteration, delta, 0, \
+                                 lambda: model.set_non_terminal_state_values(self._v, v[:n]))
+            
+            # Terminate the loop if the change was very small
+            if delta < self._theta:
+                converged = True
+                break
+                
+            # Terminate the loop if the maximum number of iterations is met. Generate
+            # a warning
+            if iteration >= max_iterations:
+                print('Maximum number of iterations exceeded')
+                break
+                
+        model.set_non_terminal_state_values(self._v, v[:n])
+        
+        return iteration, converged
+
+    # Work out which non-terminal states reach a terminal state with probability 1
+    # under the policy with transition matrix p_pi. A state is improper if it can
+    # reach a state from which no terminal state is reachable at all.
+    def _proper_states(self, p_pi, n):
+        
+        number_of_states = p_pi.shape[1]
+        
+        # States which can reach a terminal state
+        reaches_terminal = self._states_reaching(p_pi, n, np.arange(n, number_of_states))
+        
+        if np.all(reaches_terminal):
+            return reaches_terminal
+        
+        # States which can reach a state that cannot reach a terminal state
+        return ~self._states_reaching(p_pi, n, np.flatnonzero(~reaches_terminal))
+
+    # Work out which non-terminal states can reach a terminal state under
+    # some policy
+    def _states_reaching_terminals(self, model):
+        n = model.number_of_non_terminal_states()
+        
+        # Row i of the stacked transitions is a move out of state i % n
+        stacked_p, _ = model.state_transitions(np.arange(n))
+        stacked_p = stacked_p.tocoo()
+        number_of_states = stacked_p.shape[1]
+        p_any = csr_matrix((stacked_p.data, (stacked_p.row % max(n, 1), stacked_p.col)), \
+                           shape=(n, number_of_states))
+        
+        return self._states_reaching(p_any, n, np.arange(n, number_of_states))
+
+    # Work out which non-terminal states can reach one of the seed states,
+    # where p is a transition matrix of size (n, number of states). This is a
+    # breadth first search on the reversed transition graph, starting from an
+    # extra source node which has edges to the seed states.
+    def _states_reaching(self, p, n, seeds):
+        number_of_states = p.shape[1]
+        from_states, to_states = p.nonzero()
+        
+        source = number_of_states
+        edge_starts = np.concatenate((to_states, np.full(len(seeds), source)))
+        edge_ends = np.concatenate((from_states, seeds))
+        graph = csr_matrix((np.ones(len(edge_starts)), (edge_starts, edge_ends)), \
+                           shape=(number_of_states + 1, number_of_states + 1))
+        order = breadth_first_order(graph, source, directed=True, return_predecessors=False)
+        mask = np.zeros(number_of_states + 1, dtype=bool)
+        mask[order] = True
+        return mask[:n]
+
+    # For every non-terminal state, find the index of the action which maximises
+    # the expected return under the current value function, and that maximum
+    # value. As with the loops, ties are broken in favour of the first action.
+    def _greedy_actions_vectorized(self):
+        model = self._transition_model()
+        
+        q = model.q_values(model.state_values(self._v), self._gamma)
+        
+        if q.shape[1] == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0)
+        
+        best_actions = np.argmax(q, axis=0)
+        
+        return best_actions, q[best_actions, np.arange(q.shape[1])]
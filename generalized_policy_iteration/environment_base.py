@@ -6,8 +6,10 @@ Created on 26 Jan 2024
 
 from gymnasium import Env, spaces
 
+from .state_index import StateIndex
 from .tabular_policy import TabularPolicy
 from .tabular_value_function import TabularValueFunction
+from .transition_model import TransitionModel
 
 
 class EnvironmentBase(Env):
@@ -29,10 +31,41 @@ class EnvironmentBase(Env):
 
     def initial_policy(self) -> TabularPolicy:
         raise NotImplementedError()
+
+    # Make the value function and policy consistent with the map in the
+    # given cells after they have been edited
+    def reset_edited_cells(self, v, pi, cells):
+        raise NotImplementedError()
     
     def map(self):
         return self._environment_map
 
+    # Return a dictionary of the parameters of the environment which affect
+    # the solution (apart from the map)
+    def parameters(self):
+        raise NotImplementedError()
+
+    # Return the same environment on a map coarsened by the specified factor
+    def coarsened(self, factor):
+        raise NotImplementedError()
+
+    # Return the numbering of the states of the map. Subclasses can override
+    # this to cache the index until the map changes.
+    def state_index(self):
+        return StateIndex(self._environment_map)
+
+    # Return the process model compiled into sparse matrices. Subclasses
+    # can override this to cache the model between calls.
+    def transition_model(self):
+        return TransitionModel(self)
+
+    # If every action has a single, certain outcome, return arrays of size
+    # (number of actions, width, height) with the coordinates of the cell each
+    # action leads to from each cell, and its reward. Otherwise return None.
+    # The solvers then use the shortest path solver rather than iterating.
+    def deterministic_transitions(self, actions):
+        return None
+
     # This method returns, for the specified state and action, the following:
     # 1. The set of output states
     # 2. The set of rewards
@@ -0,0 +1,170 @@
+# This is the base of the solvers which only solve for the states which
+# matter when the robot starts in a given cell (LRTDPSolver and
+# LAOStarSolver). Rather than compiling the transition model for the whole
+# map, the outcomes of each state are queried from the environment when the
+# state is first expanded. The values of the states which have not been
+# backed up come from an admissible heuristic (an upper bound on the optimal
+# values, see heuristics).
+#
+# Only the states which were expanded have meaningful values and actions; the
+# rest of the value function and policy keep their initial values.
+
+from .dynamic_programming_base import DynamicProgrammingBase
+from .heuristics import chebyshev_distance_heuristic
+from .transition_model import TransitionModel
+
+
+class HeuristicSearchBase(DynamicProgrammingBase):
+
+    def __init__(self, environment):
+        DynamicProgrammingBase.__init__(self, environment)
+
+        # The cell the robot starts in
+        self._start_cell = None
+
+        # The heuristic used for the initial values
+        self._heuristic = chebyshev_distance_heuristic
+
+        # The states which were expanded in the last solve
+        self._outcomes = {}
+
+    # Set the cell the robot starts in
+    def set_start_cell(self, start_cell):
+        self._start_cell = (int(start_cell[0]), int(start_cell[1]))
+
+    # Set the heuristic (see heuristics) used for the initial values
+    def set_heuristic(self, heuristic):
+        self._heuristic = heuristic
+
+    # The number of states which were expanded in the last solve
+    def number_of_expanded_states(self):
+        return len(self._outcomes)
+
+    # The cells which were expanded in the last solve
+    def expanded_cells(self):
+        return list(self._outcomes.keys())
+
+    def _solution_cache_settings(self):
+        settings = DynamicProgrammingBase._solution_cache_settings(self)
+        settings.update({'start_cell': self._start_cell,
+                         'heuristic': getattr(self._heuristic, '__qualname__', repr(self._heuristic))})
+        return settings
+
+    # Check the start cell and set up the search
+    def _start_search(self):
+
+        if self._start_cell is None:
+            raise ValueError('The start cell must be set before solving')
+
+        environment_map = self._environment.map()
+
+        if environment_map.is_obstruction(self._start_cell[0], self._start_cell[1]):
+            raise ValueError(f'The start cell {self._start_cell} is an obstruction')
+
+        # Initialize the drawers
+        if self._policy_drawer is not None:
+            self._policy_drawer.update()
+
+        if self._value_drawer is not None:
+            self._value_drawer.update()
+
+        # Plain lists are much faster than arrays for single element access
+        self._heuristic_values = self._heuristic(self._environment, self._v, self._gamma).tolist()
+        self._terminals = environment_map.terminal_mask().tolist()
+
+        self._values = {}
+        self._outcomes = {}
+
+    # Write the results into the value function and policy
+    def _finish_search(self):
+        self._write_values()
+        self._write_policy()
+
+        self._record_solved_map_version()
+
+        # Draw one last time to clear any transients which might
+        # draw changes
+        if self._policy_drawer is not None:
+            self._policy_drawer.update()
+
+        if self._value_drawer is not None:
+            self._value_drawer.update()
+
+    # If the solve is stopped early, the greedy policy of the expanded states
+    # is extracted. The residual is the largest over the expanded states.
+    def _interrupted_solve_result(self, snapshot):
+        self._write_policy()
+        self._last_residual = max((self._residual(s) for s in self._outcomes), default = 0.0)
+        return self._v, self._pi, snapshot.iteration(), len(self._outcomes)
+
+    # Return the outcomes of every action in a state as a list of
+    # (successor cells, probabilities, expected reward). They are queried
+    # from the environment the first time the state is expanded.
+    def _expand(self, s):
+        outcomes = self._outcomes.get(s)
+
+        if outcomes is None:
+            outcomes = []
+            for a in TransitionModel.DEFAULT_ACTIONS:
+                s_prime, r, p = self._environment.next_state_and_reward_distribution(s, a)
+                successors = [successor.coords() for successor in s_prime]
+                expected_reward = sum(p[t] * r[t] for t in range(len(p)))
+                outcomes.append((successors, p, expected_reward))
+            self._outcomes[s] = outcomes
+
+        return outcomes
+
+    # Check if a state is a terminal
+    def _is_terminal(self, s):
+        return self._terminals[s[0]][s[1]]
+
+    # The current value of a state. States which have not been backed up have
+    # the heuristic value.
+    def _value(self, s):
+        value = self._values.get(s)
+        if value is None:
+            return self._heuristic_values[s[0]][s[1]]
+        return value
+
+    # Return the index of the greedy action in a state and its value. As with
+    # the other solvers, ties are broken in favour of the first action.
+    def _greedy_action(self, s):
+        best_a = None
+        best_q = float('-inf')
+
+        for a, (successors, p, expected_reward) in enumerate(self._expand(s)):
+            q = expected_reward
+            for t in range(len(p)):
+                q += self._gamma * p[t] * self._value(successors[t])
+            if q > best_q:
+                best_a = a
+                best_q = q
+
+        return best_a, best_q
+
+    # Back up a non-terminal state. Returns the index of the greedy action and
+    # the change in the value.
+    def _backup(self, s):
+        a, q = self._greedy_action(s)
+        delta = abs(q - self._value(s))
+        self._values[s] = q
+        return a, delta
+
+    # The Bellman residual of a state
+    def _residual(self, s):
+        if self._is_terminal(s) is True:
+            return 0.0
+        _, q = self._greedy_action(s)
+        return abs(q - self._value(s))
+
+    # Write the values of the states which were backed up into the value function
+    def _write_values(self):
+        for (x, y), value in self._values.items():
+            self._v.set_value(x, y, value)
+
+    # Set the policy to the greedy action in every expanded non-terminal state
+    def _write_policy(self):
+        for s in self._outcomes:
+            if self._is_terminal(s) is False:
+                a, _ = self._greedy_action(s)
+                self._pi.set_action(s[0], s[1], TransitionModel.DEFAULT_ACTIONS[a])
@@ -0,0 +1,113 @@
+# Heuristics for the solvers which only look at some of the states. Each is a
+# function heuristic(environment, v, gamma) which returns a (width, height)
+# array with an upper bound on the optimal value of every cell. The values of
+# the terminal states are read from the value function v. The bounds must be
+# admissible (never below the optimal values) for the solvers to be optimal.
+# They can also be used as a warm start for the value function of the solvers
+# which sweep the whole map (see DynamicProgrammingBase.set_initial_value_heuristic).
+
+import heapq
+
+import numpy as np
+from scipy.ndimage import distance_transform_cdt
+
+from grid_search.cell_grid import MOVE_DIRECTIONS
+
+
+# The robot moves at most one cell in each direction per step, so it needs
+# at least as many steps as the chessboard (Chebyshev) distance to reach a
+# terminal, and each step costs at least minimum_step_cost. The bound is the
+# best value of reaching any of the terminals in that many steps. If gamma < 1,
+# never reaching a terminal at all could be better than reaching one with a
+# large negative reward, so that value is also allowed for.
+def chebyshev_distance_heuristic(environment, v, gamma, minimum_step_cost = 1):
+    environment_map = environment.map()
+    terminal_mask = environment_map.terminal_mask()
+
+    terminal_values = v.values()[terminal_mask]
+
+    bound = np.full((environment_map.width(), environment_map.height()), -np.inf)
+
+    # Terminals with the same value are handled together with one distance transform
+    for terminal_value in np.unique(terminal_values):
+        other_cells = ~(terminal_mask & (v.values() == terminal_value))
+        steps = distance_transform_cdt(other_cells, metric='chessboard')
+        bound = np.maximum(bound, _best_value_after_steps(steps, terminal_value, gamma, minimum_step_cost))
+
+    if gamma < 1:
+        bound = np.maximum(bound, -minimum_step_cost / (1 - gamma))
+
+    bound[terminal_mask] = v.values()[terminal_mask]
+
+    return bound
+
+
+# The value of the best path to a terminal if every move goes where it is
+# intended (a nominal direction probability of 1). The values are found by
+# one reverse Dijkstra search from all the terminals at once over the move
+# costs of the map: the value of a cell is the best of -cost + gamma * value
+# over the moves into its neighbours. With uncertain moves, the robot can
+# only end up going in one of the eight directions, which it could have
+# chosen to do, so this is still an upper bound, and much tighter than
+# chebyshev_distance_heuristic around walls and expensive cells.
+#
+# This is exact for a nominal direction probability of 1, unless gamma < 1
+# and never reaching a terminal is better; as in chebyshev_distance_heuristic,
+# the value of that is bounded by -minimum_step_cost / (1 - gamma). Cells
+# which cannot reach a terminal at all have a value of -inf if gamma = 1.
+def shortest_path_heuristic(environment, v, gamma, minimum_step_cost = 1):
+    environment_map = environment.map()
+    width = environment_map.width()
+    height = environment_map.height()
+
+    terminal_mask = environment_map.terminal_mask()
+
+    # Plain lists are much faster than arrays for single element access
+    move_costs = environment_map.move_costs().tolist()
+    blocked = (environment_map.obstruction_mask() | terminal_mask).tolist()
+
+    bound = np.full((width, height), -np.inf)
+    if gamma < 1:
+        bound[:] = -minimum_step_cost / (1 - gamma)
+    bound[terminal_mask] = v.values()[terminal_mask]
+    bound = bound.tolist()
+
+    queue = [(-bound[x][y], x, y) for x, y in np.argwhere(terminal_mask).tolist()]
+    heapq.heapify(queue)
+
+    # The search is label correcting, so a cell whose value improves after it
+    # was popped is simply queued again. With gamma < 1 and terminals with
+    # very negative values, this can happen; otherwise each cell is only
+    # popped once, as in Dijkstra.
+    while len(queue) > 0:
+        negative_value, x, y = heapq.heappop(queue)
+        value = -negative_value
+
+        if value < bound[x][y]:
+            continue
+
+        # Look at the cells which can move into this one
+        for direction, (dX, dY) in enumerate(MOVE_DIRECTIONS):
+            from_x = x - dX
+            from_y = y - dY
+
+            if (from_x < 0) or (from_x >= width) or (from_y < 0) or (from_y >= height) or \
+                (blocked[from_x][from_y] is True):
+                continue
+
+            from_value = gamma * value - move_costs[direction][from_x][from_y]
+
+            if from_value > bound[from_x][from_y]:
+                bound[from_x][from_y] = from_value
+                heapq.heappush(queue, (-from_value, from_x, from_y))
+
+    return np.array(bound)
+
+
+# The value of taking the given number of steps, each costing step_cost, and
+# then reaching a terminal with the given value
+def _best_value_after_steps(steps, terminal_value, gamma, step_cost):
+    if gamma >= 1:
+        return terminal_value - step_cost * steps
+    discount = gamma ** steps
+    return -step_cost * (1 - discount) / (1 - gamma) + discount * terminal_value
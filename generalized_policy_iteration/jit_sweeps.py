@@ -0,0 +1,88 @@
+# These are the kernels of the cell-by-cell sweeps, written over the padded
+# outcome arrays of the compiled transition model (see
+# TransitionModel.padded_outcomes) so that they can be compiled with Numba.
+# The states are visited in order of state id, which is the same order as the
+# loops over the cells, and each new value is written back straight away, so
+# the sweeps have the same Gauss-Seidel behaviour as the loops.
+#
+# Numba is optional. If it is not installed, NUMBA_AVAILABLE is False and the
+# solvers fall back to the loops; the functions here still work, but as plain
+# Python. The compiled functions are cached on disk (in __pycache__, or in
+# NUMBA_CACHE_DIR if that is set), so they are only compiled the first time.
+#
+# In all the kernels, v is the vector of the values of all the states, which
+# is updated in place, and successors, probabilities and rewards are the
+# arrays from padded_outcomes.
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        def decorator(function):
+            return function
+        return decorator
+
+
+# Return the expected return of taking the action with index a in state s
+@njit(cache = True)
+def _q_value(v, successors, probabilities, rewards, s, a, gamma):
+    q = 0.0
+    for t in range(successors.shape[2]):
+        q += probabilities[s, a, t] * v[successors[s, a, t]]
+    return rewards[s, a] + gamma * q
+
+
+# Carry out one sweep of policy evaluation, where action_indices[s] is the
+# index of the action taken in state s. Returns the largest change.
+@njit(cache = True)
+def policy_evaluation_sweep(v, successors, probabilities, rewards, action_indices, gamma):
+    delta = 0.0
+    for s in range(successors.shape[0]):
+        new_v = _q_value(v, successors, probabilities, rewards, s, action_indices[s], gamma)
+        delta = max(delta, abs(new_v - v[s]))
+        v[s] = new_v
+    return delta
+
+
+# Carry out one sweep of value iteration. Returns the largest change.
+@njit(cache = True)
+def value_iteration_sweep(v, successors, probabilities, rewards, gamma):
+    delta = 0.0
+    for s in range(successors.shape[0]):
+        new_v = -np.inf
+        for a in range(successors.shape[1]):
+            q = _q_value(v, successors, probabilities, rewards, s, a, gamma)
+            if q > new_v:
+                new_v = q
+        delta = max(delta, abs(new_v - v[s]))
+        v[s] = new_v
+    return delta
+
+
+# Set action_indices[s] to the index of the greedy action in every state. As
+# with the loops, ties are broken in favour of the first action. The action
+# is only changed if the greedy action is better than the current one by
+# more than tolerance; with the default of -inf, the greedy action is always
+# taken. States whose action is not one of the actions (an index of -1)
+# always take the greedy action. v is not changed. Returns the number of states whose action changed.
+@njit(cache = True)
+def improve_policy(v, successors, probabilities, rewards, action_indices, gamma, tolerance = -np.inf):
+    changed = 0
+    for s in range(successors.shape[0]):
+        best_a = 0
+        best_q = -np.inf
+        for a in range(successors.shape[1]):
+            q = _q_value(v, successors, probabilities, rewards, s, a, gamma)
+            if q > best_q:
+                best_a = a
+                best_q = q
+        if (best_a != action_indices[s]) and ((action_indices[s] < 0) or \
+            (best_q > _q_value(v, successors, probabilities, rewards, s, action_indices[s], gamma) + tolerance)):
+            action_indices[s] = best_a
+            changed += 1
+    return changed
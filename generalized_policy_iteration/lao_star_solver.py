@@ -0,0 +1,141 @@
+# This class implements improved LAO* (Hansen and Zilberstein 2001). Like
+# LRTDPSolver, it only solves for the states which matter when the robot
+# starts in a given cell, but it is deterministic: rather than sampling
+# trials, it grows an explicit graph of the states reachable from the start
+# cell under the current greedy policy (the best partial solution graph).
+#
+# Each iteration is a depth-first traversal of that graph from the start
+# cell. States which have not been expanded yet (the fringe of the graph) are
+# expanded, but the traversal does not go beyond them. The states are then
+# backed up in postorder, so each iteration is a sweep of value iteration
+# over the solution graph alone. Because the values start from an admissible
+# heuristic, the graph only grows towards states which could be on an
+# optimal path.
+#
+# The solve finishes when an iteration expands no new states and changes no
+# value by more than theta. The final greedy policy is then checked once
+# more, so the policy returned is defined on every state it can reach from
+# the start cell.
+
+from .heuristic_search_base import HeuristicSearchBase
+from .solver_snapshot import SolverStep
+
+
+class LAOStarSolver(HeuristicSearchBase):
+
+    def __init__(self, environment):
+        HeuristicSearchBase.__init__(self, environment)
+
+        # The maximum number of iterations
+        self._max_number_of_iterations = 100000
+
+    # Set the maximum number of iterations
+    def set_max_number_of_iterations(self, max_number_of_iterations):
+        self._max_number_of_iterations = max_number_of_iterations
+
+    def _solution_cache_settings(self):
+        settings = HeuristicSearchBase._solution_cache_settings(self)
+        settings.update({'max_number_of_iterations': self._max_number_of_iterations})
+        return settings
+
+    # Solve from the start cell. A snapshot is yielded after every sweep of
+    # the solution graph. Returns the value function, the policy, the number
+    # of iterations and the number of states which were expanded.
+    def _solve_policy_steps(self):
+
+        self._start_search()
+
+        iteration = 0
+        solved = False
+
+        while (solved is False) and (iteration < self._max_number_of_iterations):
+
+            number_of_expanded_states, delta = self._expand_and_sweep()
+
+            iteration += 1
+
+            yield self._snapshot(SolverStep.VALUE_ITERATION_SWEEP, iteration, delta, None, self._write_values)
+
+            if (number_of_expanded_states == 0) and (delta < self._theta):
+                solved = len(self._fringe_states()) == 0
+
+        if solved is False:
+            print('Maximum number of iterations exceeded')
+
+        print(f'Finished LAO* after {iteration} iterations; expanded {len(self._outcomes)} states')
+
+        self._finish_search()
+
+        return self._v, self._pi, iteration, len(self._outcomes)
+
+    # Traverse the best partial solution graph, expanding its fringe states,
+    # and back up the states in postorder. Returns the number of states which
+    # were expanded and the largest change in a value.
+    def _expand_and_sweep(self):
+        number_of_expanded_states = 0
+        postorder = []
+
+        # Each entry is a state and whether its successors have been visited
+        stack = [(self._start_cell, False)]
+        seen = {self._start_cell}
+
+        while len(stack) > 0:
+            s, successors_visited = stack.pop()
+
+            if successors_visited is True:
+                postorder.append(s)
+                continue
+
+            if self._is_terminal(s) is True:
+                continue
+
+            # Expand fringe states, but do not go beyond them
+            if s not in self._outcomes:
+                self._expand(s)
+                number_of_expanded_states += 1
+                postorder.append(s)
+                continue
+
+            stack.append((s, True))
+
+            a, _ = self._greedy_action(s)
+            successors, _, _ = self._outcomes[s][a]
+            for successor in successors:
+                if successor not in seen:
+                    seen.add(successor)
+                    stack.append((successor, False))
+
+        delta = 0.0
+
+        for s in postorder:
+            _, backup_delta = self._backup(s)
+            delta = max(delta, backup_delta)
+
+        return number_of_expanded_states, delta
+
+    # Return the non-terminal states which the greedy policy can reach from
+    # the start cell but which have not been expanded
+    def _fringe_states(self):
+        fringe = []
+
+        open_states = [self._start_cell]
+        seen = {self._start_cell}
+
+        while len(open_states) > 0:
+            s = open_states.pop()
+
+            if self._is_terminal(s) is True:
+                continue
+
+            if s not in self._outcomes:
+                fringe.append(s)
+                continue
+
+            a, _ = self._greedy_action(s)
+            successors, _, _ = self._outcomes[s][a]
+            for successor in successors:
+                if successor not in seen:
+                    seen.add(successor)
+                    open_states.append(successor)
+
+        return fringe
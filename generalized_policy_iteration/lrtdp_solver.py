@@ -0,0 +1,174 @@
+# This class implements labelled real-time dynamic programming (LRTDP, Bonet
+# and Geffner 2003). Rather than sweeping over the whole map, it only solves
+# for the states which matter when the robot starts in a given cell.
+#
+# The values start from an admissible heuristic (an upper bound on the
+# optimal values, see heuristics). Each trial follows the greedy policy from
+# the start cell, sampling the outcomes of the actions, and backs up the
+# states it visits. At the end of a trial, the visited states are checked in
+# reverse order. A state is labelled as solved if the Bellman residual of it
+# and of every unsolved state its greedy policy can reach is below theta.
+# The solve finishes when the start cell is solved. Because the values are
+# optimistic, the greedy policy only leads to states which could be on an
+# optimal path, so most of the map is never looked at.
+#
+# As with the other heuristic search solvers (see HeuristicSearchBase), the
+# outcomes of each state are only queried from the environment when the state
+# is first expanded.
+
+import numpy as np
+
+from .heuristic_search_base import HeuristicSearchBase
+from .solver_snapshot import SolverStep
+
+
+class LRTDPSolver(HeuristicSearchBase):
+
+    def __init__(self, environment):
+        HeuristicSearchBase.__init__(self, environment)
+
+        # The maximum number of trials
+        self._max_number_of_trials = 10000
+
+        # The maximum number of steps in a trial. If not set, this is the
+        # number of cells in the map.
+        self._max_trial_length = None
+
+        # The seed of the random numbers used to sample the outcomes
+        self._random_seed = 0
+
+    # Set the maximum number of trials
+    def set_max_number_of_trials(self, max_number_of_trials):
+        self._max_number_of_trials = max_number_of_trials
+
+    # Set the maximum number of steps in a trial
+    def set_max_trial_length(self, max_trial_length):
+        self._max_trial_length = max_trial_length
+
+    # Set the seed of the random numbers used to sample the outcomes
+    def set_random_seed(self, random_seed):
+        self._random_seed = random_seed
+
+    def _solution_cache_settings(self):
+        settings = HeuristicSearchBase._solution_cache_settings(self)
+        settings.update({'max_number_of_trials': self._max_number_of_trials,
+                         'max_trial_length': self._max_trial_length,
+                         'random_seed': self._random_seed})
+        return settings
+
+    # Solve from the start cell. A snapshot is yielded after every trial.
+    # Returns the value function, the policy, the number of trials and the
+    # number of states which were expanded.
+    def _solve_policy_steps(self):
+
+        self._start_search()
+
+        self._solved = set()
+        self._random = np.random.default_rng(self._random_seed)
+
+        max_trial_length = self._max_trial_length
+        if max_trial_length is None:
+            environment_map = self._environment.map()
+            max_trial_length = environment_map.width() * environment_map.height()
+
+        trial = 0
+
+        while (self._start_cell not in self._solved) and (trial < self._max_number_of_trials):
+
+            delta = self._trial(max_trial_length)
+
+            trial += 1
+
+            yield self._snapshot(SolverStep.TRIAL, trial, delta, None, self._write_values)
+
+        if self._start_cell not in self._solved:
+            print('Maximum number of trials exceeded')
+
+        print(f'Finished LRTDP after {trial} trials; expanded {len(self._outcomes)} states')
+
+        self._finish_search()
+
+        return self._v, self._pi, trial, len(self._outcomes)
+
+    # Carry out one trial from the start cell. Returns the largest change in
+    # a value.
+    def _trial(self, max_trial_length):
+        visited = []
+        delta = 0.0
+
+        s = self._start_cell
+
+        while (s not in self._solved) and (len(visited) < max_trial_length):
+            visited.append(s)
+
+            if self._is_terminal(s) is True:
+                break
+
+            a, backup_delta = self._backup(s)
+            delta = max(delta, backup_delta)
+
+            s = self._sample(s, a)
+
+        # Label the states as solved, starting from the end of the trial
+        while len(visited) > 0:
+            solved, check_delta = self._check_solved(visited.pop())
+            delta = max(delta, check_delta)
+            if solved is False:
+                break
+
+        return delta
+
+    # Check if the state, and the states its greedy policy can reach, are all
+    # solved to within theta. If they are, they are labelled as solved.
+    # Otherwise, the states which were checked are backed up. Returns whether
+    # the state is solved, and the largest change in a value.
+    def _check_solved(self, s):
+        solved = True
+        delta = 0.0
+
+        open_states = []
+        closed_states = []
+        seen = set()
+
+        if s not in self._solved:
+            open_states.append(s)
+            seen.add(s)
+
+        while len(open_states) > 0:
+            s = open_states.pop()
+            closed_states.append(s)
+
+            if self._is_terminal(s) is True:
+                continue
+
+            a, q = self._greedy_action(s)
+            if abs(q - self._value(s)) > self._theta:
+                solved = False
+                continue
+
+            successors, _, _ = self._expand(s)[a]
+            for successor in successors:
+                if (successor not in self._solved) and (successor not in seen):
+                    open_states.append(successor)
+                    seen.add(successor)
+
+        if solved is True:
+            self._solved.update(closed_states)
+        else:
+            while len(closed_states) > 0:
+                s = closed_states.pop()
+                if self._is_terminal(s) is False:
+                    _, backup_delta = self._backup(s)
+                    delta = max(delta, backup_delta)
+
+        return solved, delta
+
+    # Sample the outcome of taking the action with index a in state s
+    def _sample(self, s, a):
+        successors, p, _ = self._expand(s)[a]
+        u = self._random.random()
+        for t in range(len(p)):
+            u -= p[t]
+            if u < 0:
+                return successors[t]
+        return successors[-1]
@@ -0,0 +1,246 @@
+# This class implements coarse-to-fine (multigrid) value iteration. The
+# environment is coarsened repeatedly, the coarsest version is solved from
+# scratch, and the solution of each level is used to start the next finer one.
+#
+# A good starting value function on its own does not save many sweeps.
+# Value iteration can only correct the errors in the starting values by
+# passing information back from the terminal states one cell per sweep, so
+# it still needs about as many sweeps as the distance to the furthest cell.
+# However, the coarse solution also tells us which states are close to the
+# goal. On the finer levels the states are therefore swept Gauss-Seidel
+# style, in decreasing order of their starting values, so that the values
+# near the goal are updated first and the new values carry through the whole
+# map in a single sweep. Each sweep backs up the greedy policy, which makes
+# the sweep a sparse triangular solve.
+#
+# On the coarser levels, one step covers several cells, so the discount is
+# raised to the power of the coarsening factor, and the values are scaled up
+# by the factor (relative to the best terminal reward) when they are moved
+# to the finer level.
+
+import numpy as np
+from scipy.sparse import identity, tril, triu
+from scipy.sparse.linalg import spsolve_triangular
+
+from .solver_snapshot import SolverStep, run_to_completion
+from .value_iterator import ValueIterator
+
+
+class MultigridValueIterator(ValueIterator):
+
+    def __init__(self, environment):
+        ValueIterator.__init__(self, environment)
+
+        # The policy is extracted from the compiled transition model
+        self._use_vectorized_sweeps = True
+
+        # The number of cells of a level in each direction covered by a cell
+        # of the next coarser level
+        self._coarsening_factor = 2
+
+        # The map is coarsened until it is no larger than this in one direction
+        self._coarsest_map_size = 32
+
+        # The number of sweeps carried out on each level in the last solve,
+        # starting with the coarsest
+        self.level_sweep_counts = []
+
+    # Set the coarsening factor between levels
+    def set_coarsening_factor(self, coarsening_factor):
+        self._coarsening_factor = coarsening_factor
+
+    # Set the size below which the map is not coarsened any further
+    def set_coarsest_map_size(self, coarsest_map_size):
+        self._coarsest_map_size = coarsest_map_size
+
+    def _solution_cache_settings(self):
+        settings = ValueIterator._solution_cache_settings(self)
+        settings.update({'coarsening_factor': self._coarsening_factor,
+                         'coarsest_map_size': self._coarsest_map_size})
+        return settings
+
+    # Build the environments for each level, from the finest to the coarsest
+    def _levels(self):
+        environments = [self._environment]
+
+        while True:
+            environment_map = environments[-1].map()
+            if min(environment_map.width(), environment_map.height()) <= self._coarsest_map_size:
+                break
+            environments.append(environments[-1].coarsened(self._coarsening_factor))
+
+        return environments
+
+    # Note that for this solver, solve_policy returns the number of sweeps on
+    # the finest level. Snapshots are only yielded for the sweeps on the finest
+    # level, since the coarser levels have their own value functions.
+    def _compute_optimal_value_function(self):
+
+        environments = self._levels()
+
+        self.level_sweep_counts = []
+
+        # Solve the coarsest level from scratch
+        level = len(environments) - 1
+        coarse_solver = ValueIterator(environments[level])
+        coarse_solver.set_use_vectorized_sweeps(True)
+        coarse_solver.set_gamma(self._gamma ** (self._coarsening_factor ** level))
+        coarse_solver.set_theta(self._theta)
+        coarse_solver.set_max_optimal_value_function_iterations(self._max_optimal_value_function_iterations)
+        coarse_solver.initialize()
+
+        # The coarsest level prints its sweeps if this solver does
+        coarse_solver._print_sweeps = self._print_sweeps
+
+        if level == 0:
+            coarse_solver.initialize(self._v, self._pi)
+
+        if level == 0:
+            iterations = yield from coarse_solver._compute_optimal_value_function()
+        else:
+            iterations = run_to_completion(coarse_solver._compute_optimal_value_function())
+
+        self.level_sweep_counts.append(iterations)
+        self._number_of_backups += iterations * environments[level].transition_model().number_of_non_terminal_states()
+
+        coarse_model = environments[level].transition_model()
+        coarse_v = coarse_model.state_values(coarse_solver.value_function())
+
+        # Work down through the finer levels
+        for level in reversed(range(len(environments) - 1)):
+            environment = environments[level]
+            model = environment.transition_model()
+
+            if level == 0:
+                v = model.state_values(self._v)
+            else:
+                v = model.state_values(environment.initial_value_function())
+
+            self._prolongate(coarse_model, coarse_v, model, v, self._gamma ** (self._coarsening_factor ** level))
+
+            sweeps = self._ordered_gauss_seidel_sweeps(model, v, self._gamma ** (self._coarsening_factor ** level))
+            if level == 0:
+                iterations = yield from sweeps
+            else:
+                iterations = run_to_completion(sweeps)
+
+            self.level_sweep_counts.append(iterations)
+            self._number_of_backups += iterations * model.number_of_non_terminal_states()
+
+            coarse_model = model
+            coarse_v = v
+
+        model = self._transition_model()
+        model.set_non_terminal_state_values(self._v, coarse_v[:model.number_of_non_terminal_states()])
+
+        print(f'Finished multigrid value iteration with {self.level_sweep_counts} sweeps per level')
+
+        return iterations
+
+    # Set the values of the non-terminal states of a finer level from the values
+    # of the next coarser level. Coarse cells which are obstructions have no
+    # value, so they take the lowest value of their neighbours; an optimistic
+    # value would make the robot head towards them.
+    def _prolongate(self, coarse_model, coarse_v, model, v, gamma):
+        factor = self._coarsening_factor
+        n = model.number_of_non_terminal_states()
+
+        coarse_state_ids = coarse_model.state_ids()
+        width, height = coarse_state_ids.shape
+        coarse_x, coarse_y = coarse_model.state_coords()
+
+        values = np.full((width, height), np.nan)
+        values[coarse_x, coarse_y] = coarse_v
+
+        while np.any(np.isnan(values)):
+            padded = np.pad(values, 1, constant_values = np.nan)
+            neighbours = np.stack([padded[1 + dx:1 + dx + width, 1 + dy:1 + dy + height] \
+                                   for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+            missing = np.isnan(values) & np.any(~np.isnan(neighbours), axis=0)
+            if not np.any(missing):
+                break
+            values[missing] = np.nanmin(neighbours[:, missing], axis=0)
+
+        x, y = model.state_coords()
+        coarse_values = values[x[:n] // factor, y[:n] // factor]
+        known = ~np.isnan(coarse_values)
+        v[:n][known] = self._scaled_values(coarse_values[known], np.max(v[n:], initial = 0), gamma)
+
+    # Each step on the coarser level covers factor steps on the finer one. If
+    # a state is d steps from a terminal state with reward R, and the steps
+    # cost one each, the coarse value is about -(1 - u) / (1 - gamma^factor) + u * R,
+    # where u = gamma^d. This is solved for u and used to work out the value
+    # at the finer level, which is -(1 - u) / (1 - gamma) + u * R. If gamma is
+    # one, this is R + factor * (coarse value - R).
+    def _scaled_values(self, coarse_values, reward, gamma):
+        factor = self._coarsening_factor
+
+        if gamma >= 1:
+            return reward + factor * (coarse_values - reward)
+
+        coarse_cost = 1 / (1 - gamma ** factor)
+        cost = 1 / (1 - gamma)
+        u = (coarse_values + coarse_cost) / (reward + coarse_cost)
+
+        return u * (reward + cost) - cost
+
+    # Carry out Gauss-Seidel sweeps of the greedy policy until the largest
+    # change is below theta. The states are visited in decreasing order of
+    # their values, so that the values each state depends on which have
+    # already been updated in the sweep are in the strictly lower triangle of
+    # the (reordered) policy transition matrix. The order and the matrices are
+    # only worked out again when the greedy policy changes. This is a generator
+    # which yields a snapshot after every sweep and returns the number of
+    # sweeps. The values v are updated in place.
+    def _ordered_gauss_seidel_sweeps(self, model, v, gamma):
+        n = model.number_of_non_terminal_states()
+
+        if n == 0:
+            return 0
+
+        terminal_states = np.arange(n, model.number_of_states())
+        identity_matrix = identity(n, format='csr')
+
+        actions = None
+        iteration = 0
+
+        while True:
+
+            new_actions = np.argmax(model.q_values(v, gamma), axis=0)
+
+            if (actions is None) or (np.any(new_actions != actions)):
+                actions = new_actions
+                order = np.argsort(-v[:n], kind='stable')
+
+                p_pi, r_pi = model.policy_transitions(actions)
+                p_pi = p_pi[order]
+                r_pi = r_pi[order]
+
+                p_non_terminal = p_pi[:, order]
+                lower = (identity_matrix - gamma * tril(p_non_terminal, k=-1)).tocsr()
+                upper = triu(p_non_terminal, k=0, format='csr')
+                b_terminal = r_pi + gamma * (p_pi[:, terminal_states] @ v[n:])
+
+            v_ordered = v[order]
+            b = b_terminal + gamma * (upper @ v_ordered)
+            new_v = spsolve_triangular(lower, b, lower=True)
+
+            delta = np.max(np.abs(new_v - v_ordered))
+            v[order] = new_v
+
+            iteration += 1
+
+            self._print_sweep(f'Finished ordered Gauss-Seidel sweep {iteration}')
+            
+            yield self._snapshot(SolverStep.VALUE_ITERATION_SWEEP, iteration, delta, None, \
+                                 lambda: model.set_non_terminal_state_values(self._v, v[:n]))
+
+            # Terminate the loop if the change was very small (ie. convergence is reached)
+            if delta < self._theta:
+                break
+
+            if iteration >= self._max_optimal_value_function_iterations:
+                print('Maximum number of iterations exceeded')
+                break
+
+        return iteration
@@ -0,0 +1,219 @@
+# This class implements value iteration in parallel over a pool of processes.
+# The map is split into tiles, which are bands of columns, and each sweep
+# hands every tile to a worker which backs up the states in that tile.
+#
+# The compiled transition model and two copies of the value vector are
+# placed in shared memory, so the workers do not need to copy them. The rows
+# of the model are ordered by state and then by action, so the rows of a tile
+# are one contiguous range, and a worker backs up a tile using views of the
+# shared buffers. When a worker starts, it wraps the rows of every tile as a
+# sparse matrix once. The only per tile array this builds is the row pointer
+# of the tile, so each worker holds one row pointer for the whole model
+# rather than a copy of the model, however the tiles are handed out. The
+# sweeps are synchronous: in each sweep the workers read every value from
+# one buffer and write the values of their own tile into the other. The
+# rows just outside a tile (its halo) are therefore always the ones written
+# by the neighbouring tiles in the previous sweep. The buffers are swapped
+# between sweeps, and the maximum change over all the tiles is used to test
+# for convergence. This is exactly the update of the vectorized serial
+# solver, so it converges to the same value function in the same number of
+# sweeps.
+
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy import sparse
+
+from .solver_snapshot import SolverStep
+from .value_iterator import ValueIterator
+
+# The shared arrays as seen from inside each worker process
+_worker_state = {}
+
+
+# Copy an array into a new block of shared memory
+def _create_shared_array(array):
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared[...] = array
+    return block, shared
+
+
+# Attach to an array in shared memory created by _create_shared_array
+def _attach_shared_array(description):
+    name, shape, dtype = description
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+# Set up a worker process. The shared arrays are attached, and the rows of
+# each tile are wrapped as a CSR matrix, once rather than on every sweep.
+def _initialize_worker(descriptions, tiles, number_of_actions, gamma):
+    blocks = {}
+    arrays = {}
+    for key, description in descriptions.items():
+        blocks[key], arrays[key] = _attach_shared_array(description)
+
+    # The data and indices are views of the shared buffers; only the row
+    # pointer is offset
+    number_of_states = len(arrays['values_0'])
+    tile_models = {}
+    for start, end in tiles:
+        first_row = start * number_of_actions
+        last_row = end * number_of_actions
+        indptr = arrays['indptr'][first_row:last_row + 1]
+        first_entry = indptr[0]
+        last_entry = indptr[-1]
+        p_tile = sparse.csr_matrix((arrays['data'][first_entry:last_entry], \
+                                    arrays['indices'][first_entry:last_entry], indptr - first_entry), \
+                                   shape=(last_row - first_row, number_of_states), copy=False)
+        tile_models[(start, end)] = (p_tile, arrays['rewards'][first_row:last_row])
+
+    _worker_state['blocks'] = blocks
+    _worker_state['tile_models'] = tile_models
+    _worker_state['values'] = (arrays['values_0'], arrays['values_1'])
+    _worker_state['number_of_actions'] = number_of_actions
+    _worker_state['gamma'] = gamma
+
+
+# Back up the states start..end-1 reading from one value buffer and writing
+# to the other. Returns the largest change in value in the tile.
+def _sweep_tile(arguments):
+    start, end, read_buffer = arguments
+
+    state = _worker_state
+    number_of_actions = state['number_of_actions']
+    v_read = state['values'][read_buffer]
+    v_write = state['values'][1 - read_buffer]
+    p_tile, r_tile = state['tile_models'][(start, end)]
+
+    # The maximum over the actions is taken one action at a time, which is
+    # much faster than np.max along the short last axis
+    q = r_tile + state['gamma'] * (p_tile @ v_read)
+    new_v = q[0::number_of_actions].copy()
+    for a in range(1, number_of_actions):
+        np.maximum(new_v, q[a::number_of_actions], out=new_v)
+    delta = np.max(np.abs(new_v - v_read[start:end]))
+    v_write[start:end] = new_v
+
+    return delta
+
+
+class ParallelValueIterator(ValueIterator):
+
+    def __init__(self, environment):
+        ValueIterator.__init__(self, environment)
+
+        # The policy is extracted from the compiled transition model
+        self._use_vectorized_sweeps = True
+
+        # The number of worker processes
+        self._number_of_processes = os.cpu_count()
+
+        # The number of tiles the map is split into. If not set, there is
+        # one tile per process.
+        self._number_of_tiles = None
+
+    # Set the number of worker processes
+    def set_number_of_processes(self, number_of_processes):
+        self._number_of_processes = number_of_processes
+
+    # Set the number of tiles the map is split into
+    def set_number_of_tiles(self, number_of_tiles):
+        self._number_of_tiles = number_of_tiles
+
+    # Split the non-terminal states into tiles of whole columns. The states are
+    # numbered column by column, so each tile is a contiguous range of ids.
+    def _tiles(self, model):
+        n = model.number_of_non_terminal_states()
+        state_x = model.state_coords()[0][:n]
+
+        number_of_tiles = self._number_of_tiles
+        if number_of_tiles is None:
+            number_of_tiles = self._number_of_processes
+
+        # Aim for equal numbers of states, and move each cut back to the start
+        # of the column it falls in
+        if n == 0:
+            return []
+        targets = np.linspace(0, n, number_of_tiles + 1).astype(np.intp)[1:-1]
+        cuts = np.unique(np.concatenate(([0], np.searchsorted(state_x, state_x[targets]), [n])))
+
+        return [(int(start), int(end)) for start, end in zip(cuts[:-1], cuts[1:]) if end > start]
+
+    def _compute_optimal_value_function(self):
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+
+        tiles = self._tiles(model)
+
+        # Reorder the rows from (action, state) to (state, action)
+        number_of_actions = len(model.actions())
+        rows = (np.arange(number_of_actions) * n + np.arange(n)[:, np.newaxis]).reshape(-1)
+        stacked_p, stacked_r = model.state_transitions(np.arange(n))
+        stacked_p = stacked_p[rows]
+        stacked_r = stacked_r[rows]
+        v = model.state_values(self._v)
+
+        # Place the model and the value buffers in shared memory
+        arrays = {
+            'data': stacked_p.data,
+            'indices': stacked_p.indices,
+            'indptr': stacked_p.indptr,
+            'rewards': stacked_r,
+            'values_0': v,
+            'values_1': v
+            }
+
+        blocks = {}
+        shared = {}
+
+        try:
+            for key, array in arrays.items():
+                blocks[key], shared[key] = _create_shared_array(array)
+
+            descriptions = {key: (blocks[key].name, shared[key].shape, shared[key].dtype) for key in arrays}
+
+            with multiprocessing.Pool(self._number_of_processes, initializer=_initialize_worker, \
+                                      initargs=(descriptions, tiles, number_of_actions, self._gamma)) as pool:
+
+                iteration = 0
+                read_buffer = 0
+
+                while True:
+
+                    # Each call is a barrier; all tiles have been written when it returns
+                    deltas = pool.map(_sweep_tile, [(start, end, read_buffer) for start, end in tiles])
+                    delta = max(deltas, default = 0)
+
+                    read_buffer = 1 - read_buffer
+
+                    # Increment the iteration counter
+                    iteration += 1
+                    self._number_of_backups += n
+
+                    self._print_sweep(f'Finished value iteration step {iteration}')
+
+                    yield self._snapshot(SolverStep.VALUE_ITERATION_SWEEP, iteration, delta, None, \
+                                         lambda: model.set_non_terminal_state_values( \
+                                             self._v, shared['values_' + str(read_buffer)][:n]))
+
+                    # Terminate the loop if the change was very small (ie. convergence is reached)
+                    if delta < self._theta:
+                        break
+
+                    if iteration >= self._max_optimal_value_function_iterations:
+                        print('Maximum number of iterations exceeded')
+                        break
+
+            model.set_non_terminal_state_values(self._v, shared['values_' + str(read_buffer)][:n])
+
+        finally:
+            shared.clear()
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+
+        return iteration
@@ -5,6 +5,7 @@ Created on 31 Jan 2023
 '''
 
 from .dynamic_programming_base import DynamicProgrammingBase
+from .solver_snapshot import SolverStep
 
 
 class PolicyEvaluator(DynamicProgrammingBase):
@@ -26,11 +27,34 @@ class PolicyEvaluator(DynamicProgrammingBase):
         self.initialize()
         
         
+    # Evaluate the policy. Returns True if the evaluation converged.
     def evaluate(self):
+        return self._run_to_completion(self.iter_solve())
         
-        # Get the environment and map
+    # The evaluation was stopped before it converged
+    def _interrupted_solve_result(self, snapshot):
+        return False
+
+    # Evaluate the policy one sweep at a time (see DynamicProgrammingBase.iter_solve).
+    # The evaluation depends on the policy, which is not part of the cache
+    # key, so the cache is never used. Returns True if the evaluation converged.
+    def iter_solve(self, bypass_cache = False):
+        
+        if self._use_vectorized_sweeps is True:
+            _, converged = yield from self._evaluate_policy_vectorized( \
+                self._max_policy_evaluation_steps_per_iteration)
+            return converged
+        
+        if self.use_jit_sweeps() is True:
+            _, converged = yield from self._evaluate_policy_jit(self._max_policy_evaluation_steps_per_iteration)
+            return converged
+        
+        # Get the environment
         environment = self._environment
-        map = environment.map()
+
+        # Only the non-terminal states are visited; the state index leaves
+        # out the terminal and obstruction states
+        state_index = environment.state_index()
         
         # Execute the loop at least once
         
@@ -41,45 +65,44 @@ class PolicyEvaluator(DynamicProgrammingBase):
             delta = 0
 
             # Sweep systematically over all the states            
-            for x in range(map.width()):
-                for y in range(map.height()):
-                    
-                    # We skip obstructions and terminals. If a cell is obstructed,
-                    # there's no action the robot can take to access it, so it doesn't
-                    # count. If the cell is terminal, it executes the terminal action
-                    # state. The value of the value of the terminal cell is the reward.
-                    # The reward itself was set up as part of the initial conditions for the
-                    # value function.
-                    if map.cell(x, y).is_obstruction() or map.cell(x, y).is_terminal():
-                        continue
-                                       
-                    # Unfortunately the need to use coordinates is a bit inefficient, due
-                    # to legacy code
-                    cell = (x, y)
-                    
-                    # Get the previous value function
-                    old_v = self._v.value(x, y)
+            for x, y in state_index.non_terminal_cells():
+                
+                # Obstructions and terminals are not visited. If a cell is obstructed,
+                # there's no action the robot can take to access it, so it doesn't
+                # count. If the cell is terminal, it executes the terminal action
+                # state. The value of the value of the terminal cell is the reward.
+                # The reward itself was set up as part of the initial conditions for the
+                # value function.
+
+                # Unfortunately the need to use coordinates is a bit inefficient, due
+                # to legacy code
+                cell = (x, y)
+                
+                # Get the previous value function
+                old_v = self._v.value(x, y)
 
-                    # Compute p(s',r|s,a)
-                    s_prime, r, p = environment.next_state_and_reward_distribution(cell, \
-                                                                                     self._pi.action(x, y))
+                # Compute p(s',r|s,a)
+                s_prime, r, p = environment.next_state_and_reward_distribution(cell, \
+                                                                                 self._pi.action(x, y))
+                
+                # Sum over the rewards
+                new_v = 0
+                for t in range(len(p)):
+                    sc = s_prime[t].coords()
+                    new_v = new_v + p[t] * (r[t] + self._gamma * self._v.value(sc[0], sc[1]))                        
                     
-                    # Sum over the rewards
-                    new_v = 0
-                    for t in range(len(p)):
-                        sc = s_prime[t].coords()
-                        new_v = new_v + p[t] * (r[t] + self._gamma * self._v.value(sc[0], sc[1]))                        
-                        
-                    # Set the new value in the value function
-                    self._v.set_value(x, y, new_v)
-                                        
-                    # Update the maximum deviation
-                    delta = max(delta, abs(old_v-new_v))
+                # Set the new value in the value function
+                self._v.set_value(x, y, new_v)
+                                    
+                # Update the maximum deviation
+                delta = max(delta, abs(old_v-new_v))
  
             # Increment the policy evaluation counter        
             iteration += 1
                        
-            print(f'Finished policy evaluation iteration {iteration}')
+            self._print_sweep(f'Finished policy evaluation iteration {iteration}')
+            
+            yield self._snapshot(SolverStep.POLICY_EVALUATION_SWEEP, iteration, delta, 0)
             
             # Terminate the loop if the change was very small
             if delta < self._theta:
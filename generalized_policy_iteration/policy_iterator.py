@@ -6,14 +6,35 @@ Created on 29 Jan 2022
 
 # This class implements the policy iterator algorithm.
 
-import copy
+import math
+import time
 
+import numpy as np
+from scipy.sparse import identity
+from scipy.sparse.linalg import LinearOperator, bicgstab, gmres, spilu, spsolve
+
+from . import jit_sweeps
 from .dynamic_programming_base import DynamicProgrammingBase
+from .solver_snapshot import SolverStep
 from enum import IntEnum
 
 
+# How the value of the current policy is computed in each policy iteration step.
+# ITERATIVE runs sweeps until the change is below theta or the maximum number of
+# evaluation steps is reached. The others solve the linear system
+# (I - gamma P_pi) v = r_pi directly, either with a sparse LU factorization
+# or with an ILU-preconditioned Krylov solver, which is better for large maps.
+class PolicyEvaluationMethod(IntEnum):
+    ITERATIVE = 0
+    DIRECT = 1
+    GMRES = 2
+    BICGSTAB = 3
+
+
 class PolicyIterator(DynamicProgrammingBase):
 
+    _supports_deterministic_solver = True
+
     def __init__(self, environment):
         DynamicProgrammingBase.__init__(self, environment)
         
@@ -28,18 +49,70 @@ class PolicyIterator(DynamicProgrammingBase):
         
         # The number of policy evaluation iterations per policy iteration
         self.policy_evaluation_iteration_counts = []        
+        
+        # The method used to evaluate the policy
+        self._policy_evaluation_method = PolicyEvaluationMethod.ITERATIVE
+        
+        # For the linear solve methods, the time taken (in seconds) and the
+        # maximum absolute residual of each policy evaluation
+        self.policy_evaluation_solve_times = []
+        self.policy_evaluation_residuals = []
+        
+        # For the linear solve methods, the number of sweeps over the states
+        # which were left out of the solve in each policy evaluation
+        self.improper_state_sweep_counts = []
+        
+        # For the linear solve methods, whether each solve failed, so that the
+        # policy was evaluated iteratively instead
+        self.linear_solve_fallbacks = []
+        
+        # If set, the number of policy evaluation sweeps in each step is chosen
+        # automatically (modified policy iteration), rather than sweeping until
+        # the change is below theta
+        self._use_adaptive_policy_evaluation = False
+        
+        # The fraction of the Bellman residual that the adaptive evaluation
+        # reduces the change per sweep to. This is a tuned value (see
+        # _adaptive_policy_evaluation_tolerance).
+        self._adaptive_evaluation_tolerance_ratio = 0.1
+        
+        # The Bellman residual max_s |max_a Q(s, a) - v(s)| and the number of
+        # actions which changed in the last policy improvement step
+        self._last_bellman_residual = float('inf')
+        self._last_number_of_changed_actions = None
+        
+        # The tolerance used in the last adaptive policy evaluation
+        self._last_policy_evaluation_tolerance = float('inf')
+
+    # Set the method used to evaluate the policy
+    def set_policy_evaluation_method(self, policy_evaluation_method):
+        self._policy_evaluation_method = PolicyEvaluationMethod(policy_evaluation_method)
+
+    # Return the method used to evaluate the policy
+    def policy_evaluation_method(self):
+        return self._policy_evaluation_method
+
+    # Set if the number of policy evaluation sweeps is chosen automatically
+    def set_use_adaptive_policy_evaluation(self, use_adaptive_policy_evaluation):
+        self._use_adaptive_policy_evaluation = use_adaptive_policy_evaluation
+
+    # Set the fraction of the Bellman residual used by the adaptive evaluation
+    def set_adaptive_evaluation_tolerance_ratio(self, adaptive_evaluation_tolerance_ratio):
+        self._adaptive_evaluation_tolerance_ratio = adaptive_evaluation_tolerance_ratio
 
     # Perform policy evaluation for the current policy, and return
     # a copy of the state value function. Since this is a deep copy, you can modify it
     # however you like.
     def evaluate_policy(self):
-        self._evaluate_policy()
+        self._run_to_completion(self._evaluate_policy())
         
         #v = copy.deepcopy(self._v)
         
         return self._v
         
-    def solve_policy(self):
+    # Policy iteration yields a snapshot after every policy evaluation sweep
+    # and after every policy improvement step.
+    def _solve_policy_steps(self):
                             
         # Initialize the drawers if defined
         if self._policy_drawer is not None:
@@ -52,16 +125,27 @@ class PolicyIterator(DynamicProgrammingBase):
         policy_iteration_step = 0        
         policy_stable = False
         
+        self._last_bellman_residual = float('inf')
+        self._last_number_of_changed_actions = None
+        
         # Loop until either the policy converges or we ran out of steps        
         while (policy_stable is False) and \
             (policy_iteration_step < self._max_policy_iteration_steps):
             
             # Evaluate the policy
-            policy_evaluation_iterations = self._evaluate_policy()
+            policy_evaluation_iterations = yield from self._evaluate_policy()
 
             # Improve the policy            
             policy_stable = self._improve_policy()
             
+            # With adaptive evaluation, the policy can stop changing before its
+            # values have been evaluated to theta. If so, carry on for one more
+            # step, in which the evaluation is run to theta.
+            if (policy_stable is True) and (self._use_adaptive_policy_evaluation is True) and \
+                (self._last_bellman_residual >= self._theta) and \
+                (self._last_policy_evaluation_tolerance > self._theta):
+                policy_stable = False
+            
             # Update the drawers if needed
             if self._policy_drawer is not None:
                 self._policy_drawer.update()
@@ -73,6 +157,12 @@ class PolicyIterator(DynamicProgrammingBase):
 
             # Store the number of iterations
             self.policy_evaluation_iteration_counts.append(policy_evaluation_iterations)
+            
+            bellman_residual = self._last_bellman_residual if math.isfinite(self._last_bellman_residual) else None
+            yield self._snapshot(SolverStep.POLICY_IMPROVEMENT, policy_iteration_step, bellman_residual, \
+                                 self._last_number_of_changed_actions)
+
+        self._record_solved_map_version()
 
         # Draw one last time to clear any transients which might
         # draw changes
@@ -87,13 +177,63 @@ class PolicyIterator(DynamicProgrammingBase):
         # Return the value function, policy, number of overall iterations and number of iterations within the evaluation of the solution
         return self._v, self._pi, policy_iteration_step, total_policy_evaluation_iterations
 
+    # If policy iteration is stopped early, the policy is improved once more
+    # with the values reached so far. The statistics include the evaluation
+    # sweeps of the step which was stopped.
+    def _interrupted_solve_result(self, snapshot):
+        self._extract_greedy_policy()
+        
+        total_policy_evaluation_iterations = sum(self.policy_evaluation_iteration_counts)
+        if snapshot.step() is SolverStep.POLICY_EVALUATION_SWEEP:
+            total_policy_evaluation_iterations += snapshot.iteration()
+        
+        return self._v, self._pi, len(self.policy_evaluation_iteration_counts), total_policy_evaluation_iterations
+
+    # The shortest path solver counts as one policy iteration step, and its
+    # checking sweeps as the evaluation sweeps
+    def _deterministic_solve_statistics(self, number_of_sweeps, residual):
+        self.policy_evaluation_iteration_counts.append(number_of_sweeps)
+        return 1, number_of_sweeps
+
+    def _solution_cache_settings(self):
+        settings = DynamicProgrammingBase._solution_cache_settings(self)
+        settings.update({'max_policy_evaluation_steps_per_iteration': self._max_policy_evaluation_steps_per_iteration,
+                         'max_policy_iteration_steps': self._max_policy_iteration_steps,
+                         'policy_evaluation_method': int(self._policy_evaluation_method),
+                         'use_adaptive_policy_evaluation': self._use_adaptive_policy_evaluation,
+                         'adaptive_evaluation_tolerance_ratio': self._adaptive_evaluation_tolerance_ratio})
+        return settings
+
 
         
+    # Evaluate the policy. This is a generator which yields a snapshot after
+    # every sweep, and returns the number of sweeps.
     def _evaluate_policy(self):
         
-        # Get the environment and map
+        if self._policy_evaluation_method is not PolicyEvaluationMethod.ITERATIVE:
+            return (yield from self._evaluate_policy_by_linear_solve())
+        
+        if self._use_adaptive_policy_evaluation is True:
+            self._last_policy_evaluation_tolerance = self._adaptive_policy_evaluation_tolerance()
+            iteration, _ = yield from self._evaluate_policy_vectorized( \
+                self._max_policy_evaluation_steps_per_iteration, self._last_policy_evaluation_tolerance)
+            return iteration
+        
+        if self._use_vectorized_sweeps is True:
+            iteration, _ = yield from self._evaluate_policy_vectorized( \
+                self._max_policy_evaluation_steps_per_iteration)
+            return iteration
+        
+        if self.use_jit_sweeps() is True:
+            iteration, _ = yield from self._evaluate_policy_jit(self._max_policy_evaluation_steps_per_iteration)
+            return iteration
+        
+        # Get the environment
         environment = self._environment
-        map = environment.map()
+
+        # Only the non-terminal states are visited; the state index leaves
+        # out the terminal and obstruction states
+        state_index = environment.state_index()
         
         # Execute the loop at least once
         
@@ -104,45 +244,44 @@ class PolicyIterator(DynamicProgrammingBase):
             delta = 0
 
             # Sweep systematically over all the states            
-            for x in range(map.width()):
-                for y in range(map.height()):
-                    
-                    # We skip obstructions and terminals. If a cell is obstructed,
-                    # there's no action the robot can take to access it, so it doesn't
-                    # count. If the cell is terminal, it executes the terminal action
-                    # state. The value of the value of the terminal cell is the reward.
-                    # The reward itself was set up as part of the initial conditions for the
-                    # value function.
-                    if map.cell(x, y).is_obstruction() or map.cell(x, y).is_terminal():
-                        continue
-                                       
-                    # Unfortunately the need to use coordinates is a bit inefficient, due
-                    # to legacy code
-                    cell = (x, y)
-                    
-                    # Get the previous value function
-                    old_v = self._v.value(x, y)
+            for x, y in state_index.non_terminal_cells():
+                
+                # Obstructions and terminals are not visited. If a cell is obstructed,
+                # there's no action the robot can take to access it, so it doesn't
+                # count. If the cell is terminal, it executes the terminal action
+                # state. The value of the value of the terminal cell is the reward.
+                # The reward itself was set up as part of the initial conditions for the
+                # value function.
+
+                # Unfortunately the need to use coordinates is a bit inefficient, due
+                # to legacy code
+                cell = (x, y)
+                
+                # Get the previous value function
+                old_v = self._v.value(x, y)
 
-                    # Compute p(s',r|s,a)
-                    s_prime, r, p = environment.next_state_and_reward_distribution(cell, \
-                                                                                     self._pi.action(x, y))
+                # Compute p(s',r|s,a)
+                s_prime, r, p = environment.next_state_and_reward_distribution(cell, \
+                                                                                 self._pi.action(x, y))
+                
+                # Sum over the rewards
+                new_v = 0
+                for t in range(len(p)):
+                    sc = s_prime[t].coords()
+                    new_v = new_v + p[t] * (r[t] + self._gamma * self._v.value(sc[0], sc[1]))                        
                     
-                    # Sum over the rewards
-                    new_v = 0
-                    for t in range(len(p)):
-                        sc = s_prime[t].coords()
-                        new_v = new_v + p[t] * (r[t] + self._gamma * self._v.value(sc[0], sc[1]))                        
-                        
-                    # Set the new value in the value function
-                    self._v.set_value(x, y, new_v)
-                                        
-                    # Update the maximum deviation
-                    delta = max(delta, abs(old_v-new_v))
+                # Set the new value in the value function
+                self._v.set_value(x, y, new_v)
+                                    
+                # Update the maximum deviation
+                delta = max(delta, abs(old_v-new_v))
  
             # Increment the policy evaluation counter        
             iteration += 1
                        
-            print(f'Finished policy evaluation iteration {iteration}')
+            self._print_sweep(f'Finished policy evaluation iteration {iteration}')
+            
+            yield self._snapshot(SolverStep.POLICY_EVALUATION_SWEEP, iteration, delta, 0)
             
             # Terminate the loop if the change was very small
             if delta < self._theta:
@@ -156,56 +295,303 @@ class PolicyIterator(DynamicProgrammingBase):
                 # return False
                 return iteration
 
+    # Evaluate the policy exactly by solving the linear system
+    #
+    # (I - gamma P_nn) v_n = r_pi + gamma P_nt v_t
+    #
+    # where n are the non-terminal states and t the terminal ones, whose values
+    # are fixed. If gamma = 1 and the policy never reaches a terminal state from
+    # some states, the system is singular and the values of those states are
+    # unbounded. Therefore the exact solve is only carried out over the states
+    # from which the policy is proper, and the remaining states are updated
+    # with the capped iterative sweeps (see _evaluate_improper_states). Like
+    # _evaluate_policy, this is a generator. It returns the number of
+    # iterations of the solve, which counts as one for the direct solve; the
+    # sweeps over the remaining states are recorded separately in
+    # improper_state_sweep_counts.
+    def _evaluate_policy_by_linear_solve(self):
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+        
+        p_pi, r_pi = model.policy_transitions(model.policy_action_indices(self._pi))
+        v = model.state_values(self._v)
+        
+        if self._gamma < 1:
+            proper = np.arange(n)
+        else:
+            proper = np.flatnonzero(self._proper_states(p_pi, n))
+            
+        p_proper = p_pi[proper]
+        a = (identity(len(proper), format='csc') - self._gamma * p_proper[:, proper]).tocsc()
+        b = r_pi[proper] + self._gamma * (p_proper[:, n:] @ v[n:])
+        
+        start_time = time.time()
+        
+        iterations = 1
+        
+        try:
+            if len(proper) == 0:
+                new_v = np.zeros(0)
+            elif self._policy_evaluation_method is PolicyEvaluationMethod.DIRECT:
+                new_v = spsolve(a, b)
+            else:
+                # Count the Krylov iterations through the callback
+                iterations = 0
+                def count_iterations(_):
+                    nonlocal iterations
+                    iterations += 1
+                    
+                # The solve is accepted if the largest residual is below theta,
+                # so the tolerance is absolute. The 2-norm of the residual which
+                # the solvers test bounds the largest residual.
+                ilu = spilu(a)
+                preconditioner = LinearOperator(a.shape, ilu.solve)
+                if self._policy_evaluation_method is PolicyEvaluationMethod.GMRES:
+                    new_v, _ = gmres(a, b, x0=v[proper], rtol=0, atol=self._theta, M=preconditioner, \
+                                     callback=count_iterations, callback_type='pr_norm')
+                else:
+                    new_v, _ = bicgstab(a, b, x0=v[proper], rtol=0, atol=self._theta, M=preconditioner, \
+                                        callback=count_iterations)
+                iterations = max(iterations, 1)
+        except RuntimeError:
+            # The factorization fails if the matrix is numerically singular
+            new_v = np.full(len(proper), np.nan)
+            
+        solve_time = time.time() - start_time
+            
+        residual = np.max(np.abs(a @ new_v - b)) if len(proper) > 0 else 0
+        
+        delta = 0
+        solved = np.all(np.isfinite(new_v)) and (residual <= self._theta)
+        if solved:
+            delta = np.max(np.abs(new_v - v[proper]), initial = 0)
+            v[proper] = new_v
+            model.set_non_terminal_state_values(self._v, v[:n])
+        else:
+            print(f'Linear solve failed (residual={residual}); using iterative policy evaluation')
+            proper = np.zeros(0, dtype=np.intp)
+            
+        self._print_sweep(f'Finished policy evaluation in {solve_time:.3g}s with residual {residual:.3g}')
+        
+        yield self._snapshot(SolverStep.POLICY_EVALUATION_SWEEP, iterations, delta, 0)
+        
+        # Any states which were not solved for are evaluated iteratively
+        improper_state_sweeps = 0
+        if len(proper) < n:
+            improper = np.ones(n, dtype=bool)
+            improper[proper] = False
+            improper_state_sweeps = yield from self._evaluate_improper_states(model, p_pi, r_pi, v, \
+                                                                              np.flatnonzero(improper))
+        
+        self.policy_evaluation_solve_times.append(solve_time)
+        self.policy_evaluation_residuals.append(residual)
+        self.improper_state_sweep_counts.append(improper_state_sweeps)
+        self.linear_solve_fallbacks.append(not solved)
+        
+        return iterations
+    
+    # Sweep the states which were left out of the linear solve. The values of
+    # the solved states are already at their fixed point, so they are held
+    # fixed, and only the rows of the improper states are swept. v is the
+    # vector of all the state values, which is updated. Like
+    # _evaluate_policy, this is a generator. Returns the number of sweeps.
+    def _evaluate_improper_states(self, model, p_pi, r_pi, v, improper):
+        n = model.number_of_non_terminal_states()
+        
+        p_improper = p_pi[improper]
+        p_improper_to_improper = p_improper[:, improper]
+        
+        # The part of the backup which comes from the fixed states
+        fixed_v = v.copy()
+        fixed_v[improper] = 0
+        b = r_pi[improper] + self._gamma * (p_improper @ fixed_v)
+        
+        def write_values():
+            v[improper] = improper_v
+            model.set_non_terminal_state_values(self._v, v[:n])
+        
+        improper_v = v[improper]
+        iteration = 0
+        
+        while True:
+            new_improper_v = b + self._gamma * (p_improper_to_improper @ improper_v)
+            
+            delta = np.max(np.abs(new_improper_v - improper_v))
+            improper_v = new_improper_v
+            
+            iteration += 1
+            
+            yield self._snapshot(SolverStep.POLICY_EVALUATION_SWEEP, iteration, delta, 0, write_values)
+            
+            if delta < self._theta:
+                break
+            
+            if iteration >= self._max_policy_evaluation_steps_per_iteration:
+                print('Maximum number of iterations exceeded')
+                break
+        
+        write_values()
+        
+        print(f'Swept the {len(improper)} states left out of the solve {iteration} times')
+        
+        return iteration
+    
+    # Choose the tolerance on the change per sweep for the adaptive policy
+    # evaluation. This is a heuristic, tuned on the airport maps, and not a
+    # bound: nothing guarantees that the greedy policy of the partly evaluated
+    # values is the one full evaluation would give. The idea is that there is
+    # little point evaluating the policy much more accurately than the
+    # distance to the optimal value function, which is measured by the Bellman
+    # residual, so the tolerance is a fraction of it. If only a few actions
+    # changed, the fraction is scaled up by sqrt(n / changed), so the
+    # evaluation stops earlier. The solution is still correct because, once
+    # the policy stops changing, it is evaluated to theta.
+    def _adaptive_policy_evaluation_tolerance(self):
+        changed = self._last_number_of_changed_actions
+        
+        # Before the first improvement, do a single sweep
+        if changed is None:
+            return float('inf')
+        
+        if changed == 0:
+            return self._theta
+        
+        n = self._transition_model().number_of_non_terminal_states()
+        ratio = min(1, self._adaptive_evaluation_tolerance_ratio * math.sqrt(n / changed))
+        
+        return max(self._theta, ratio * self._last_bellman_residual)
+
+    # The amount by which the greedy action must be better than the current
+    # one for the action in a state to be changed. When the policy is
+    # evaluated exactly (by the direct or Krylov solves), actions whose values
+    # differ only by rounding error would otherwise keep being swapped, and
+    # policy iteration would never stop, so this is theta. With iterative
+    # evaluation the greedy action is always taken.
+    def _improvement_tolerance(self):
+        if self._policy_evaluation_method is PolicyEvaluationMethod.ITERATIVE:
+            return -np.inf
+        return self._theta
+
+    # Policy improvement. The action in a state is only changed if the greedy
+    # action is better than the current one by more than the improvement
+    # tolerance.
     def _improve_policy(self) -> bool:
+        
+        if (self._use_vectorized_sweeps is True) or (self._use_adaptive_policy_evaluation is True):
+            return self._improve_policy_vectorized()
+        
+        if self.use_jit_sweeps() is True:
+            return self._improve_policy_jit()
+        
         environment = self._environment
-        map = environment.map()
+
+        # Only the non-terminal states are visited; the state index leaves
+        # out the terminal and obstruction states
+        state_index = environment.state_index()
 
         # Actions the robot might take in each cell are the octagonal actions
         # Integers represent the actions in LowLevelActionType
         actions = [0, 1, 2, 3, 4, 5, 6, 7]
 
-        policy_stable = True
+        # The actions before the improvement, used to check if the policy is stable
+        previous_actions = self._pi.actions().copy()
+        
+        tolerance = self._improvement_tolerance()
 
         # Iterate over all states
-        for x in range(map.width()):
-            for y in range(map.height()):
+        for x, y in state_index.non_terminal_cells():
 
-                # Skip terminal and obstruction states
-                if map.cell(x, y).is_obstruction() or map.cell(x, y).is_terminal():
-                    continue
+            cell = (x, y)
 
-                cell = (x, y)
+            # Initialize variables to find the new best action and its value
+            new_best_a = None
+            new_best_v = float('-inf')
+            
+            current_a = int(self._pi.action(x, y))
+            current_v = None
+
+            # Iterate over all possible actions
+            for new_a in actions:
+                # Compute p(s',r|s,a)
+                s_prime, r, p = environment.next_state_and_reward_distribution(cell, new_a)
 
-                # Initialize variables to find the new best action and its value
-                new_best_a = None
-                new_best_v = float('-inf')
+                # Sum over the rewards
+                new_v = 0
+                for t in range(len(p)):
+                    sc = s_prime[t].coords()
+                    new_v = new_v + p[t] * (r[t] + self._gamma * self._v.value(sc[0], sc[1]))
 
-                # Iterate over all possible actions
-                for new_a in actions:
-                    # Compute p(s',r|s,a)
-                    s_prime, r, p = environment.next_state_and_reward_distribution(cell, new_a)
+                if new_a == current_a:
+                    current_v = new_v
 
-                    # Sum over the rewards
-                    new_v = 0
-                    for t in range(len(p)):
-                        sc = s_prime[t].coords()
-                        new_v = new_v + p[t] * (r[t] + self._gamma * self._v.value(sc[0], sc[1]))
+                # Update new best action and value if this action leads to a higher value
+                if new_v > new_best_v:
+                    new_best_a = new_a
+                    new_best_v = new_v
 
-                    # Update new best action and value if this action leads to a higher value
-                    if new_v > new_best_v:
-                        new_best_a = new_a
-                        new_best_v = new_v
+            # Update policy with the new best action if it is better enough
+            if (current_v is None) or (new_best_v > current_v + tolerance):
+                self._pi.set_action(x, y, new_best_a)
 
-                # Update policy if the new best action is different from the current best action
-                # Policy changed, so it's not stable
-                if new_best_a != self._pi.action(x, y):
-                    self._pi.set_action(x, y, new_best_a)
-                    policy_stable = False
+        # If any action changed, the policy is not stable
+        self._last_number_of_changed_actions = int(np.count_nonzero(self._pi.changed_cells(previous_actions)))
+        policy_stable = self._last_number_of_changed_actions == 0
 
         return policy_stable
 
+    # Policy improvement with the compiled kernel. Only the states whose action
+    # changed are written back.
+    def _improve_policy_jit(self) -> bool:
+        model = self._transition_model()
+        successors, probabilities, rewards = model.padded_outcomes()
+        
+        action_indices = model.policy_action_indices(self._pi)
+        previous_action_indices = action_indices.copy()
+        
+        changed = jit_sweeps.improve_policy(model.state_values(self._v), successors, probabilities, \
+                                            rewards, action_indices, self._gamma, \
+                                            self._improvement_tolerance())
+        
+        model.set_policy_action_indices(self._pi, action_indices, \
+                                        np.flatnonzero(action_indices != previous_action_indices))
+        
+        self._last_number_of_changed_actions = changed
+        
+        return changed == 0
+
+    # Vectorized policy improvement. The greedy action for every state is found
+    # at once, and only the states whose action changed are written back.
+    def _improve_policy_vectorized(self) -> bool:
+        model = self._transition_model()
+        
+        current_actions = model.policy_action_indices(self._pi)
+        q = model.q_values(model.state_values(self._v), self._gamma)
+        
+        best_actions = np.argmax(q, axis=0)
+        states = np.arange(q.shape[1])
+        best_values = q[best_actions, states]
+        
+        # States whose action is not one of the actions always change
+        current_values = np.where(current_actions >= 0, q[current_actions, states], -np.inf)
+        
+        # Policy changed, so it's not stable
+        changed = np.flatnonzero((best_actions != current_actions) & \
+                                 (best_values > current_values + self._improvement_tolerance()))
+        model.set_policy_action_indices(self._pi, best_actions, changed)
+        
+        # Record how far the values are from satisfying the Bellman optimality
+        # equation and how many actions changed
+        v = model.state_values(self._v)[:len(best_values)]
+        self._last_bellman_residual = np.max(np.abs(best_values - v)) if len(v) > 0 else 0
+        self._last_number_of_changed_actions = len(changed)
+        
+        return len(changed) == 0
                     
                 
+    # Set the maximum number of policy iteration steps
+    def set_max_policy_iteration_steps(self, max_policy_iteration_steps):
+        self._max_policy_iteration_steps = max_policy_iteration_steps
+
     def set_max_policy_evaluation_steps_per_iteration(self, \
                                                       max_policy_evaluation_steps_per_iteration):
             self._max_policy_evaluation_steps_per_iteration = max_policy_evaluation_steps_per_iteration
@@ -0,0 +1,118 @@
+# This is the main loop of prioritized sweeping. It is shared by the
+# prioritized sweeping solver and by the incremental repair of a solution
+# after the map has been edited.
+#
+# The priority of a state is an estimate of its Bellman error. When a state
+# is backed up and its value changes by delta, the Bellman error of each of
+# its predecessors can change by up to gamma * p(s|pred, a) * delta, and the
+# priority of the predecessor becomes the largest of these. The states whose
+# priority is at least theta are backed up in passes in state order, like a
+# Gauss-Seidel sweep which skips the states which cannot have changed. A
+# state raised during a pass is backed up later in the same pass if it comes
+# after the current one. Backing up the states in order of priority instead
+# (a heap) does more backups on the airport maps, because a state is backed
+# up again for every small change of its successors.
+#
+# The priorities are estimates, not bounds, so when no priority is left
+# above theta the Bellman error of every state is checked, and the sweeps
+# carry on from the states which have not converged. A check computes the
+# same values as backing up every state, so it is counted as n backups.
+
+import numpy as np
+
+
+# Back up the states until the Bellman error of every state is below theta.
+# v is the vector of all the state values, which is updated in place, and
+# priority is a list with the priority of every non-terminal state, which is
+# also updated in place. Returns the number of backups, including the
+# checks of every state, and whether the values have converged.
+def prioritized_sweep(model, v, priority, gamma, theta, max_number_of_backups):
+
+    n = model.number_of_non_terminal_states()
+    successors, probabilities, rewards = model.padded_outcomes()
+    predecessors = model.predecessors()
+
+    # Plain lists are much faster than arrays for single element access
+    predecessor_starts = predecessors.indptr.tolist()
+    predecessor_states = predecessors.indices.tolist()
+    predecessor_probabilities = (gamma * predecessors.data).tolist()
+    values = v.tolist()
+
+    # The outcomes of each state are converted to lists when it is first
+    # backed up, since a repair may only back up a few states
+    outcomes = [None] * n
+
+    backups = 0
+    converged = False
+
+    while (converged is False) and (backups < max_number_of_backups):
+
+        # Check every state once no priority is above theta
+        if max(priority, default = 0) < theta:
+            state_values = np.array(values)
+            errors = bellman_errors(np.max(model.q_values(state_values, gamma), axis=0), state_values[:n])
+            priority[:] = errors.tolist()
+            backups += n
+            converged = max(priority, default = 0) < theta
+            continue
+
+        for s in range(n):
+
+            if priority[s] < theta:
+                continue
+
+            if backups >= max_number_of_backups:
+                break
+
+            if outcomes[s] is None:
+                outcomes[s] = _outcome_lists(successors[s], gamma * probabilities[s], rewards[s])
+
+            # Back up the state
+            new_value = -np.inf
+            for a_successors, a_probabilities, a_reward in outcomes[s]:
+                q = a_reward
+                for s_prime, p in zip(a_successors, a_probabilities):
+                    q += p * values[s_prime]
+                if q > new_value:
+                    new_value = q
+
+            delta = abs(new_value - values[s]) if new_value != values[s] else 0.0
+            values[s] = new_value
+            priority[s] = 0.0
+            backups += 1
+
+            if delta == 0:
+                continue
+
+            # Raise the priorities of the predecessors
+            for i in range(predecessor_starts[s], predecessor_starts[s + 1]):
+                p = predecessor_states[i]
+                new_priority = predecessor_probabilities[i] * delta
+                if new_priority > priority[p]:
+                    priority[p] = new_priority
+
+    v[:] = values
+
+    return backups, converged
+
+
+# Return the Bellman errors |new_values - values|. A value of -inf, which a
+# state which cannot reach a terminal has if gamma = 1, backs up to -inf, so
+# the error is zero rather than nan when the values are equal.
+def bellman_errors(new_values, values):
+    with np.errstate(invalid='ignore'):
+        return np.where(new_values == values, 0.0, np.abs(new_values - values))
+
+
+# Return the outcomes of one state from the rows of the padded outcomes as a
+# list, for each action, of (successors, discounted probabilities, expected
+# reward). Missing outcomes are left out.
+def _outcome_lists(successors, discounted_probabilities, rewards):
+    outcomes = []
+
+    for a_successors, a_probabilities, a_reward in zip(successors.tolist(), discounted_probabilities.tolist(), \
+                                                       rewards.tolist()):
+        kept = [t for t, p in enumerate(a_probabilities) if p > 0]
+        outcomes.append(([a_successors[t] for t in kept], [a_probabilities[t] for t in kept], a_reward))
+
+    return outcomes
@@ -0,0 +1,85 @@
+# This class implements prioritized sweeping value iteration. Rather than
+# sweeping over every state on every iteration, only the states whose
+# Bellman error could be above theta are backed up (see prioritized_sweep).
+# The values start to change next to the terminals, so those states are the
+# only ones queued at first, and the changes spread out from there. Once the
+# values around a state have converged it is not backed up again, so most of
+# the work is spent on the frontier which is still changing.
+#
+# The priorities only choose which states are backed up. The states which
+# are chosen are swept in order of their ids, not in order of priority,
+# which does fewer backups on the airport maps (see prioritized_sweep).
+
+import numpy as np
+
+from .prioritized_sweep import prioritized_sweep
+from .solver_snapshot import SolverStep
+from .value_iterator import ValueIterator
+
+
+class PrioritizedSweepingValueIterator(ValueIterator):
+
+    def __init__(self, environment):
+        ValueIterator.__init__(self, environment)
+
+        # The policy is extracted from the compiled transition model
+        self._use_vectorized_sweeps = True
+
+        # The maximum number of backups. If not set, this is the number of
+        # backups value iteration would do with the maximum number of sweeps.
+        self._max_number_of_backups = None
+
+    # Set the maximum number of backups
+    def set_max_number_of_backups(self, max_number_of_backups):
+        self._max_number_of_backups = max_number_of_backups
+
+    def _solution_cache_settings(self):
+        settings = ValueIterator._solution_cache_settings(self)
+        settings['max_number_of_backups'] = self._max_number_of_backups
+        return settings
+
+    # There are no sweeps, so solve_policy returns the number of sweeps of
+    # the whole map the backups are equivalent to (the number of backups
+    # divided by the number of states, rounded up). The number of backups is
+    # given by number_of_backups. A single snapshot is yielded at the end,
+    # which has no delta.
+    def _compute_optimal_value_function(self):
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+
+        v = model.state_values(self._v)
+
+        max_number_of_backups = self._max_number_of_backups
+        if max_number_of_backups is None:
+            max_number_of_backups = self._max_optimal_value_function_iterations * n
+
+        # The initial priorities are the Bellman errors of the states which
+        # can move into a terminal. The other states are checked once these
+        # changes have spread as far as they go. The errors are computed for
+        # every state, so this counts as n backups.
+        priority = [0.0] * n
+        if n > 0:
+            predecessors = model.predecessors()
+            frontier = np.unique(predecessors.indices[predecessors.indptr[n]:])
+            errors = np.abs(np.max(model.q_values(v, self._gamma), axis=0) - v[:n])
+            for s, error in zip(frontier.tolist(), errors[frontier].tolist()):
+                priority[s] = error
+
+        backups, converged = prioritized_sweep(model, v, priority, self._gamma, self._theta, \
+                                               max_number_of_backups - n)
+        backups += n
+
+        if converged is False:
+            print('Maximum number of backups exceeded')
+
+        print(f'Finished prioritized sweeping after {backups} backups')
+
+        model.set_non_terminal_state_values(self._v, v[:n])
+
+        self._number_of_backups += backups
+
+        number_of_sweeps = -(-backups // n) if n > 0 else 0
+
+        yield self._snapshot(SolverStep.VALUE_ITERATION_SWEEP, number_of_sweeps, None, None)
+
+        return number_of_sweeps
@@ -0,0 +1,116 @@
+# This class stores solved MDPs on disk, so that solving the same problem
+# again (for example, in another script or after a restart) just loads the
+# answer. Each solution is stored in its own compressed file, named after a
+# hash of everything which affects the solution: the contents of the map,
+# the parameters of the environment, and the class and settings of the
+# solver. The file holds the value function, the policy and the statistics
+# which solve_policy returned.
+#
+# When the files take up more than the maximum size, the least recently used
+# ones are deleted. Loading a solution touches its file, so the modification
+# times record when each solution was last used.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+class SolutionCache(object):
+
+    def __init__(self, directory = os.path.join('~', '.cache', 'dynamic_programming_mdp'), \
+                 max_size_in_bytes = 100 * 1024 * 1024):
+        self._directory = os.path.expanduser(directory)
+        self._max_size_in_bytes = max_size_in_bytes
+
+        os.makedirs(self._directory, exist_ok = True)
+
+    # The directory the solutions are stored in
+    def directory(self):
+        return self._directory
+
+    # Set the maximum total size of the stored solutions
+    def set_max_size_in_bytes(self, max_size_in_bytes):
+        self._max_size_in_bytes = max_size_in_bytes
+        self._evict()
+
+    # Build the key for a solution. The map and environment are identified by
+    # the map's content hash and the environment's parameters, and the solver
+    # by its class and its settings.
+    def key(self, environment, solver_class, solver_settings):
+        description = json.dumps({
+            'map': environment.map().content_hash(),
+            'environment': environment.parameters(),
+            'solver': solver_class.__module__ + '.' + solver_class.__qualname__,
+            'settings': solver_settings}, sort_keys = True, default = str)
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + '.npz')
+
+    # Load the solution with the given key. Returns the (width, height) arrays
+    # of values and actions and the tuple of statistics, or None if the
+    # solution is not in the cache.
+    def load(self, key):
+        path = self._path(key)
+
+        try:
+            with np.load(path) as data:
+                values = data['values']
+                actions = data['actions']
+                statistics = tuple(json.loads(str(data['statistics'])))
+        except (OSError, KeyError, ValueError):
+            return None
+
+        # Mark the solution as recently used
+        os.utime(path)
+
+        return values, actions, statistics
+
+    # Store a solution under the given key, and then delete the least recently
+    # used solutions if the cache has grown too large
+    def store(self, key, values, actions, statistics):
+        path = self._path(key)
+
+        # Write to a temporary file first, so that a partly written file is
+        # never loaded
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            np.savez_compressed(file, values = values, actions = actions, \
+                                statistics = np.array(json.dumps(list(statistics))))
+        os.replace(temporary_path, path)
+
+        self._evict()
+
+    # Delete all the stored solutions
+    def clear(self):
+        for name in os.listdir(self._directory):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self._directory, name))
+
+    # Return the total size of the stored solutions
+    def size_in_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    # Return (path, size, last used time) for each stored solution
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self._directory):
+            if name.endswith('.npz'):
+                path = os.path.join(self._directory, name)
+                status = os.stat(path)
+                entries.append((path, status.st_size, status.st_mtime))
+        return entries
+
+    # Delete the least recently used solutions until the total size is
+    # below the maximum
+    def _evict(self):
+        entries = sorted(self._entries(), key = lambda entry: entry[2])
+        total_size = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if total_size <= self._max_size_in_bytes:
+                break
+            os.remove(path)
+            total_size -= size
@@ -0,0 +1,83 @@
+# The solvers carry out their sweeps as generators (see
+# DynamicProgrammingBase.iter_solve). After every sweep or policy improvement
+# step they yield one of these snapshots, which records the progress and
+# gives read-only views of the current value function and policy.
+#
+# The snapshots are cheap to make, so solve_policy, which just runs the
+# generator to the end, pays almost nothing for them. Some of the solvers
+# work on a vector of state values and only write it back into the value
+# function at the end. For those, the values are written back the first
+# time values() is called, rather than after every sweep. The views are of
+# the solver's own arrays, so they are only valid until the solver is
+# resumed; copy them to keep them.
+
+from enum import IntEnum
+
+
+# The kind of step a snapshot was taken after
+class SolverStep(IntEnum):
+    VALUE_ITERATION_SWEEP = 0
+    POLICY_EVALUATION_SWEEP = 1
+    POLICY_IMPROVEMENT = 2
+    TRIAL = 3
+
+
+class SolverSnapshot(object):
+
+    def __init__(self, step, iteration, delta, number_of_changed_actions, value_function, policy, \
+                 synchronize = None):
+        self._step = step
+        self._iteration = iteration
+        self._delta = delta
+        self._number_of_changed_actions = number_of_changed_actions
+        self._value_function = value_function
+        self._policy = policy
+
+        # Called to bring the value function up to date before it is read
+        self._synchronize = synchronize
+
+    # The kind of step (see SolverStep)
+    def step(self):
+        return self._step
+
+    # The number of the sweep or improvement step, counting from one. Policy
+    # evaluation sweeps are counted from the start of each evaluation.
+    def iteration(self):
+        return self._iteration
+
+    # The largest change in a value in the step. For policy improvement, this
+    # is the Bellman residual if the solver measured it, and None otherwise.
+    def delta(self):
+        return self._delta
+
+    # The number of states whose action changed. This is None for value
+    # iteration sweeps, which do not change the policy.
+    def number_of_changed_actions(self):
+        return self._number_of_changed_actions
+
+    # A read-only view of the (width, height) array of values
+    def values(self):
+        if self._synchronize is not None:
+            self._synchronize()
+            self._synchronize = None
+        return _read_only(self._value_function.values())
+
+    # A read-only view of the (width, height) array of actions
+    def actions(self):
+        return _read_only(self._policy.actions())
+
+
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+# Run the steps of a solver to the end, discarding the snapshots, and return
+# the result of the generator
+def run_to_completion(steps):
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
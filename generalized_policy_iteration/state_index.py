@@ -0,0 +1,115 @@
+# This class numbers the states of a map. Only the cells which are not
+# obstructions are states. The non-terminal states have the ids 0..n-1, in
+# the order of their (x, y) coordinates, and the terminal states follow them.
+# The solvers then work with 1-D vectors which hold one entry per state,
+# rather than arrays covering the whole map, so the memory and the time per
+# sweep depend on the amount of free space rather than on the size of the map.
+#
+# Values and actions are gathered from the (width, height) arrays of the
+# value functions and policies into state vectors, and scattered back. If
+# every cell of the map is a non-terminal state, the state vector is a view
+# onto the array, and no copy is made.
+
+import numpy as np
+
+
+class StateIndex(object):
+
+    def __init__(self, environment_map):
+
+        # Record the map version, so the index can be rebuilt when the map changes
+        self._map_version = environment_map.version()
+
+        self._width = environment_map.width()
+        self._height = environment_map.height()
+
+        obstruction_mask = environment_map.obstruction_mask()
+        terminal_mask = environment_map.terminal_mask()
+
+        non_terminal_x, non_terminal_y = np.nonzero(~obstruction_mask & ~terminal_mask)
+        terminal_x, terminal_y = np.nonzero(~obstruction_mask & terminal_mask)
+
+        self._number_of_non_terminal_states = len(non_terminal_x)
+        self._number_of_states = len(non_terminal_x) + len(terminal_x)
+
+        self._state_x = np.concatenate((non_terminal_x, terminal_x)).astype(np.intp)
+        self._state_y = np.concatenate((non_terminal_y, terminal_y)).astype(np.intp)
+
+        # Lookup from the cell coordinates to the state id; -1 for obstructions
+        self._state_ids = np.full((self._width, self._height), -1, dtype=np.intp)
+        self._state_ids[self._state_x, self._state_y] = np.arange(self._number_of_states)
+
+        # If every cell is a non-terminal state, the state ids are the same as
+        # the positions of the cells in the flattened arrays
+        self._covers_every_cell = self._number_of_non_terminal_states == self._width * self._height
+
+        # The coordinates of the non-terminal states as a list of tuples;
+        # built the first time they are needed
+        self._non_terminal_cells = None
+
+    # The version of the map when the index was built
+    def map_version(self):
+        return self._map_version
+
+    # The total number of (non-obstructed) states
+    def number_of_states(self):
+        return self._number_of_states
+
+    # The number of non-terminal states. These have ids 0..n-1.
+    def number_of_non_terminal_states(self):
+        return self._number_of_non_terminal_states
+
+    # The (x, y) coordinates of every state, indexed by state id
+    def state_coords(self):
+        return self._state_x, self._state_y
+
+    # The (width, height) array mapping cells to state ids
+    def state_ids(self):
+        return self._state_ids
+
+    # The id of the state in a cell, or -1 if the cell is an obstruction
+    def state_id(self, x, y):
+        return int(self._state_ids[x, y])
+
+    # The coordinates of a state
+    def coords(self, state_id):
+        return int(self._state_x[state_id]), int(self._state_y[state_id])
+
+    # Return the coordinates of the non-terminal states as a list of (x, y)
+    # tuples in order of state id. The solvers which visit the states one at
+    # a time iterate over this.
+    def non_terminal_cells(self):
+        if self._non_terminal_cells is None:
+            n = self._number_of_non_terminal_states
+            self._non_terminal_cells = list(zip(self._state_x[:n].tolist(), self._state_y[:n].tolist()))
+        return self._non_terminal_cells
+
+    # Gather the entries of a (width, height) array for every state
+    def gather(self, grid):
+        if self._covers_every_cell is True:
+            return grid.reshape(-1)
+        return grid[self._state_x, self._state_y]
+
+    # Write the entries of the non-terminal states back into a (width, height) array
+    def scatter(self, grid, values):
+        n = self._number_of_non_terminal_states
+        if self._covers_every_cell is True:
+            grid.reshape(-1)[:] = values
+        else:
+            grid[self._state_x[:n], self._state_y[:n]] = values
+
+    # Gather the values of all the states from a tabular value function
+    def state_values(self, v):
+        return self.gather(v.values())
+
+    # Write the values of the non-terminal states back into a tabular value function
+    def set_non_terminal_state_values(self, v, new_values):
+        self.scatter(v.values(), new_values)
+
+    # Gather the actions of the non-terminal states from a policy
+    def non_terminal_state_actions(self, pi):
+        return self.gather(pi.actions())[:self._number_of_non_terminal_states]
+
+    # Write the actions of the non-terminal states into a policy
+    def set_non_terminal_state_actions(self, pi, actions):
+        self.scatter(pi.actions(), actions)
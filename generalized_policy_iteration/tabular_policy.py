@@ -6,7 +6,10 @@ Created on 29 Jan 2022
 
 # This grid should be used to store the policy at each cell.
 # The action is very system dependent, and so we can't provide
-# any more details at this level in the class
+# any more details at this level in the class. However, the actions
+# are always small integers, so they are stored in an int8 array.
+
+import numpy as np
 
 from grid_search.grid import Grid
 
@@ -16,9 +19,27 @@ class TabularPolicy(Grid):
     def __init__(self, name, environment_map, set_random = False):
         Grid.__init__(self, name, \
                       environment_map.width(), environment_map.height())
+        
+        self._actions = np.zeros((self._width, self._height), dtype=np.int8)
     
     def set_action(self, x: int, y: int, action):
         raise NotImplementedError()
         
     def action(self, x: int, y: int):
         raise NotImplementedError()
+
+    # Return the underlying (width, height) array of actions. This is not
+    # a copy, so writing to it changes the policy.
+    def actions(self) -> np.ndarray:
+        return self._actions
+
+    # Set the actions of a set of cells in one go. The cells can be a boolean
+    # mask of size (width, height) or a tuple of arrays of x and y coordinates.
+    def set_actions(self, cells, values):
+        self._actions[cells] = values
+
+    # Return a boolean mask of the cells where the actions are different from
+    # the ones in the array previous_actions (for example, a copy of actions()
+    # taken earlier). This is used to tell if the policy is stable.
+    def changed_cells(self, previous_actions) -> np.ndarray:
+        return self._actions != previous_actions
@@ -26,4 +26,9 @@ class TabularValueFunction(Grid):
         
     def value(self, x, y) -> float:
         return self._values[x, y]
+
+    # Return the underlying (width, height) array of values. This is not
+    # a copy, so writing to it changes the value function.
+    def values(self) -> np.ndarray:
+        return self._values
        
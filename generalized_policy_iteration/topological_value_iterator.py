@@ -0,0 +1,156 @@
+# This class implements topological value iteration. The states are split
+# into strongly connected components of the transition graph (the graph with
+# an edge from s to s' if some action can take the robot from s to s').
+# Values only flow backwards along the edges, so if the components are solved
+# in reverse topological order, the values of all the successors of a component
+# have already converged when it is solved. Each component is therefore
+# iterated to convergence once and never swept again.
+
+import numpy as np
+
+from .solver_snapshot import SolverStep
+from .value_iterator import ValueIterator
+
+
+# Tarjan's algorithm, written iteratively so that large maps do not run out of
+# stack. The graph is given in CSR form. The components are returned in the
+# order that Tarjan's algorithm completes them, which is a reverse topological
+# order: every component comes after all of the components it can reach.
+def _strongly_connected_components(indptr, indices):
+    number_of_nodes = len(indptr) - 1
+
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+
+    index = [-1] * number_of_nodes
+    low_link = [0] * number_of_nodes
+    on_stack = [False] * number_of_nodes
+    stack = []
+    components = []
+    counter = 0
+
+    for root in range(number_of_nodes):
+        if index[root] != -1:
+            continue
+
+        index[root] = low_link[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+
+        # Each entry is a node and the position of the next edge to explore
+        work = [(root, indptr[root])]
+
+        while len(work) > 0:
+            node, edge = work[-1]
+
+            if edge < indptr[node + 1]:
+                work[-1] = (node, edge + 1)
+                successor = indices[edge]
+                if index[successor] == -1:
+                    index[successor] = low_link[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack[successor] = True
+                    work.append((successor, indptr[successor]))
+                elif on_stack[successor] is True:
+                    low_link[node] = min(low_link[node], index[successor])
+                continue
+
+            # All the edges have been explored, so finish the node
+            work.pop()
+            if len(work) > 0:
+                parent = work[-1][0]
+                low_link[parent] = min(low_link[parent], low_link[node])
+
+            if low_link[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+
+    return components
+
+
+class TopologicalValueIterator(ValueIterator):
+
+    def __init__(self, environment):
+        ValueIterator.__init__(self, environment)
+
+        # The policy is extracted from the compiled transition model
+        self._use_vectorized_sweeps = True
+
+        # The components from the last solve
+        self._components = None
+
+        # The number of sweeps used to solve each component
+        self.component_sweep_counts = []
+
+    # Return the strongly connected components from the last solve, in the
+    # order they were solved. Each is a list of non-terminal state ids.
+    def components(self):
+        return self._components
+
+    # Each component is swept on its own, so solve_policy returns the number
+    # of sweeps of the whole map the backups are equivalent to (the number of
+    # backups divided by the number of states, rounded up). The number of
+    # backups is given by number_of_backups. A snapshot is yielded after each
+    # component is solved, numbered by the component.
+    def _compute_optimal_value_function(self):
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+        number_of_actions = len(model.actions())
+
+        # The terminal states have fixed values, so they are not in the graph
+        graph = model.transition_graph()
+
+        self._components = _strongly_connected_components(graph.indptr, graph.indices)
+
+        print(f'Found {len(self._components)} strongly connected components')
+
+        v = model.state_values(self._v)
+
+        self.component_sweep_counts = []
+        backups = 0
+
+        for component in self._components:
+            states = np.array(component, dtype=np.intp)
+
+            p_component, r_component = model.state_transitions(states)
+
+            iteration = 0
+
+            while True:
+
+                q = (r_component + self._gamma * (p_component @ v)).reshape(number_of_actions, len(states))
+                new_v = np.max(q, axis=0)
+                delta = np.max(np.abs(new_v - v[states]))
+                v[states] = new_v
+
+                iteration += 1
+                backups += len(states)
+
+                # Terminate the loop if the change was very small (ie. convergence is reached)
+                if delta < self._theta:
+                    break
+
+                if iteration >= self._max_optimal_value_function_iterations:
+                    print('Maximum number of iterations exceeded')
+                    break
+
+            self.component_sweep_counts.append(iteration)
+
+            yield self._snapshot(SolverStep.VALUE_ITERATION_SWEEP, len(self.component_sweep_counts), delta, None, \
+                                 lambda: model.set_non_terminal_state_values(self._v, v[:n]))
+
+        print(f'Finished topological value iteration after {backups} backups')
+
+        model.set_non_terminal_state_values(self._v, v[:n])
+
+        self._number_of_backups += backups
+
+        return -(-backups // n) if n > 0 else 0
@@ -0,0 +1,319 @@
+# This class compiles the process model of an environment into sparse
+# matrices so that Bellman backups can be computed as matrix-vector
+# products rather than by calling next_state_and_reward_distribution
+# for every state and action on every sweep.
+#
+# Every cell which is not an obstruction is assigned a dense state id.
+# The non-terminal states come first and are the ones which are updated
+# by the solvers. They are followed by the terminal states, whose values
+# are fixed by the initial value function. For each action a this stores:
+#
+# P_a: a CSR matrix of size (number of non-terminal states, number of states)
+#      where P_a[i, j] is the probability of going from state i to state j.
+# R_a: a vector with the expected one-step reward for each non-terminal state.
+
+import copy
+
+import numpy as np
+from scipy import sparse
+
+
+class TransitionModel(object):
+
+    # The octagonal driving actions used by the solvers
+    DEFAULT_ACTIONS = (0, 1, 2, 3, 4, 5, 6, 7)
+
+    # If previous_model and edited_cells are given, the model is updated from
+    # the previous one rather than compiled from scratch. Only the states next
+    # to the edited cells are queried from the environment; the transitions of
+    # all the other states are copied across. This assumes, as is the case for
+    # the LowLevelEnvironment, that the outcomes of an action only depend on
+    # the cells which are within one step of the robot.
+    def __init__(self, environment, actions = DEFAULT_ACTIONS, previous_model = None, edited_cells = None):
+
+        self._actions = tuple(actions)
+
+        environment_map = environment.map()
+
+        self._width = environment_map.width()
+        self._height = environment_map.height()
+
+        # Record the map version this model was compiled from, if the map
+        # supports it, so that it can be rebuilt when the map is changed
+        self._map_version = environment_map.version() if hasattr(environment_map, 'version') else None
+
+        self._compile(environment, previous_model, edited_cells)
+
+    def _compile(self, environment, previous_model, edited_cells):
+
+        # The state ids come from the environment; non-terminal states first,
+        # then terminals
+        self._state_index = environment.state_index()
+
+        self._number_of_non_terminal_states = self._state_index.number_of_non_terminal_states()
+        self._number_of_states = self._state_index.number_of_states()
+
+        self._state_x, self._state_y = self._state_index.state_coords()
+        self._state_ids = self._state_index.state_ids()
+
+        n = self._number_of_non_terminal_states
+        number_of_actions = len(self._actions)
+
+        # The rows of the stacked matrix are ordered as action * n + state
+        rows = []
+        columns = []
+        probabilities = []
+        expected_rewards = np.zeros(number_of_actions * n)
+
+        # Copy across the transitions of the states which were not affected
+        # by the edits, renumbering the states
+        states_to_query = np.arange(n)
+
+        if previous_model is not None:
+            previous_n = previous_model._number_of_non_terminal_states
+            previous_to_new = self._state_ids[previous_model._state_x, previous_model._state_y]
+
+            unaffected = np.ones((self._width, self._height), dtype=bool)
+            unaffected[self._neighbourhood(edited_cells)] = False
+
+            kept = (previous_to_new[:previous_n] >= 0) & (previous_to_new[:previous_n] < n) & \
+                unaffected[previous_model._state_x[:previous_n], previous_model._state_y[:previous_n]]
+
+            previous_p = previous_model._stacked_p.tocoo()
+            previous_state = previous_p.row % previous_n
+            keep_entry = kept[previous_state]
+            new_state = previous_to_new[previous_state[keep_entry]]
+            action_offset = (previous_p.row[keep_entry] // previous_n) * n
+
+            rows.append(action_offset + new_state)
+            columns.append(previous_to_new[previous_p.col[keep_entry]])
+            probabilities.append(previous_p.data[keep_entry])
+
+            kept_rows = np.flatnonzero(np.tile(kept, number_of_actions))
+            expected_rewards[(kept_rows // previous_n) * n + previous_to_new[kept_rows % previous_n]] = \
+                previous_model._stacked_r[kept_rows]
+
+            covered = np.zeros(n, dtype=bool)
+            covered[previous_to_new[:previous_n][kept]] = True
+            states_to_query = np.flatnonzero(~covered)
+
+        # Query the environment for every other state and action
+        queried_rows = []
+        queried_columns = []
+        queried_probabilities = []
+
+        for a_idx, a in enumerate(self._actions):
+            for i in states_to_query:
+                s_prime, r, p = environment.next_state_and_reward_distribution( \
+                    (int(self._state_x[i]), int(self._state_y[i])), a)
+                row = a_idx * n + i
+                for t in range(len(p)):
+                    sc = s_prime[t].coords()
+                    queried_rows.append(row)
+                    queried_columns.append(self._state_ids[sc[0], sc[1]])
+                    queried_probabilities.append(p[t])
+                    expected_rewards[row] += p[t] * r[t]
+
+        rows.append(np.array(queried_rows, dtype=np.intp))
+        columns.append(np.array(queried_columns, dtype=np.intp))
+        probabilities.append(np.array(queried_probabilities, dtype=float))
+
+        # Duplicate entries (for example, several outcomes which all leave the
+        # robot where it is) are summed when converting to CSR
+        self._stacked_p = sparse.csr_matrix((np.concatenate(probabilities), \
+                                             (np.concatenate(rows), np.concatenate(columns))), \
+                                            shape=(number_of_actions * n, self._number_of_states))
+        self._stacked_p.sum_duplicates()
+        self._stacked_r = expected_rewards
+
+        self._p = [self._stacked_p[a_idx * n:(a_idx + 1) * n] for a_idx in range(number_of_actions)]
+        self._r = [self._stacked_r[a_idx * n:(a_idx + 1) * n] for a_idx in range(number_of_actions)]
+        
+        # These are built on demand
+        self._padded_outcomes = None
+        self._predecessors = None
+
+    # Return the model whose transition probabilities and expected rewards are
+    # weight * (those of this model) + (1 - weight) * (those of the other model).
+    # Both models must have been compiled from the same map. This is useful when
+    # the process model of the environment is linear in one of its parameters.
+    def interpolate(self, other, weight):
+        model = copy.copy(self)
+
+        model._stacked_p = weight * self._stacked_p + (1 - weight) * other._stacked_p
+        model._stacked_p.eliminate_zeros()
+        model._stacked_r = weight * self._stacked_r + (1 - weight) * other._stacked_r
+
+        n = self._number_of_non_terminal_states
+        model._p = [model._stacked_p[a_idx * n:(a_idx + 1) * n] for a_idx in range(len(self._actions))]
+        model._r = [model._stacked_r[a_idx * n:(a_idx + 1) * n] for a_idx in range(len(self._actions))]
+
+        model._padded_outcomes = None
+        model._predecessors = None
+
+        return model
+
+    # Return a (width, height) mask of the cells within one step of any of the cells
+    def _neighbourhood(self, cells):
+        mask = np.zeros((self._width, self._height), dtype=bool)
+        for x, y in cells:
+            mask[max(x - 1, 0):x + 2, max(y - 1, 0):y + 2] = True
+        return mask
+
+    # Return the ids of the non-terminal states whose transitions could have been
+    # changed by editing the specified cells
+    def affected_states(self, edited_cells):
+        states = self._state_ids[self._neighbourhood(edited_cells)]
+        return np.sort(states[(states >= 0) & (states < self._number_of_non_terminal_states)])
+
+    # The actions the model was compiled for
+    def actions(self):
+        return self._actions
+
+    # The version of the map when the model was compiled
+    def map_version(self):
+        return self._map_version
+
+    # The total number of (non-obstructed) states
+    def number_of_states(self):
+        return self._number_of_states
+
+    # The number of non-terminal states. These have ids 0..n-1.
+    def number_of_non_terminal_states(self):
+        return self._number_of_non_terminal_states
+
+    # The (x, y) coordinates of every state, indexed by state id
+    def state_coords(self):
+        return self._state_x, self._state_y
+
+    # The (width, height) array mapping cells to state ids
+    def state_ids(self):
+        return self._state_ids
+
+    # The transition matrix P_a for the action with index a_idx
+    def transition_matrix(self, a_idx):
+        return self._p[a_idx]
+
+    # The expected reward vector R_a for the action with index a_idx
+    def expected_rewards(self, a_idx):
+        return self._r[a_idx]
+
+    # The numbering of the states
+    def state_index(self):
+        return self._state_index
+
+    # Gather the values of all the states from a tabular value function
+    def state_values(self, v):
+        return self._state_index.state_values(v)
+
+    # Write the values of the non-terminal states back into a tabular value function
+    def set_non_terminal_state_values(self, v, new_values):
+        self._state_index.set_non_terminal_state_values(v, new_values)
+
+    # Gather the action indices of the non-terminal states from a policy
+    def policy_action_indices(self, pi):
+        action_index = np.full(max(self._actions) + 1, -1, dtype=np.intp)
+        action_index[list(self._actions)] = np.arange(len(self._actions))
+        return action_index[self._state_index.non_terminal_state_actions(pi)]
+
+    # Write action indices for the non-terminal states into a policy. If
+    # only_changed is set, only the entries listed in it are written.
+    def set_policy_action_indices(self, pi, action_indices, only_changed = None):
+        states = np.arange(self._number_of_non_terminal_states) if only_changed is None else only_changed
+        actions = np.array(self._actions)[np.asarray(action_indices)[states]]
+        pi.set_actions((self._state_x[states], self._state_y[states]), actions)
+
+    # Compute Q[a, s] = R_a[s] + gamma * sum_s' P_a[s, s'] v[s'] for all actions
+    # and non-terminal states from the vector of state values.
+    def q_values(self, state_values, gamma):
+        q = self._stacked_r + gamma * (self._stacked_p @ state_values)
+        return q.reshape(len(self._actions), self._number_of_non_terminal_states)
+
+    # Return the transition matrix P_pi and reward vector r_pi of the policy
+    # which takes the action with index action_indices[s] in state s.
+    def policy_transitions(self, action_indices):
+        rows = action_indices * self._number_of_non_terminal_states + \
+            np.arange(self._number_of_non_terminal_states)
+        return self._stacked_p[rows], self._stacked_r[rows]
+
+    # Return the stacked transition matrices and expected rewards of the given
+    # non-terminal states for every action. Row a * len(states) + i is for
+    # action index a in state states[i], which matches the layout of q_values.
+    def state_transitions(self, states):
+        rows = (np.arange(len(self._actions))[:, np.newaxis] * self._number_of_non_terminal_states + \
+                states).reshape(-1)
+        return self._stacked_p[rows], self._stacked_r[rows]
+
+    # Return the transition graph between the non-terminal states as a CSR
+    # matrix of size (n, n), with an entry wherever some action can move the
+    # robot from one state to the other.
+    def transition_graph(self):
+        n = self._number_of_non_terminal_states
+        stacked_p = self._stacked_p.tocoo()
+        inside = stacked_p.col < n
+        graph = sparse.csr_matrix((np.ones(np.count_nonzero(inside)), \
+                                   (stacked_p.row[inside] % n, stacked_p.col[inside])), shape=(n, n))
+        graph.sum_duplicates()
+        return graph
+
+    # Return the outcomes of every state and action as dense arrays, which are
+    # useful when backing up one state at a time. The arrays successors and
+    # probabilities are of size (number of non-terminal states, number of actions,
+    # maximum number of outcomes), and rewards is of size (number of non-terminal
+    # states, number of actions). Missing outcomes have zero probability.
+    def padded_outcomes(self):
+        
+        if self._padded_outcomes is not None:
+            return self._padded_outcomes
+        
+        n = self._number_of_non_terminal_states
+        number_of_actions = len(self._actions)
+        
+        outcomes_per_row = np.diff(self._stacked_p.indptr)
+        max_outcomes = int(np.max(outcomes_per_row)) if len(outcomes_per_row) > 0 else 0
+        
+        successors = np.zeros((number_of_actions * n, max_outcomes), dtype=np.intp)
+        probabilities = np.zeros((number_of_actions * n, max_outcomes))
+        
+        # Position of each stored entry within its row
+        rows = np.repeat(np.arange(number_of_actions * n), outcomes_per_row)
+        positions = np.arange(len(rows)) - self._stacked_p.indptr[rows]
+        
+        successors[rows, positions] = self._stacked_p.indices
+        probabilities[rows, positions] = self._stacked_p.data
+        
+        # Reorder from (action, state) to (state, action)
+        successors = successors.reshape(number_of_actions, n, max_outcomes).transpose(1, 0, 2).copy()
+        probabilities = probabilities.reshape(number_of_actions, n, max_outcomes).transpose(1, 0, 2).copy()
+        rewards = self._stacked_r.reshape(number_of_actions, n).T.copy()
+        
+        self._padded_outcomes = (successors, probabilities, rewards)
+        
+        return self._padded_outcomes
+
+    # Return the predecessor index. This is a CSR matrix of size (number of states,
+    # number of non-terminal states). Row j lists the non-terminal states which
+    # can move to state j under some action, and the entries are the largest
+    # probability of doing so over all the actions.
+    def predecessors(self):
+        
+        if self._predecessors is not None:
+            return self._predecessors
+        
+        n = self._number_of_non_terminal_states
+        stacked_p = self._stacked_p.tocoo()
+        
+        # Taking the maximum of the duplicates is done by sorting the entries on
+        # (successor, predecessor, probability) and keeping the last of each run
+        predecessor = stacked_p.row % n
+        order = np.lexsort((stacked_p.data, predecessor, stacked_p.col))
+        successor = stacked_p.col[order]
+        predecessor = predecessor[order]
+        probability = stacked_p.data[order]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = (successor[1:] != successor[:-1]) | (predecessor[1:] != predecessor[:-1])
+        
+        self._predecessors = sparse.csr_matrix((probability[last], (successor[last], predecessor[last])), \
+                                               shape=(self._number_of_states, n))
+        
+        return self._predecessors
@@ -3,26 +3,114 @@ Created on 29 Jan 2022
 
 @author: ucacsjj
 '''
-import copy
+from enum import IntEnum
+
+import numpy as np
+from scipy.sparse import csr_matrix, identity
+from scipy.sparse.csgraph import shortest_path
+from scipy.sparse.linalg import spsolve
+
+from . import jit_sweeps
 from .dynamic_programming_base import DynamicProgrammingBase
+from .solver_snapshot import SolverStep
+
+# When value iteration stops. MAXIMUM_CHANGE stops when the largest change in a
+# sweep is below theta. The others use the change d = Tv - v made by a sweep,
+# and need gamma < 1. The terminal states do not change, so d is taken to be
+# zero there. SPAN stops when the span max(d) - min(d) is below theta.
+# VALUE_BOUNDS stops when the MacQueen bounds on the optimal value function,
+# Tv + gamma / (1 - gamma) * [min(d), max(d)], are less than theta apart.
+# STABLE_POLICY stops when the greedy policy has not changed for a number of
+# sweeps and an exact evaluation of the policy certifies that it is within
+# theta of optimal (or optimal, if gamma = 1).
+class StoppingRule(IntEnum):
+    MAXIMUM_CHANGE = 0
+    SPAN = 1
+    VALUE_BOUNDS = 2
+    STABLE_POLICY = 3
 
 # This class ipmlements the value iteration algorithm
 
 class ValueIterator(DynamicProgrammingBase):
 
+    _supports_deterministic_solver = True
+
     def __init__(self, environment):
         DynamicProgrammingBase.__init__(self, environment)
         
         # The maximum number of times the value iteration
         # algorithm is carried out is carried out.
         self._max_optimal_value_function_iterations = 2000
+        
+        # The number of single-state backups carried out by the last solve
+        self._number_of_backups = 0
+        
+        # If set, actions which are provably suboptimal are eliminated and
+        # are not evaluated again
+        self._use_action_elimination = False
+        
+        # The number of sweeps between checks for actions to eliminate
+        self._action_elimination_interval = 5
+        
+        # The actions which have not been eliminated, as an array of size
+        # (number of actions, number of non-terminal states)
+        self._remaining_actions = None
+        
+        # The number of actions eliminated in each sweep of the last solve
+        self.eliminated_action_counts = []
+        
+        # The rule used to stop iterating
+        self._stopping_rule = StoppingRule.MAXIMUM_CHANGE
+        
+        # The number of sweeps the greedy policy must be unchanged for before
+        # trying to certify it
+        self._stable_policy_sweeps = 3
+        
+        # Set if the last solve proved the policy is optimal
+        self._policy_certified_optimal = False
    
     # Method to change the maximum number of iterations
     def set_max_optimal_value_function_iterations(self, max_optimal_value_function_iterations):
         self._max_optimal_value_function_iterations = max_optimal_value_function_iterations
 
-    #    
-    def solve_policy(self):
+    # Return the number of single-state backups carried out by the last solve
+    def number_of_backups(self):
+        return self._number_of_backups
+
+    # Enable elimination of suboptimal actions. This uses the compiled
+    # transition model.
+    def set_use_action_elimination(self, use_action_elimination):
+        self._use_action_elimination = use_action_elimination
+
+    # Set the number of sweeps between checks for actions to eliminate
+    def set_action_elimination_interval(self, action_elimination_interval):
+        self._action_elimination_interval = action_elimination_interval
+
+    # Return the mask of the actions which were not eliminated in the last
+    # solve, indexed by (action index, non-terminal state id)
+    def remaining_actions(self):
+        return self._remaining_actions
+
+    # Set the rule used to stop iterating. All the rules apart from
+    # MAXIMUM_CHANGE use the vectorized sweeps.
+    def set_stopping_rule(self, stopping_rule):
+        self._stopping_rule = StoppingRule(stopping_rule)
+
+    # Return the rule used to stop iterating
+    def stopping_rule(self):
+        return self._stopping_rule
+
+    # Set the number of sweeps the policy must be unchanged for with STABLE_POLICY
+    def set_stable_policy_sweeps(self, stable_policy_sweeps):
+        self._stable_policy_sweeps = stable_policy_sweeps
+
+    # Solve for the policy. As well as the value function, policy and number of
+    # iterations, this returns a certified bound on how much worse the policy
+    # is than the optimal one. If gamma < 1, the bound follows from the MacQueen
+    # bounds on the value functions of the greedy policy and the optimal policy.
+    # If gamma = 1, there is no bound (it is infinite) unless the policy was
+    # proved to be optimal. A snapshot is yielded after every sweep.
+    def _solve_policy_steps(self):
 
         # Initialize the drawers
         if self._policy_drawer is not None:
@@ -31,10 +119,17 @@ class ValueIterator(DynamicProgrammingBase):
         if self._value_drawer is not None:
             self._value_drawer.update()
         
-        value_iteration_step = self._compute_optimal_value_function()
+        self._number_of_backups = 0
+        self._policy_certified_optimal = False
+        
+        value_iteration_step = yield from self._compute_optimal_value_function()
  
         self._extract_policy()
         
+        certified_bound = self._certified_suboptimality_bound()
+        
+        self._record_solved_map_version()
+
         # Draw one last time to clear any transients which might
         # draw changes
         if self._policy_drawer is not None:
@@ -43,19 +138,71 @@ class ValueIterator(DynamicProgrammingBase):
         if self._value_drawer is not None:
             self._value_drawer.update()
 
-        return self._v, self._pi, value_iteration_step
+        return self._v, self._pi, value_iteration_step, certified_bound
+
+    # If value iteration is stopped early, the policy is still greedy, and the
+    # bound on how far it is from optimal is still valid
+    def _interrupted_solve_result(self, snapshot):
+        self._extract_greedy_policy()
+        return self._v, self._pi, snapshot.iteration(), self._certified_suboptimality_bound()
+
+    # After the shortest path solver, the policy is greedy with respect to
+    # values which are exact, or within the residual of the last sweep of
+    # them, so the bound follows from the residual
+    def _deterministic_solve_statistics(self, number_of_sweeps, residual):
+        if self._gamma < 1:
+            return number_of_sweeps, 2 * self._gamma * residual / (1 - self._gamma)
+        return number_of_sweeps, 0.0
+
+    # A repair after map edits does at most as many sweeps as value iteration
+    def _max_number_of_repair_sweeps(self):
+        return self._max_optimal_value_function_iterations
+
+    def _solution_cache_settings(self):
+        settings = DynamicProgrammingBase._solution_cache_settings(self)
+        settings.update({'max_optimal_value_function_iterations': self._max_optimal_value_function_iterations,
+                         'use_action_elimination': self._use_action_elimination,
+                         'action_elimination_interval': self._action_elimination_interval,
+                         'stopping_rule': int(self._stopping_rule),
+                         'stable_policy_sweeps': self._stable_policy_sweeps})
+        return settings
 
     # Q3f:
     # Finish the implementation of the methods below.
     
+    # Compute the optimal value function. This is a generator, which yields a
+    # snapshot after every sweep and returns the number of sweeps.
     def _compute_optimal_value_function(self):
+        
+        if self._use_vectorized_sweeps is True:
+            if self._use_action_elimination is True:
+                return (yield from self._compute_optimal_value_function_with_action_elimination())
+            return (yield from self._compute_optimal_value_function_vectorized())
+        
+        if self._stopping_rule is not StoppingRule.MAXIMUM_CHANGE:
+            return (yield from self._compute_optimal_value_function_vectorized())
+        
+        if (self.use_jit_sweeps() is True) and (self._use_action_elimination is False):
+            return (yield from self._compute_optimal_value_function_jit())
+        
         environment = self._environment
-        map = environment.map()
+
+        # Only the non-terminal states are visited; the state index leaves
+        # out the terminal and obstruction states
+        state_index = environment.state_index()
 
         # Actions the robot might take in each cell are the octagonal actions
         # Ints representing the actions in LowLevelActionType
         actions = [0, 1, 2, 3, 4, 5, 6, 7]
 
+        # With action elimination, the bounds are computed with the compiled
+        # transition model and the eliminated actions are skipped in the sweeps
+        eliminating = False
+        if self._use_action_elimination is True:
+            model = self._transition_model()
+            state_ids = model.state_ids()
+            eliminating = self._start_action_elimination()
+
         iteration = 0
 
         while True:
@@ -63,46 +210,54 @@ class ValueIterator(DynamicProgrammingBase):
             delta = 0
 
             # Iterate over all the states
-            for x in range(map.width()):
-                for y in range(map.height()):
-
-                    # Skip terminal and obstruction states
-                    if map.cell(x, y).is_obstruction() or map.cell(x, y).is_terminal():
-                        continue
+            for x, y in state_index.non_terminal_cells():
 
-                    cell = (x, y)
+                cell = (x, y)
 
-                    # Get the previous value function
-                    old_v = self._v.value(x, y)
+                # Get the previous value function
+                old_v = self._v.value(x, y)
 
-                    # Initialize variables for finding the maximum value
-                    new_best_v = float('-inf')
+                # Initialize variables for finding the maximum value
+                new_best_v = float('-inf')
 
-                    for a in actions:
+                for a in actions:
+                    
+                    # Skip the actions which have been eliminated
+                    if (eliminating is True) and (not self._remaining_actions[a, state_ids[x, y]]):
+                        continue
 
-                        # Compute p(s',r|s,a)
-                        s_prime, r, p = environment.next_state_and_reward_distribution(cell, a)
-                        
-                        # Sum over the rewards
-                        new_v = 0
-                        for t in range(len(p)):
-                            sc = s_prime[t].coords()
-                            new_v = new_v + p[t] * (r[t] + self._gamma * self._v.value(sc[0], sc[1]))
-                        
-                        # Update new best value if this action leads to a higher value
-                        if new_v > new_best_v:
-                            new_best_v = new_v
+                    # Compute p(s',r|s,a)
+                    s_prime, r, p = environment.next_state_and_reward_distribution(cell, a)
+                    
+                    # Sum over the rewards
+                    new_v = 0
+                    for t in range(len(p)):
+                        sc = s_prime[t].coords()
+                        new_v = new_v + p[t] * (r[t] + self._gamma * self._v.value(sc[0], sc[1]))
+                    
+                    # Update new best value if this action leads to a higher value
+                    if new_v > new_best_v:
+                        new_best_v = new_v
 
-                    # Update the value function with the new maximum value found
-                    self._v.set_value(x, y, new_best_v)
+                # Update the value function with the new maximum value found
+                self._v.set_value(x, y, new_best_v)
+                self._number_of_backups += 1
 
-                    # Update delta for convergence check
-                    delta = max(delta, abs(old_v - new_best_v))
+                # Update delta for convergence check
+                delta = max(delta, abs(old_v - new_best_v))
 
             # Increment the iteration counter
             iteration += 1
+            
+            if self._use_action_elimination is True:
+                eliminated = 0
+                if (eliminating is True) and (iteration % self._action_elimination_interval == 0):
+                    eliminated = self._eliminate_actions(model, model.state_values(self._v))
+                self.eliminated_action_counts.append(eliminated)
 
-            print(f'Finished value iteration step {iteration}')
+            self._print_sweep(f'Finished value iteration step {iteration}')
+            
+            yield self._snapshot(SolverStep.VALUE_ITERATION_SWEEP, iteration, delta, None)
             
             # Terminate the loop if the change was very small (ie. convergence is reached)
             if delta < self._theta:
@@ -114,41 +269,431 @@ class ValueIterator(DynamicProgrammingBase):
 
         
     def _extract_policy(self):
+        
+        if (self._use_vectorized_sweeps is True) or (self._use_action_elimination is True):
+            return self._extract_policy_vectorized()
+        
+        if self.use_jit_sweeps() is True:
+            return self._extract_policy_jit()
+        
         environment = self._environment
-        map = environment.map()
+
+        # Only the non-terminal states are visited; the state index leaves
+        # out the terminal and obstruction states
+        state_index = environment.state_index()
 
         # Actions the robot might take in each cell are the octagonal actions
         # Integers represent the actions in LowLevelActionType
         actions = [0, 1, 2, 3, 4, 5, 6, 7]
 
         # Iterate over all states
-        for x in range(map.width()):
-            for y in range(map.height()):
+        for x, y in state_index.non_terminal_cells():
+
+            cell = (x, y)
+
+            # Initialize variables for finding the best action
+            new_best_a = None
+            new_best_v = float('-inf')
+
+            for new_a in actions:
+                # Compute p(s',r|s,a)
+                s_prime, r, p = environment.next_state_and_reward_distribution(cell, new_a)
+                
+                # Sum over the rewards
+                new_v = 0
+                for t in range(len(p)):
+                    sc = s_prime[t].coords()
+                    new_v = new_v + p[t] * (r[t] + self._gamma * self._v.value(sc[0], sc[1]))
+                
+                # Update new best action and value if this action leads to a higher value
+                if new_v > new_best_v:
+                    new_best_a = new_a
+                    new_best_v = new_v
+
+            # Set the best action for the current state in the policy
+            self._pi.set_action(x, y, new_best_a)
+
+    # Value iteration with the compiled Gauss-Seidel kernel. This is the same
+    # as the loops over the cells.
+    def _compute_optimal_value_function_jit(self):
+        
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+        successors, probabilities, rewards = model.padded_outcomes()
+        
+        v = model.state_values(self._v)
+        
+        iteration = 0
+        
+        while True:
+            
+            delta = jit_sweeps.value_iteration_sweep(v, successors, probabilities, rewards, self._gamma)
+            self._number_of_backups += n
+            
+            # Increment the iteration counter
+            iteration += 1
+            
+            self._print_sweep(f'Finished value iteration step {iteration}')
+            
+            yield self._snapshot(SolverStep.VALUE_ITERATION_SWEEP, iteration, delta, None, \
+                                 lambda: model.set_non_terminal_state_values(self._v, v[:n]))
+            
+            # Terminate the loop if the change was very small (ie. convergence is reached)
+            if delta < self._theta:
+                break
 
-                # Skip terminal and obstruction states
-                if map.cell(x, y).is_obstruction() or map.cell(x, y).is_terminal():
-                    continue
+            if iteration >= self._max_optimal_value_function_iterations:
+                print('Maximum number of iterations exceeded')
+                break
+            
+        model.set_non_terminal_state_values(self._v, v[:n])
+        
+        return iteration
 
-                cell = (x, y)
+    # Extract the greedy policy with the compiled kernel
+    def _extract_policy_jit(self):
+        model = self._transition_model()
+        successors, probabilities, rewards = model.padded_outcomes()
+        
+        action_indices = model.policy_action_indices(self._pi)
+        
+        jit_sweeps.improve_policy(model.state_values(self._v), successors, probabilities, rewards, \
+                                  action_indices, self._gamma)
+        
+        model.set_policy_action_indices(self._pi, action_indices)
+
+    # Vectorized value iteration. Each sweep computes Q[a, s] for every action
+    # and state with the compiled transition model, and takes the maximum
+    # over the actions for every state at once.
+    def _compute_optimal_value_function_vectorized(self):
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+        
+        stopping_rule = self._stopping_rule
+        if (stopping_rule in (StoppingRule.SPAN, StoppingRule.VALUE_BOUNDS)) and (self._gamma >= 1):
+            print('The span and value bound rules need gamma < 1; using the maximum change')
+            stopping_rule = StoppingRule.MAXIMUM_CHANGE
+        
+        v = model.state_values(self._v)
+        
+        iteration = 0
+        
+        greedy_actions = None
+        stable_sweeps = 0
+        
+        while True:
+            
+            q = model.q_values(v, self._gamma)
+            
+            if n == 0:
+                return iteration
+            
+            new_v = np.max(q, axis=0)
+            change = new_v - v[:n]
+            delta = np.max(np.abs(change))
+            v[:n] = new_v
+            
+            # Update the value function with the new maximum values found
+            model.set_non_terminal_state_values(self._v, v[:n])
+            self._number_of_backups += n
+                
+            # Increment the iteration counter
+            iteration += 1
 
-                # Initialize variables for finding the best action
-                new_best_a = None
-                new_best_v = float('-inf')
+            self._print_sweep(f'Finished value iteration step {iteration}')
+            
+            yield self._snapshot(SolverStep.VALUE_ITERATION_SWEEP, iteration, delta, None)
+            
+            # Terminate the loop if the change was very small (ie. convergence is reached)
+            if (stopping_rule is StoppingRule.MAXIMUM_CHANGE) and (delta < self._theta):
+                return iteration
+            
+            # Terminate the loop if the change was the same for every state, up to theta
+            if stopping_rule in (StoppingRule.SPAN, StoppingRule.VALUE_BOUNDS):
+                smallest_change, largest_change = self._change_range(change)
+                span = largest_change - smallest_change
+                if stopping_rule is StoppingRule.VALUE_BOUNDS:
+                    span *= self._gamma / (1 - self._gamma)
+                if span < self._theta:
+                    return iteration
+            
+            # Once the greedy policy has not changed for long enough, try to certify it
+            if stopping_rule is StoppingRule.STABLE_POLICY:
+                new_greedy_actions = np.argmax(q, axis=0)
+                if (greedy_actions is not None) and np.array_equal(new_greedy_actions, greedy_actions):
+                    stable_sweeps += 1
+                else:
+                    stable_sweeps = 0
+                greedy_actions = new_greedy_actions
+                
+                if (stable_sweeps >= self._stable_policy_sweeps) and \
+                    (self._certify_policy(model, greedy_actions) is True):
+                    return iteration
 
-                for new_a in actions:
-                    # Compute p(s',r|s,a)
-                    s_prime, r, p = environment.next_state_and_reward_distribution(cell, new_a)
-                    
-                    # Sum over the rewards
-                    new_v = 0
-                    for t in range(len(p)):
-                        sc = s_prime[t].coords()
-                        new_v = new_v + p[t] * (r[t] + self._gamma * self._v.value(sc[0], sc[1]))
-                    
-                    # Update new best action and value if this action leads to a higher value
-                    if new_v > new_best_v:
-                        new_best_a = new_a
-                        new_best_v = new_v
+            if iteration >= self._max_optimal_value_function_iterations:
+                print('Maximum number of iterations exceeded')
+                return iteration
+            
+    # Evaluate the policy exactly. If no action improves on the policy under
+    # its own value function, it is optimal (this is the test which stops policy
+    # iteration). Otherwise, if gamma < 1, the MacQueen bounds limit how far it
+    # can be from optimal. If the policy is certified to within theta, the
+    # value function is set to its value and True is returned.
+    def _certify_policy(self, model, actions):
+        n = model.number_of_non_terminal_states()
+        
+        p_pi, r_pi = model.policy_transitions(actions)
+        v = model.state_values(self._v)
+        
+        # If gamma = 1, the values are only finite if the policy always terminates
+        if (self._gamma >= 1) and (not np.all(self._proper_states(p_pi, n))):
+            return False
+        
+        a = (identity(n, format='csc') - self._gamma * p_pi[:, :n]).tocsc()
+        b = r_pi + self._gamma * (p_pi[:, n:] @ v[n:])
+        
+        try:
+            v_pi = spsolve(a, b)
+        except RuntimeError:
+            return False
+        
+        if not np.all(np.isfinite(v_pi)):
+            return False
+        
+        v[:n] = v_pi
+        q = model.q_values(v, self._gamma)
+        
+        # Allow for round off, so that ties between actions are not missed
+        improvement = np.max(q, axis=0) - v_pi
+        if np.all(improvement <= 1e-9 * np.maximum(1, np.abs(v_pi))):
+            self._policy_certified_optimal = True
+        elif (self._gamma >= 1) or (self._suboptimality_bound(q, v_pi) >= self._theta):
+            return False
+        
+        model.set_non_terminal_state_values(self._v, v_pi)
+        
+        print('Certified the greedy policy')
+        
+        return True
+    
+    # Return the smallest and largest change d = Tv - v over all the states. The
+    # terminal states keep their values, so their change is zero.
+    def _change_range(self, change):
+        return min(np.min(change), 0), max(np.max(change), 0)
+    
+    # Return the bound on how far the policy which is greedy with respect to v is
+    # from optimal, where q are the action values computed from v and gamma < 1.
+    # If d = Tv - v, the values of the optimal policy and of the greedy policy
+    # both lie in Tv + gamma / (1 - gamma) * [min(d), max(d)].
+    def _suboptimality_bound(self, q, v):
+        smallest_change, largest_change = self._change_range(np.max(q, axis=0) - v)
+        return self._gamma / (1 - self._gamma) * (largest_change - smallest_change)
+    
+    # Return the certified bound on how far the current policy is from optimal
+    def _certified_suboptimality_bound(self):
+        if self._policy_certified_optimal is True:
+            return 0.0
+        
+        if self._gamma >= 1:
+            return float('inf')
+        
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+        
+        if n == 0:
+            return 0.0
+        
+        v = model.state_values(self._v)
+        q = model.q_values(v, self._gamma)
+        
+        # Eliminated actions are never optimal, so the bound holds without them
+        if (self._use_action_elimination is True) and (self._remaining_actions is not None):
+            q[~self._remaining_actions] = -np.inf
+        
+        return float(self._suboptimality_bound(q, v[:n]))
+            
+    def _extract_policy_vectorized(self):
+        model = self._transition_model()
+        
+        # Set the best action for every state in the policy. Eliminated
+        # actions are never chosen.
+        if (self._use_action_elimination is True) and (self._remaining_actions is not None):
+            q = model.q_values(model.state_values(self._v), self._gamma)
+            q[~self._remaining_actions] = -np.inf
+            best_actions = np.argmax(q, axis=0)
+        else:
+            best_actions, _ = self._greedy_actions_vectorized()
+        model.set_policy_action_indices(self._pi, best_actions)
+
+    # Return an upper bound on the optimal value of every non-terminal state,
+    # or None if there is no bound. If gamma < 1, the return is at most the
+    # largest reward for ever plus the largest terminal reward. If gamma = 1, a
+    # bound only exists if no action has a positive expected reward. Reaching a
+    # terminal state from s takes at least d(s) steps, where d(s) is the length
+    # of the shortest path in the transition graph, so the value of s is at most
+    # the largest terminal reward plus d(s) times the largest expected reward.
+    def _optimal_value_upper_bound(self, model, v):
+        n = model.number_of_non_terminal_states()
+        number_of_states = model.number_of_states()
+        
+        largest_reward = np.max(model.q_values(np.zeros_like(v), 0)) if n > 0 else 0
+        largest_terminal_reward = np.max(v[n:], initial = 0)
+        
+        if self._gamma < 1:
+            return np.full(n, max(largest_reward, 0) / (1 - self._gamma) + largest_terminal_reward)
+        elif largest_reward > 0:
+            return None
+        
+        # Breadth first search back from the terminal states, through an extra
+        # source node which has edges to all of them
+        predecessors = model.predecessors().tocoo()
+        source = number_of_states
+        edge_starts = np.concatenate((predecessors.row, np.full(number_of_states - n, source)))
+        edge_ends = np.concatenate((predecessors.col, np.arange(n, number_of_states)))
+        graph = csr_matrix((np.ones(len(edge_starts)), (edge_starts, edge_ends)), \
+                           shape=(number_of_states + 1, number_of_states + 1))
+        steps = shortest_path(graph, directed=True, unweighted=True, indices=source)[:n] - 1
+        
+        # States which cannot reach a terminal state only have the trivial bound
+        steps[np.isinf(steps)] = 0
+        
+        return largest_terminal_reward + largest_reward * steps
+
+    # Set up action elimination. Action elimination needs the values to be an
+    # upper bound on the optimal values. Because the Bellman operator is
+    # monotonic, if the values start above the optimal values, they stay above
+    # them. Therefore each value of a non-terminal state is raised to an
+    # upper bound if it is below it. Values which start above the bound, such
+    # as those passed to initialize or from an initial value heuristic, are
+    # kept. Returns whether actions can be eliminated.
+    def _start_action_elimination(self):
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+        
+        self.eliminated_action_counts = []
+        self._remaining_actions = np.ones((len(model.actions()), n), dtype=bool)
+        
+        v = model.state_values(self._v)
+        upper_bound = self._optimal_value_upper_bound(model, v)
+        
+        if upper_bound is None:
+            print('The optimal values are not bounded; actions will not be eliminated')
+            return False
+        
+        model.set_non_terminal_state_values(self._v, np.maximum(v[:n], upper_bound))
+        
+        return True
+
+    # Eliminate the actions which cannot be optimal given the upper bound v on
+    # the optimal values. The value of any policy is a lower bound, so the
+    # greedy policy is evaluated exactly (over the states from which it reaches
+    # a terminal) and one more Bellman backup is applied to it. An action is
+    # eliminated if its value computed from the upper bound is below the lower
+    # bound of its state: it can never be optimal. Returns the number of
+    # actions eliminated.
+    def _eliminate_actions(self, model, v):
+        n = model.number_of_non_terminal_states()
+        
+        if n == 0:
+            return 0
+        
+        upper_bound_q = model.q_values(v, self._gamma)
+        upper_bound_q[~self._remaining_actions] = -np.inf
+        
+        # States from which the greedy policy never terminates have no lower bound
+        p_pi, r_pi = model.policy_transitions(np.argmax(upper_bound_q, axis=0))
+        
+        if self._gamma < 1:
+            proper = np.arange(n)
+        else:
+            proper = np.flatnonzero(self._proper_states(p_pi, n))
+            
+        lower_bound = np.full(len(v), -np.inf)
+        lower_bound[n:] = v[n:]
+        
+        if len(proper) > 0:
+            p_proper = p_pi[proper]
+            a = (identity(len(proper), format='csc') - self._gamma * p_proper[:, proper]).tocsc()
+            b = r_pi[proper] + self._gamma * (p_proper[:, n:] @ v[n:])
+            lower_bound[proper] = spsolve(a, b)
+            
+        if not np.all(np.isfinite(lower_bound[proper])):
+            return 0
+            
+        # One more backup of the lower bound is still a lower bound. A very
+        # large negative value stands in for the missing bounds so that
+        # zero probability entries do not give nan.
+        finite_lower_bound = np.where(np.isfinite(lower_bound), lower_bound, np.finfo(float).min / 2)
+        lower_bound_q = model.q_values(finite_lower_bound, self._gamma)
+        lower_bound_q[~self._remaining_actions] = -np.inf
+        best_lower_bound = np.maximum(lower_bound[:n], np.max(lower_bound_q, axis=0))
+        
+        # The margin of theta guards against the round off in the solve
+        eliminated = self._remaining_actions & (upper_bound_q < best_lower_bound - self._theta)
+        
+        self._remaining_actions &= ~eliminated
+        
+        return int(np.count_nonzero(eliminated))
+
+    # Vectorized value iteration with action elimination. Each sweep only
+    # evaluates the rows of the transition model for the remaining actions.
+    def _compute_optimal_value_function_with_action_elimination(self):
+        model = self._transition_model()
+        n = model.number_of_non_terminal_states()
+        number_of_actions = len(model.actions())
+        
+        eliminating = self._start_action_elimination()
+        
+        v = model.state_values(self._v)
+        
+        stacked_p, stacked_r = model.state_transitions(np.arange(n))
+        remaining_rows = np.arange(number_of_actions * n)
+        p_remaining = stacked_p
+        r_remaining = stacked_r
+        
+        iteration = 0
+        
+        while True:
+            
+            q = np.full(number_of_actions * n, -np.inf)
+            q[remaining_rows] = r_remaining + self._gamma * (p_remaining @ v)
+            q = q.reshape(number_of_actions, n)
+            
+            delta = 0
+            if n > 0:
+                new_v = np.max(q, axis=0)
+                delta = np.max(np.abs(v[:n] - new_v))
+                v[:n] = new_v
+            
+            self._number_of_backups += n
+                
+            # Increment the iteration counter
+            iteration += 1
+            
+            eliminated = 0
+            
+            if (eliminating is True) and (iteration % self._action_elimination_interval == 0):
+                eliminated = self._eliminate_actions(model, v)
+                if eliminated > 0:
+                    remaining_rows = np.flatnonzero(self._remaining_actions.reshape(-1))
+                    p_remaining = stacked_p[remaining_rows]
+                    r_remaining = stacked_r[remaining_rows]
+                
+            self.eliminated_action_counts.append(eliminated)
+            
+            self._print_sweep(f'Finished value iteration step {iteration}; eliminated {eliminated} actions')
+            
+            yield self._snapshot(SolverStep.VALUE_ITERATION_SWEEP, iteration, delta, None, \
+                                 lambda: model.set_non_terminal_state_values(self._v, v[:n]))
+            
+            # Terminate the loop if the change was very small (ie. convergence is reached)
+            if delta < self._theta:
+                break
 
-                # Set the best action for the current state in the policy
-                self._pi.set_action(x, y, new_best_a)
\ No newline at end of file
+            if iteration >= self._max_optimal_value_function_iterations:
+                print('Maximum number of iterations exceeded')
+                break
+            
+        model.set_non_terminal_state_values(self._v, v[:n])
+            
+        return iteration
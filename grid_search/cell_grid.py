@@ -1,8 +1,53 @@
+import bisect
+import hashlib
+import math
+
+import numpy as np
+
 from .grid import Grid
 from .helpers import clamp
 
+# The offsets of the moves from a cell to its eight neighbours. The order is
+# the same as the driving directions of the low level actions.
+MOVE_DIRECTIONS = ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))
+
+# Lookup from the offset of a move to its index in MOVE_DIRECTIONS
+MOVE_DIRECTION_INDICES = {offset: direction for direction, offset in enumerate(MOVE_DIRECTIONS)}
+
+# Mix the coordinates of cells with a digest of their contents into a 64 bit
+# hash for each cell (using the splitmix64 finalizer). The arguments are arrays.
+def _cell_hashes(x, y, content_digests):
+    with np.errstate(over='ignore'):
+        h = x.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + \
+            y.astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F) + content_digests.astype(np.uint64)
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return h ^ (h >> np.uint64(31))
+
+# The same as _cell_hashes, for a single cell. This is used when cells are
+# edited one at a time, where it is much faster than building arrays.
+_MASK_64 = (1 << 64) - 1
+
+def _cell_hash(x, y, content_digest):
+    h = (x * 0x9E3779B97F4A7C15 + y * 0xC2B2AE3D27D4EB4F + content_digest) & _MASK_64
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return h ^ (h >> 31)
+
+# Return a 64 bit digest of the contents of a cell, which can be anything with
+# a stable repr
+def cell_content_digest(content):
+    return int.from_bytes(hashlib.blake2b(repr(content).encode('utf-8'), digest_size=8).digest(), 'little')
+
 # A cell grid consists of a set of cells ordered in a 2D array. The type of
 # cells depends on what's used
+#
+# The grid keeps a version counter, which goes up every time a cell is
+# changed, and a record of which cells were changed in each version. It also
+# keeps a hash of the contents of each cell. The content hash of the grid is
+# built from the sum of these, so it is updated in constant time when a cell
+# changes, and does not depend on the order the grid was built in. The
+# versions and hashes can also be found for rectangular regions of the grid.
 
 class Cell:
     def __init__(self, coords):
@@ -13,12 +58,132 @@ class Cell:
 
 class CellGrid(Grid):
 
-    def __init__(self, name, width, height):
+    def __init__(self, name, width, height, initial_cell_content = None):
         Grid.__init__(self, name, width, height)
+        
+        # Counter which is incremented every time the grid is changed. This
+        # is used to tell if anything built from the grid is out of date.
+        self._version = 0
+        
+        # The record of edits. Each entry is the version the edit created and
+        # the coordinates of the cell. Only the last edit of each cell is
+        # needed to find the cells edited since a version, so the record is
+        # compacted to that once it grows past twice the number of cells (see
+        # _compact_edits). Some changes (such as switching the traversability
+        # costs) affect every cell; the last version when that happened is
+        # stored separately.
+        self._edits = []
+        self._all_cells_modified_version = 0
+        
+        # The version when each cell was last changed
+        self._cell_versions = np.zeros((self._width, self._height), dtype=np.int64)
+        
+        # The hash of each cell, and their sum (modulo 2^64). All the cells
+        # start with the same contents.
+        x, y = np.meshgrid(np.arange(self._width), np.arange(self._height), indexing='ij')
+        initial_digests = np.full((self._width, self._height), cell_content_digest(initial_cell_content), dtype=np.uint64)
+        self._cell_hashes = _cell_hashes(x, y, initial_digests)
+        self._hash_sum = int(self._cell_hashes.sum(dtype=np.uint64))
+
+    # Return the current version of the grid
+    def version(self):
+        return self._version
+
+    # Return the version when any cell in the region x_min <= x < x_max,
+    # y_min <= y < y_max was last changed
+    def region_version(self, x_min, y_min, x_max, y_max):
+        if (x_max <= x_min) or (y_max <= y_min):
+            return self._all_cells_modified_version
+        return max(self._all_cells_modified_version, int(self._cell_versions[x_min:x_max, y_min:y_max].max()))
+
+    # Return the set of coordinates of the cells which have been edited since
+    # the specified version. If the edits since then affected the whole grid,
+    # None is returned.
+    def edited_cells_since(self, version):
+        if version < self._all_cells_modified_version:
+            return None
+        first_edit = bisect.bisect_right(self._edits, version, key=lambda edit: edit[0])
+        return {edit[1] for edit in self._edits[first_edit:]}
+
+    # Settings of the grid which affect every cell, and so are part of the
+    # content hashes. Subclasses override this.
+    def _content_settings(self):
+        return None
+
+    # Return a hash of the contents of the grid. Two grids with the same size,
+    # settings and cell contents have the same hash, whatever order they were
+    # built in.
+    def content_hash(self):
+        return self._content_hash(repr((self._width, self._height, self._content_settings(), self._hash_sum)))
+
+    # Return a hash of the contents of the region x_min <= x < x_max,
+    # y_min <= y < y_max
+    def region_content_hash(self, x_min, y_min, x_max, y_max):
+        region_sum = int(self._cell_hashes[x_min:x_max, y_min:y_max].sum(dtype=np.uint64))
+        return self._content_hash(repr((x_min, y_min, x_max, y_max, self._content_settings(), region_sum)))
+
+    def _content_hash(self, description):
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    # Called whenever the contents of a cell are changed. The content is
+    # anything with a stable repr which describes what is in the cell.
+    def _record_cell_change(self, x, y, content):
+        self._version += 1
+        self._cell_versions[x, y] = self._version
+        
+        # Changing the type and then the parameters of a cell is two changes
+        # in a row, which are merged into one entry
+        if (len(self._edits) > 0) and (self._edits[-1][1] == (x, y)):
+            self._edits[-1] = (self._version, (x, y))
+        else:
+            self._edits.append((self._version, (x, y)))
+            if len(self._edits) > 2 * self._width * self._height:
+                self._compact_edits()
+        
+        new_hash = _cell_hash(x, y, cell_content_digest(content))
+        self._hash_sum = (self._hash_sum - int(self._cell_hashes[x, y]) + new_hash) & _MASK_64
+        self._cell_hashes[x, y] = new_hash
+        
+    # Replace the record of edits with the last edit of each cell which has
+    # been edited, in order of version. A cell has been edited since a
+    # version if its last edit was after it, so this gives the same result
+    # for every version.
+    def _compact_edits(self):
+        x, y = np.nonzero(self._cell_versions)
+        versions = self._cell_versions[x, y]
+        order = np.argsort(versions, kind='stable')
+        self._edits = [(int(versions[i]), (int(x[i]), int(y[i]))) for i in order]
+
+    # Called when a change affects every cell
+    def _all_cells_modified(self):
+        self._version += 1
+        self._all_cells_modified_version = self._version
     
     def compute_transition_cost(self, last_coords, current_coords):
         raise NotImplementedError()        
 
+    # Return an array of size (8, width, height), where entry [d, x, y] is
+    # the cost of moving from (x, y) in the direction MOVE_DIRECTIONS[d].
+    # Moves off the grid cost infinity.
+    def move_costs(self):
+        raise NotImplementedError()
+
+    # Build the move costs from the factor each cell scales the cost of
+    # moving into it by. The basic cost is the Euclidean length of the move.
+    def _move_cost_lattice(self, multipliers):
+        costs = np.full((len(MOVE_DIRECTIONS), self._width, self._height), np.inf)
+        
+        for direction, (dX, dY) in enumerate(MOVE_DIRECTIONS):
+            sources_x = slice(max(0, -dX), self._width - max(0, dX))
+            sources_y = slice(max(0, -dY), self._height - max(0, dY))
+            targets_x = slice(max(0, dX), self._width - max(0, -dX))
+            targets_y = slice(max(0, dY), self._height - max(0, -dY))
+            costs[direction, sources_x, sources_y] = math.sqrt(dX * dX + dY * dY) * multipliers[targets_x, targets_y]
+            
+        costs.flags.writeable = False
+        
+        return costs
+
     # Get the status of a cell.
     def cell(self, x, y):
         raise NotImplementedError()
@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 from .cell_grid import CellGrid
 from .helpers import clamp
 from .search_grid import SearchGridCell
@@ -18,14 +20,21 @@ class OccupancyGrid(CellGrid):
     # in metres. By default, all the cells are set to "0" which means
     # that there are no obstacles.
     def __init__(self, name, width, height, resolution):
-        CellGrid.__init__(self, name, width, height)
+        CellGrid.__init__(self, name, width, height, 0)
         self._resolution = resolution
         self._data = [[0 for x in range(width)] for y in range(height)]
 
+        # The move costs do not depend on the cells, so they are only built once
+        self._move_costs = None
+
     # The resolution of each cell (the length of its side in metres)
     def resolution(self):
         return self._resolution
 
+    # The resolution scales the whole grid, so it is part of the content hash
+    def _content_settings(self):
+        return self._resolution
+
     # Get the status of a cell.
     def cell(self, x, y):
         return self._data[y][x]
@@ -33,11 +42,17 @@ class OccupancyGrid(CellGrid):
     # Set the status of a cell.
     def set_cell(self, x, y, c):
         self._data[y][x] = c
+        self._record_cell_change(x, y, c)
     
     def compute_transition_cost(self, last_coords, current_coords):
         dX = current_coords[0] - last_coords[0]
         dY = current_coords[1] - last_coords[1]
         return math.sqrt(dX * dX + dY * dY)
+
+    def move_costs(self):
+        if self._move_costs is None:
+            self._move_costs = self._move_cost_lattice(np.ones((self._width, self._height)))
+        return self._move_costs
     
     # Take a position in world coordinates (i.e., m) and turn it into
     # cell coordinates. Clamp the value so that it always falls within
@@ -3,6 +3,7 @@ import time
 from collections import deque
 from typing import List, Optional, Tuple
 
+from .cell_grid import MOVE_DIRECTION_INDICES
 from .occupancy_grid import OccupancyGrid
 from .planned_path import PlannedPath
 from .search_grid import SearchGrid, SearchGridCell, SearchGridCellLabel
@@ -34,6 +35,11 @@ class PlannerBase(object):
         self._environment_map = environment_map;
         self._search_grid = None
 
+        # The costs of the moves between neighbouring cells, as nested lists
+        # indexed by [direction][x][y]. These are fetched from the map at the
+        # start of each plan.
+        self._move_costs = None
+
         # All these variables are used for controlling the graphics output
         self._pause_time_in_seconds = 0.05
         self._path_pause_time_in_seconds = 0.05
@@ -86,7 +92,10 @@ class PlannerBase(object):
         if (parent_cell is None):
             return 0
        
-        L = self._environment_map.compute_transition_cost(parent_cell.coords(), cell.coords())
+        parent_coords = parent_cell.coords()
+        coords = cell.coords()
+        direction = MOVE_DIRECTION_INDICES[(coords[0] - parent_coords[0], coords[1] - parent_coords[1])]
+        L = self._move_costs[direction][parent_coords[0]][parent_coords[1]]
 
         return L
     
@@ -170,6 +179,9 @@ class PlannerBase(object):
         else:
             self._search_grid.set_from_environment_map(self._environment_map)
 
+        # Look up the move costs once, rather than working them out for each step
+        self._move_costs = self._environment_map.move_costs().tolist()
+
         # Get the start cell object and label it as such. Also set its
         # path cost to 0.
         self.start = self._search_grid.cell_from_coords(start_coords)
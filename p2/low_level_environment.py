@@ -10,8 +10,10 @@ import numpy as np
 from gymnasium import Env, spaces
 
 from common.airport_map import MapCellType
+from generalized_policy_iteration.state_index import StateIndex
 from generalized_policy_iteration.tabular_value_function import \
     TabularValueFunction
+from generalized_policy_iteration.transition_model import TransitionModel
 
 from .low_level_actions import LowLevelActionType
 from .low_level_policy import LowLevelPolicy
@@ -38,6 +40,16 @@ class LowLevelEnvironment(Env):
 
         # The action space
         self.action_space = spaces.Discrete(int(LowLevelActionType.NUMBER_OF_ACTIONS))
+        
+        # The numbering of the states and the compiled transition model; both
+        # are built on demand
+        self._state_index = None
+        self._transition_model = None
+
+        # The move costs of the map, and the same costs as nested lists which
+        # are quicker to index one at a time
+        self._move_costs = None
+        self._move_cost_lists = None
 
         # Set probability that the robot will go in the intended direction
         self.set_nominal_direction_probability(0.8)
@@ -51,6 +63,9 @@ class LowLevelEnvironment(Env):
     def set_nominal_direction_probability(self, nominal_direction_probability):
         self._p = nominal_direction_probability
         self._q = 0.5 * (1 - self._p)
+        
+        # The process model changed, so the compiled model is out of date
+        self._transition_model = None
 
     # Return the probability the robot will move i the correcc direction        
     def nominal_direction_probability(self):
@@ -75,18 +90,133 @@ class LowLevelEnvironment(Env):
         for x in range(v.width()):
             for y in range (v.height()):
                 cell = self._airport_map.cell(x, y)
-                if cell.is_obstruction():
-                    v.set_value(x, y, float('nan'))
-                elif cell.is_terminal():
+                if cell.is_terminal():
                     print(cell.params())
-                    v.set_value(x, y, cell.params())
+                v.set_value(x, y, self._initial_value(cell))
         
         return v
+
+    # The initial value of a cell. Obstructions have no value, terminals have
+    # their reward and all other cells start at zero.
+    def _initial_value(self, cell):
+        if cell.is_obstruction():
+            return float('nan')
+        elif cell.is_terminal():
+            return cell.params()
+        else:
+            return 0
+
+    # Make the value function and policy consistent with the map in the given
+    # cells after they have been edited. Cells which are now obstructions or
+    # terminals, or which were before, are set back to their initial values.
+    # The other cells keep their values, which are a good starting point.
+    def reset_edited_cells(self, v, pi, cells):
+        for x, y in cells:
+            cell = self._airport_map.cell(x, y)
+            if cell.is_obstruction() or cell.is_terminal() or \
+                (pi.action(x, y) in (LowLevelActionType.TERMINATE, LowLevelActionType.NONE)):
+                v.set_value(x, y, self._initial_value(cell))
+                pi.set_action(x, y, pi.initial_action(x, y))
         
     def initial_policy(self):
         pi = LowLevelPolicy("Policy", self._airport_map)
         return pi
     
+    # Return the parameters of the environment which affect the solution
+    def parameters(self):
+        return {'nominal_direction_probability': self._p}
+
+    # Return the numbering of the states, which is shared by the solvers and
+    # the transition model. It is rebuilt when the map changes.
+    def state_index(self):
+        if (self._state_index is None) or (self._state_index.map_version() != self._airport_map.version()):
+            self._state_index = StateIndex(self._airport_map)
+        return self._state_index
+
+    # Return the compiled transition model which is shared by all the solvers
+    # using this environment. It is only recompiled if the map or the
+    # nominal direction probability have changed since it was last built. If
+    # only a few cells of the map were edited, the model is updated around them.
+    def transition_model(self):
+        if self._transition_model is None:
+            self._transition_model = TransitionModel(self)
+        elif self._transition_model.map_version() != self._airport_map.version():
+            edited_cells = self._airport_map.edited_cells_since(self._transition_model.map_version())
+            if edited_cells is None:
+                self._transition_model = TransitionModel(self)
+            else:
+                self._transition_model = TransitionModel(self, previous_model = self._transition_model, \
+                                                         edited_cells = edited_cells)
+        return self._transition_model
+    
+    # Return a transition model for each of the nominal direction probabilities.
+    # The robot goes in the nominal direction with probability p and to either
+    # side with probability (1 - p) / 2, so the transition probabilities and
+    # expected rewards are linear in p. Therefore only the models for p = 0 and
+    # p = 1 are compiled, and the others are interpolated between them.
+    def transition_models(self, nominal_direction_probabilities):
+        original_probability = self._p
+        cached_model = self._transition_model
+        
+        try:
+            self.set_nominal_direction_probability(1)
+            certain_model = TransitionModel(self)
+            self.set_nominal_direction_probability(0)
+            uncertain_model = TransitionModel(self)
+        finally:
+            self.set_nominal_direction_probability(original_probability)
+            self._transition_model = cached_model
+        
+        return [certain_model.interpolate(uncertain_model, p) for p in nominal_direction_probabilities]
+    
+    # Return an environment with the same process model on a coarsened
+    # version of the map
+    def coarsened(self, factor):
+        environment = LowLevelEnvironment(self._airport_map.coarsened(factor))
+        environment.set_nominal_direction_probability(self._p)
+        return environment
+    
+    # If the robot always goes in the nominal direction, return the outcomes of
+    # the driving actions for all the cells at once (see
+    # EnvironmentBase.deterministic_transitions). These are the same as the
+    # ones from next_state_and_reward_distribution.
+    def deterministic_transitions(self, actions):
+        if self._p != 1:
+            return None
+        
+        width = self._airport_map.width()
+        height = self._airport_map.height()
+        
+        x, y = np.meshgrid(np.arange(width), np.arange(height), indexing='ij')
+        
+        move_costs = self._airport_map.move_costs()
+        obstructions = self._airport_map.obstruction_mask()
+        baggage_claims = self._airport_map.cell_types() == MapCellType.BAGGAGE_CLAIM.value
+        
+        next_x = np.empty((len(actions), width, height), dtype=np.intp)
+        next_y = np.empty((len(actions), width, height), dtype=np.intp)
+        rewards = np.empty((len(actions), width, height))
+        
+        for a_idx, a in enumerate(actions):
+            delta = self._driving_deltas[a]
+            new_x = x + delta[0]
+            new_y = y + delta[1]
+            
+            # Moves off the edge of the map or into obstructions leave the robot
+            # where it is; the clipped coordinates are only used for the lookup
+            on_map = (new_x >= 0) & (new_x < width) & (new_y >= 0) & (new_y < height)
+            clipped_x = np.clip(new_x, 0, width - 1)
+            clipped_y = np.clip(new_y, 0, height - 1)
+            blocked = on_map & obstructions[clipped_x, clipped_y]
+            moved = on_map & ~blocked
+            
+            next_x[a_idx] = np.where(moved, new_x, x)
+            next_y[a_idx] = np.where(moved, new_y, y)
+            rewards[a_idx] = np.where(moved, -move_costs[a], -1)
+            rewards[a_idx][blocked & baggage_claims[clipped_x, clipped_y]] = -10
+        
+        return next_x, next_y, rewards
+    
     # The available actions - same everywhere
     def available_actions(self):
         return self.action_space
@@ -97,6 +227,12 @@ class LowLevelEnvironment(Env):
         # Get the current cell
         current_cell = self._airport_map.cell(s[0], s[1])
         
+        # The map only builds new move costs when they change
+        move_costs = self._airport_map.move_costs()
+        if move_costs is not self._move_costs:
+            self._move_costs = move_costs
+            self._move_cost_lists = move_costs.tolist()
+        
         # Return values
         s_prime = []
         r = []
@@ -184,7 +320,7 @@ class LowLevelEnvironment(Env):
                 else:
                     # The cost is the cost
                     s_prime.append(new_cell)
-                    r.append(-self._airport_map.compute_transition_cost(current_cell.coords(), new_cell.coords()))
+                    r.append(-self._move_cost_lists[idx][s[0]][s[1]])
                     #print(new_cell.coords())
                     if print_cell:
                         print(f'{current_cell.coords()}->{(new_x,new_y)}->A{new_cell.coords()}')
@@ -9,30 +9,41 @@ from generalized_policy_iteration.tabular_policy import TabularPolicy
 from .low_level_actions import LowLevelActionType
 
 # The driving policy. For each cell in the state space, in which direction do we go next?
+# The actions are stored as their integer values, and are turned back into
+# LowLevelActionType when they are read one at a time.
+
+# Lookup from the integer value of an action to the action type
+_action_types = tuple(sorted(LowLevelActionType, key=int))
 
 class LowLevelPolicy(TabularPolicy):
 
     def __init__(self, name, airport_map):
         TabularPolicy.__init__(self, name, airport_map)
         
-        # When we set up the policy, we MUST put a TERMINATE action in the cells which
-        # are terminals. If the cell is in a wall, the action is flagged to NONE. For
-        # all other cells, the initial strategy is to move right.
-        
-        type_creator = lambda x, y: LowLevelActionType.TERMINATE if airport_map.cell(x, y).is_terminal() \
-                                    else LowLevelActionType.NONE if airport_map.cell(x, y).is_obstruction() \
-                                    else LowLevelActionType.RIGHT
-        
-        self._policy = [[type_creator(x,y) for y in range(self._height)] \
-                            for x in range(self._width)]
-        
         self._airport_map = airport_map
+        
+        # Set up the initial actions for all the cells at once (see initial_action)
+        self._actions[:] = LowLevelActionType.RIGHT
+        self._actions[airport_map.obstruction_mask()] = LowLevelActionType.NONE
+        self._actions[airport_map.terminal_mask()] = LowLevelActionType.TERMINATE
+
+    # When we set up the policy, we MUST put a TERMINATE action in the cells which
+    # are terminals. If the cell is in a wall, the action is flagged to NONE. For
+    # all other cells, the initial strategy is to move right.
+    def initial_action(self, x, y):
+        cell = self._airport_map.cell(x, y)
+        if cell.is_terminal():
+            return LowLevelActionType.TERMINATE
+        elif cell.is_obstruction():
+            return LowLevelActionType.NONE
+        else:
+            return LowLevelActionType.RIGHT
 
     def set_action(self, x, y, action):
-        self._policy[x][y] = LowLevelActionType(action)
+        self._actions[x, y] = action
         
     def action(self, x, y):
-        return self._policy[x][y]
+        return _action_types[self._actions[x, y]]
     
     def airport_map(self):
         return self._airport_map
@@ -42,11 +53,4 @@ class LowLevelPolicy(TabularPolicy):
         # Print out the policy as a string. Note we have to reverse y because
         # y=0 is at the origin and so we need to print top-to-bottom
         for y in reversed(range(self._height)):
-            line_string = str(int(self._policy[0][y]))
-            for x in range(1,self._width):
-                line_string += str(" ") + str(int(self._policy[x][y]))
-            print(line_string)
-        
-        
-        
-    
\ No newline at end of file
+            print(' '.join(str(action) for action in self._actions[:, y].tolist()))
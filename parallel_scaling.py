@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+# Time the parallel value iterator on a large open map with 1, 2, 4, ...
+# worker processes, up to the number of CPUs by default. The speed up can
+# only be measured on a machine with at least that many CPUs; with more
+# processes than CPUs, the processes take turns. Each run uses one tile per
+# process. The peak memory of the largest worker is also printed, which
+# should stay about the same as the number of processes grows, because the
+# workers share the model rather than copying it.
+#
+# Usage: python3 parallel_scaling.py [map size] [maximum number of processes]
+
+import os
+import resource
+import sys
+import time
+
+from common.airport_map import AirportMap
+from generalized_policy_iteration.parallel_value_iterator import ParallelValueIterator
+from p2.low_level_environment import LowLevelEnvironment
+
+if __name__ == '__main__':
+
+    # Parameters
+    map_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    max_number_of_processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    # An open floor with one end station near a corner
+    airport_map = AirportMap('Open floor', map_size, map_size)
+    airport_map.add_robot_end_station(10, 10, 10)
+
+    airport_environment = LowLevelEnvironment(airport_map)
+    airport_environment.set_nominal_direction_probability(0.8)
+
+    number_of_processes = 1
+    serial_time = None
+
+    while number_of_processes <= max_number_of_processes:
+
+        # Compile the model first so only the sweeps are timed. The
+        # environment caches it, so this is only slow the first time.
+        airport_environment.transition_model()
+
+        solver = ParallelValueIterator(airport_environment)
+        solver.set_number_of_processes(number_of_processes)
+        solver.initialize()
+
+        start_time = time.time()
+        _, _, number_of_sweeps, _ = solver.solve_policy(bypass_cache = True)
+        computation_time = time.time() - start_time
+
+        if serial_time is None:
+            serial_time = computation_time
+
+        worker_memory = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+        print(f'Processes: {number_of_processes}, sweeps: {number_of_sweeps}, ' \
+              f'time (seconds): {computation_time:.2f}, speed up: {serial_time / computation_time:.2f}, ' \
+              f'peak worker memory (MB): {worker_memory:.0f}')
+
+        number_of_processes *= 2
@@ -42,7 +42,7 @@ if __name__ == '__main__':
     policy_solver.set_value_function_drawer(value_function_drawer)
         
     # Compute the solution
-    v, pi, _ = policy_solver.solve_policy()
+    v, pi, _, _ = policy_solver.solve_policy()
     
     # Save screen shot; this is in the current directory
     policy_drawer.save_screenshot("policy_iterator_policy_08.pdf")
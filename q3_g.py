@@ -101,7 +101,7 @@ if __name__ == '__main__':
         
     # Compute the solution
     start_time = time.time()
-    value_v, value_pi, value_iteration_step = policy_solver.solve_policy()
+    value_v, value_pi, value_iteration_step, _ = policy_solver.solve_policy()
     end_time = time.time()
 
     value_computation_time = end_time - start_time
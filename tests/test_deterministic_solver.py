@@ -0,0 +1,93 @@
+# Tests that the shortest path solver for deterministic transitions gives the
+# same solution as value iteration. The values of obstructions are nan, so
+# they are left out of the comparisons.
+
+import numpy as np
+import pytest
+
+from common.scenarios import full_scenario
+from generalized_policy_iteration.value_iterator import ValueIterator
+from p2.low_level_environment import LowLevelEnvironment
+
+
+def solve(airport_map, gamma, use_deterministic_solver):
+    environment = LowLevelEnvironment(airport_map)
+    environment.set_nominal_direction_probability(1)
+    solver = ValueIterator(environment)
+    solver.set_use_vectorized_sweeps(True)
+    solver.set_use_deterministic_solver(use_deterministic_solver)
+    solver.set_gamma(gamma)
+    solver.initialize()
+    solver.solve_policy()
+    return solver
+
+
+# Wall in the first open cell whose eight neighbours are also open, by turning
+# the neighbours into walls, and return its coordinates
+def wall_in_a_cell(airport_map):
+    terminals = airport_map.terminal_mask()
+
+    def is_open(x, y):
+        return (0 <= x < airport_map.width()) and (0 <= y < airport_map.height()) and \
+            (airport_map.is_obstruction(x, y) is False) and (terminals[x, y] == False)
+
+    for x in range(airport_map.width()):
+        for y in range(airport_map.height()):
+            if all(is_open(x + dx, y + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        if (dx, dy) != (0, 0):
+                            airport_map.set_wall(x + dx, y + dy)
+                return x, y
+
+    pytest.fail('The map has no open cell with open neighbours')
+
+
+@pytest.mark.parametrize('gamma', [1, 0.9])
+@pytest.mark.parametrize('use_traversability_costs', [False, True])
+def test_deterministic_solver_matches_value_iteration(gamma, use_traversability_costs):
+    airport_map, _ = full_scenario()
+    airport_map.set_use_cell_type_traversability_costs(use_traversability_costs)
+
+    deterministic_solver = solve(airport_map, gamma, True)
+    value_iterator = solve(airport_map, gamma, False)
+
+    deterministic_values = deterministic_solver.value_function().values()
+    iterated_values = value_iterator.value_function().values()
+
+    assert not np.any(np.isinf(deterministic_values))
+    assert np.array_equal(np.isnan(deterministic_values), np.isnan(iterated_values))
+    assert np.nanmax(np.abs(deterministic_values - iterated_values)) < 1e-4
+    assert np.array_equal(deterministic_solver.policy().actions(), value_iterator.policy().actions())
+
+
+# At gamma = 1 a cell which cannot reach a terminal has a value of -inf. The
+# rest of the map must still match value iteration, which never converges in
+# that cell, so it is left out of the comparison.
+@pytest.mark.parametrize('use_traversability_costs', [False, True])
+def test_walled_in_cell_has_a_value_of_minus_infinity(use_traversability_costs):
+    airport_map, _ = full_scenario()
+    airport_map.set_use_cell_type_traversability_costs(use_traversability_costs)
+    x, y = wall_in_a_cell(airport_map)
+
+    deterministic_values = solve(airport_map, 1, True).value_function().values().copy()
+    iterated_values = solve(airport_map, 1, False).value_function().values().copy()
+
+    assert deterministic_values[x, y] == -np.inf
+
+    deterministic_values[x, y] = np.nan
+    iterated_values[x, y] = np.nan
+    assert np.nanmax(np.abs(deterministic_values - iterated_values)) < 1e-4
+
+
+# If gamma < 1, the walled in cell has the finite value of staying where it
+# is forever, and value iteration converges to it as well
+def test_walled_in_cell_matches_value_iteration_with_discounting():
+    airport_map, _ = full_scenario()
+    x, y = wall_in_a_cell(airport_map)
+
+    deterministic_values = solve(airport_map, 0.9, True).value_function().values()
+    iterated_values = solve(airport_map, 0.9, False).value_function().values()
+
+    assert np.isfinite(deterministic_values[x, y])
+    assert np.nanmax(np.abs(deterministic_values - iterated_values)) < 1e-4
@@ -0,0 +1,81 @@
+# Tests for the versions and content hashes of the airport map.
+
+from common.airport_map import AirportMap
+
+
+def open_map():
+    return AirportMap('Open floor', 8, 6)
+
+
+def test_version_goes_up_when_a_cell_is_edited():
+    airport_map = open_map()
+    version = airport_map.version()
+
+    airport_map.set_wall(3, 2)
+
+    assert airport_map.version() > version
+    assert airport_map.edited_cells_since(version) == {(3, 2)}
+    assert airport_map.edited_cells_since(airport_map.version()) == set()
+
+
+def test_region_version_only_changes_for_regions_with_the_edit():
+    airport_map = open_map()
+    airport_map.set_wall(3, 2)
+
+    assert airport_map.region_version(0, 0, 8, 6) == airport_map.version()
+    assert airport_map.region_version(3, 2, 4, 3) == airport_map.version()
+    assert airport_map.region_version(4, 0, 8, 6) == 0
+    assert airport_map.region_version(0, 3, 8, 6) == 0
+
+
+def test_content_hash_does_not_depend_on_build_order():
+    first_map = open_map()
+    first_map.set_wall(1, 1)
+    first_map.add_robot_end_station(6, 4, 10)
+    first_map.set_customs_area(2, 5)
+
+    second_map = open_map()
+    second_map.set_customs_area(2, 5)
+    second_map.set_wall(6, 4)
+    second_map.add_robot_end_station(6, 4, 10)
+    second_map.set_wall(1, 1)
+
+    assert first_map.content_hash() == second_map.content_hash()
+    assert first_map.region_content_hash(0, 0, 4, 6) == second_map.region_content_hash(0, 0, 4, 6)
+
+
+def test_content_hash_changes_with_the_cells_and_settings():
+    airport_map = open_map()
+    airport_map.set_wall(1, 1)
+    original_hash = airport_map.content_hash()
+
+    other_map = open_map()
+    other_map.set_wall(1, 2)
+    assert other_map.content_hash() != original_hash
+
+    # The parameters of a cell are part of its contents
+    other_map = open_map()
+    other_map.set_wall(1, 1)
+    other_map.add_robot_end_station(6, 4, 10)
+    station_hash = other_map.content_hash()
+    other_map.add_robot_end_station(6, 4, 20)
+    assert other_map.content_hash() != station_hash
+
+    airport_map.set_use_cell_type_traversability_costs(True)
+    assert airport_map.content_hash() != original_hash
+
+
+# The record of edits only keeps what is needed to find the cells edited since
+# any version, so it does not grow without bound
+def test_edit_record_stays_bounded():
+    airport_map = open_map()
+    versions = []
+
+    for i in range(500):
+        versions.append(airport_map.version())
+        airport_map.add_robot_end_station(i % 8, (i // 8) % 6, i)
+
+    assert len(airport_map._edits) <= 2 * 8 * 6
+    assert airport_map.edited_cells_since(versions[-1]) == {(499 % 8, (499 // 8) % 6)}
+    assert airport_map.edited_cells_since(versions[-3]) == {(i % 8, (i // 8) % 6) for i in range(497, 500)}
+    assert len(airport_map.edited_cells_since(versions[0])) == 8 * 6
@@ -0,0 +1,60 @@
+# Tests that policy iteration converges when the policy is evaluated exactly.
+# Exact evaluation gives values which differ only by rounding error for some
+# actions, so the improvement step must not keep swapping between them.
+
+import numpy as np
+import pytest
+
+from common.scenarios import full_scenario
+from generalized_policy_iteration.policy_iterator import PolicyEvaluationMethod, PolicyIterator
+from generalized_policy_iteration.value_iterator import ValueIterator
+from p2.low_level_environment import LowLevelEnvironment
+
+GAMMA = 0.9
+
+MAX_POLICY_ITERATION_STEPS = 100
+
+
+@pytest.fixture(scope='module')
+def environment():
+    airport_map, _ = full_scenario()
+    environment = LowLevelEnvironment(airport_map)
+    environment.set_nominal_direction_probability(0.8)
+    return environment
+
+
+@pytest.fixture(scope='module')
+def optimal_values(environment):
+    solver = ValueIterator(environment)
+    solver.set_gamma(GAMMA)
+    solver.set_theta(1e-10)
+    solver.set_use_vectorized_sweeps(True)
+    solver.initialize()
+    v, _, _, _ = solver.solve_policy()
+    return v.values().copy()
+
+
+@pytest.mark.parametrize('use_vectorized_sweeps', [False, True])
+@pytest.mark.parametrize('policy_evaluation_method', [PolicyEvaluationMethod.DIRECT, PolicyEvaluationMethod.GMRES, \
+                                                      PolicyEvaluationMethod.BICGSTAB])
+def test_exact_policy_evaluation_converges(environment, optimal_values, policy_evaluation_method, \
+                                           use_vectorized_sweeps):
+    solver = PolicyIterator(environment)
+    solver.set_gamma(GAMMA)
+    solver.set_policy_evaluation_method(policy_evaluation_method)
+    solver.set_use_vectorized_sweeps(use_vectorized_sweeps)
+    solver.set_max_policy_iteration_steps(MAX_POLICY_ITERATION_STEPS)
+    solver.initialize()
+
+    v, _, policy_iteration_steps, _ = solver.solve_policy()
+
+    assert policy_iteration_steps < MAX_POLICY_ITERATION_STEPS
+    assert solver.policy_evaluation_method() is policy_evaluation_method
+
+    # Every evaluation was solved exactly, rather than falling back to sweeps
+    assert not any(solver.linear_solve_fallbacks)
+    assert max(solver.policy_evaluation_residuals) <= solver.theta()
+
+    # The policy is within theta of greedy, so its values are within
+    # theta / (1 - gamma) of the optimal ones
+    assert np.nanmax(np.abs(v.values() - optimal_values)) < 1e-4
@@ -0,0 +1,64 @@
+# Tests for repairing a solution after the map has been edited.
+
+import numpy as np
+import pytest
+
+from common.scenarios import full_scenario
+from generalized_policy_iteration.value_iterator import ValueIterator
+from p2.low_level_environment import LowLevelEnvironment
+
+
+def solved_value_iterator(airport_map):
+    environment = LowLevelEnvironment(airport_map)
+    environment.set_nominal_direction_probability(0.8)
+    solver = ValueIterator(environment)
+    solver.set_use_vectorized_sweeps(True)
+    solver.initialize()
+    solver.solve_policy()
+    return solver
+
+
+# Return an open cell whose eight neighbours are also open
+def open_cell_with_open_neighbours(airport_map):
+    terminals = airport_map.terminal_mask()
+
+    def is_open(x, y):
+        return (0 <= x < airport_map.width()) and (0 <= y < airport_map.height()) and \
+            (airport_map.is_obstruction(x, y) is False) and (terminals[x, y] == False)
+
+    for x in range(airport_map.width()):
+        for y in range(airport_map.height()):
+            if all(is_open(x + dx, y + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+                return x, y
+
+    pytest.fail('The map has no open cell with open neighbours')
+
+
+# At gamma = 1 the value of a cell which is walled in falls without bound.
+# The repair must still stop, and the rest of the map must match a fresh solve.
+def test_repair_stops_when_a_cell_is_walled_in():
+    airport_map, _ = full_scenario()
+    solver = solved_value_iterator(airport_map)
+
+    x, y = open_cell_with_open_neighbours(airport_map)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            if (dx, dy) != (0, 0):
+                airport_map.set_wall(x + dx, y + dy)
+
+    v, _, _ = solver.resolve_after_map_edits()
+
+    assert v.value(x, y) == -np.inf
+
+    fresh_map, _ = full_scenario()
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            if (dx, dy) != (0, 0):
+                fresh_map.set_wall(x + dx, y + dy)
+    fresh_values = solved_value_iterator(fresh_map).value_function().values()
+
+    values = v.values().copy()
+    values[x, y] = np.nan
+    fresh_values = fresh_values.copy()
+    fresh_values[x, y] = np.nan
+    assert np.nanmax(np.abs(values - fresh_values)) < 1e-4